@@ -130,18 +130,25 @@ def overview(
     Returns (payload, filename, media_type).
     """
     _validate(backend, fmt)
-    df = services.load_df(username, name)
+    df = services.load_lf(username, name)
     aliases = aliases or services.DEFAULT_OVERVIEW_ALIASES
+    meta = {
+        "restart_headers": pl_h2.get_restart_headers(df),
+        "os_details": pl_h2.get_os_details_from_df(df).strip(),
+    }
 
     figures: list[tuple[str, object]] = []
     for alias in aliases:
         header, resolved_alias = services.resolve_header(df, alias)
-        for frame in services.prepare_header_frames(df, header):
-            table = services.filter_time_range(frame["df"], start, end)
-            meta = {
-                "restart_headers": pl_h2.get_restart_headers(df),
-                "os_details": pl_h2.get_os_details_from_df(df).strip(),
-            }
+        first, last = services.time_bounds(df, header, start, end)
+        for frame in services.prepare_header_frames(
+            df,
+            header,
+            file_name=services.sar_path(username, name),
+            start=first,
+            end=last,
+        ):
+            table = services.require_rows(frame["df"], start, end)
             chart_title = " ".join(
                 x for x in (resolved_alias, str(frame["sub_title"] or "")) if x
             )
@@ -204,13 +211,15 @@ def multi_file_chart(
     reboot_headers = []
     main_alias = None
     for name in names:
-        df = services.load_df(username, name)
+        df = services.load_lf(username, name)
         header, alias = services.resolve_header(df, header_name)
         main_alias = main_alias or alias
         reboot_headers.append(
             [pl_h2.get_restart_headers(df), pl_h2.get_os_details_from_df(df)]
         )
-        frames = services.prepare_header_frames(df, header, device)
+        frames = services.prepare_header_frames(
+            df, header, device, services.sar_path(username, name)
+        )
         table = frames[0]["df"]
         if metric not in table.columns:
             raise ServiceError(
@@ -0,0 +1,268 @@
+"""Background ingest jobs for POST /files?background=true.
+
+An upload is spooled to the user directory, recorded as a job in SQLite
+(upload/config/jobs.db) and parsed by the upload pool of services; the
+request returns the job ids right away and GET /jobs/{id} reports the
+progress. Workers write their progress and result straight into the
+database, so the state is shared between the API and the pool processes
+and survives an API restart: on startup, jobs that were queued or running
+are handed to the pool again as long as their spooled upload still exists.
+"""
+
+import contextlib
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+from . import bootstrap  # noqa: F401
+from . import services
+from .services import ServiceError
+
+from handle_user_status import get_config_dir
+
+logger = logging.getLogger("sar_api")
+
+# finished jobs are dropped from the table after this many days
+JOB_RETENTION_DAYS = 7
+# minimum seconds between two progress writes of one job
+PROGRESS_INTERVAL = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    spool_path TEXT NOT NULL,
+    state TEXT NOT NULL,
+    bytes_total INTEGER NOT NULL,
+    bytes_parsed INTEGER NOT NULL DEFAULT 0,
+    sections INTEGER NOT NULL DEFAULT 0,
+    digest TEXT,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+def _db_path() -> str:
+    return str(Path(get_config_dir()) / "jobs.db")
+
+
+@contextlib.contextmanager
+def _connect():
+    """One transaction on the job database; commits, then closes."""
+    conn = sqlite3.connect(_db_path(), timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        # readers (GET /jobs) must not block the workers' progress writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(_SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "digest" not in columns:  # databases created before dedup_store
+            conn.execute("ALTER TABLE jobs ADD COLUMN digest TEXT")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _update(job_id: int, **fields) -> None:
+    fields["updated"] = time.time()
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as conn:
+        conn.execute(
+            f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id)
+        )
+
+
+def _as_dict(row: sqlite3.Row) -> dict:
+    job = {
+        "id": row["id"],
+        "file": row["filename"],
+        "state": row["state"],
+        "bytes_total": row["bytes_total"],
+        "bytes_parsed": row["bytes_parsed"],
+        "sections": row["sections"],
+        "created": row["created"],
+        "updated": row["updated"],
+    }
+    if row["result"] is not None:
+        job["result"] = json.loads(row["result"])
+        job["headers"] = job["result"]["headers"]
+    if row["error"] is not None:
+        job["error"] = row["error"]
+    return job
+
+
+def submit(
+    username: str, temp_path: Path, filename: str, digest: str | None = None
+) -> dict:
+    """Record a spooled upload as a queued job and hand it to the pool.
+
+    The spooled file is renamed to a per-job name, so two jobs for files of
+    the same name do not share it.
+    """
+    now = time.time()
+    with _connect() as conn:
+        job_id = conn.execute(
+            "INSERT INTO jobs (username, filename, spool_path, state, bytes_total,"
+            " digest, created, updated) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (
+                username,
+                filename,
+                str(temp_path),
+                temp_path.stat().st_size,
+                digest,
+                now,
+                now,
+            ),
+        ).lastrowid
+    spool_path = temp_path.with_name(f".tmp_job{job_id}_{filename}")
+    temp_path.rename(spool_path)
+    _update(job_id, spool_path=str(spool_path))
+    _dispatch(job_id)
+    return get(username, job_id)
+
+
+def pending_spools() -> set[Path]:
+    """Spooled uploads of queued or running jobs (kept by the cleanup)."""
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT spool_path FROM jobs WHERE state IN ('queued', 'running')"
+        ).fetchall()
+    return {Path(row["spool_path"]).resolve() for row in rows}
+
+
+def get(username: str, job_id: int) -> dict:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE id = ? AND username = ?", (job_id, username)
+        ).fetchone()
+    if row is None:
+        raise ServiceError(f"Job {job_id} not found")
+    return _as_dict(row)
+
+
+def list_jobs(username: str) -> list[dict]:
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT * FROM jobs WHERE username = ? ORDER BY id DESC", (username,)
+        ).fetchall()
+    return [_as_dict(row) for row in rows]
+
+
+def _dispatch(job_id: int) -> None:
+    pool = services.upload_pool()
+    future = pool.submit(run_job, job_id)
+    future.add_done_callback(lambda done: _on_worker_exit(job_id, pool, done))
+
+
+def _on_worker_exit(job_id: int, pool, future: Future) -> None:
+    # run_job records its own failures; an exception here means a worker
+    # process died (BrokenProcessPool), which fails every job of the pool.
+    # Cancelled jobs (app shutdown) stay queued for resume().
+    if future.cancelled():
+        return
+    if future.exception() is None:
+        _warm_result(job_id)
+        return
+    services.reset_upload_pool(pool)
+    with _connect() as conn:
+        state, spool_path = conn.execute(
+            "SELECT state, spool_path FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    if state == "queued":
+        # never started: not the one that took the worker down
+        _dispatch(job_id)
+        return
+    logger.error("ingest job %s: worker died: %s", job_id, future.exception())
+    _update(job_id, state="failed", error="ingest worker died while parsing the file")
+    Path(spool_path).unlink(missing_ok=True)
+
+
+def _warm_result(job_id: int) -> None:
+    with _connect() as conn:
+        row = conn.execute(
+            "SELECT username, state, result FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    if row is not None and row["state"] == "done":
+        services.warm_upload(row["username"], json.loads(row["result"])["name"])
+
+
+def run_job(job_id: int) -> None:
+    """Pool worker: parse one queued job and record its outcome."""
+    with _connect() as conn:
+        claimed = conn.execute(
+            "UPDATE jobs SET state = 'running', updated = ? "
+            "WHERE id = ? AND state = 'queued'",
+            (time.time(), job_id),
+        ).rowcount
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if not claimed:
+        return
+
+    last_write = 0.0
+
+    def progress(bytes_parsed: int, sections: int) -> None:
+        nonlocal last_write
+        now = time.monotonic()
+        if now - last_write >= PROGRESS_INTERVAL:
+            last_write = now
+            # a sar -A conversion parses more bytes than were uploaded
+            bytes_parsed = min(bytes_parsed, row["bytes_total"])
+            _update(job_id, bytes_parsed=bytes_parsed, sections=sections)
+
+    try:
+        summary = services.ingest_sar_upload(
+            row["username"],
+            Path(row["spool_path"]),
+            row["filename"],
+            progress,
+            row["digest"],
+        )
+    except ServiceError as exc:
+        _update(job_id, state="failed", error=str(exc))
+    except Exception as exc:
+        logger.exception("ingest job %s failed", job_id)
+        _update(job_id, state="failed", error=f"internal error: {exc}")
+    else:
+        _update(
+            job_id,
+            state="done",
+            bytes_parsed=row["bytes_total"],
+            sections=summary["headers"],
+            result=json.dumps(summary),
+        )
+
+
+def resume() -> None:
+    """Startup: requeue the jobs of the previous API process, drop old ones.
+
+    A job still marked running lost its worker with that process; it starts
+    over from its spooled upload. Jobs whose upload is gone are failed.
+    """
+    cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+    with _connect() as conn:
+        conn.execute(
+            "DELETE FROM jobs WHERE state IN ('done', 'failed') AND updated < ?",
+            (cutoff,),
+        )
+        conn.execute(
+            "UPDATE jobs SET state = 'queued', bytes_parsed = 0, sections = 0 "
+            "WHERE state = 'running'"
+        )
+        pending = conn.execute(
+            "SELECT id, spool_path FROM jobs WHERE state = 'queued' ORDER BY id"
+        ).fetchall()
+    for job_id, spool_path in pending:
+        if Path(spool_path).exists():
+            _dispatch(job_id)
+        else:
+            _update(job_id, state="failed", error="spooled upload lost on restart")
+    if pending:
+        logger.info("resumed %d ingest job(s)", len(pending))
@@ -4,20 +4,28 @@ Run from the repo root:
     uvicorn api.main:app --host 0.0.0.0 --port 8100
 """
 
+import asyncio
+import functools
 import hmac
 import io
 import logging
 import os
 import secrets
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import quote, urlencode
 
-from fastapi import Depends, FastAPI, Header, HTTPException, UploadFile
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, UploadFile
 from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field
 
 from . import bootstrap  # noqa: F401
-from . import auth, charts, services
+from . import auth, charts, jobs, services
 from .services import ServiceError
+from config import Config
+import derived_cache
+import frame_cache
+import redis_cache
+import warmup
 
 logging.basicConfig(level=logging.INFO)
 
@@ -51,6 +59,20 @@ PREFIX = "/api/v1"
 @app.on_event("startup")
 def _on_startup() -> None:
     _refresh_table_cache()
+    jobs.resume()
+    warmup.schedule_recent()
+
+
+@app.on_event("shutdown")
+def _on_shutdown() -> None:
+    services.reset_upload_pool()
+
+
+@app.middleware("http")
+async def _hold_back_warmup(request, call_next):
+    # the cache warm-up only runs while no request is being served
+    with warmup.interactive():
+        return await call_next(request)
 
 
 @app.exception_handler(ServiceError)
@@ -214,6 +236,38 @@ def admin_disk_usage(username: str = Depends(auth.get_current_user)):
     return services.disk_usage_report()
 
 
+@app.get(f"{PREFIX}/admin/frame-cache")
+def admin_frame_cache(username: str = Depends(auth.get_current_user)):
+    """Entries, size, budget and hit/miss/eviction counters of the
+    in-process frame cache of this API process."""
+    auth.require_admin(username)
+    return frame_cache.stats()
+
+
+@app.get(f"{PREFIX}/admin/derived-cache")
+def admin_derived_cache(username: str = Depends(auth.get_current_user)):
+    """Entries, size and counters of the in-process cache of prepared chart
+    frames (derived_cache); disk hits are entries other processes wrote."""
+    auth.require_admin(username)
+    return derived_cache.stats()
+
+
+@app.get(f"{PREFIX}/admin/warmup")
+def admin_warmup(username: str = Depends(auth.get_current_user)):
+    """Queue, counters and time split (working, throttled, yielded to
+    requests) of the background cache warm-up of this process."""
+    auth.require_admin(username)
+    return warmup.stats()
+
+
+@app.get(f"{PREFIX}/admin/redis-cache")
+def admin_redis_cache(username: str = Depends(auth.get_current_user)):
+    """Bytes per user and file, budgets, idle TTL and the hit/miss/eviction
+    counters of the Redis frame cache (all processes)."""
+    auth.require_admin(username)
+    return redis_cache.stats()
+
+
 @app.post(f"{PREFIX}/admin/cleanup")
 def admin_cleanup(
     request: CleanupRequest, username: str = Depends(auth.get_current_user)
@@ -237,18 +291,116 @@ def list_files(username: str = Depends(auth.get_current_user)):
 @app.post(f"{PREFIX}/files", status_code=201)
 async def upload_files(
     files: list[UploadFile],
+    background: bool = False,
     username: str = Depends(auth.get_current_user),
 ):
-    results, errors = [], []
+    """Upload and parse SAR files.
+
+    With background=true every file is only spooled and queued as an ingest
+    job; the response (202) lists the job ids to poll via GET /jobs/{id}.
+    """
+    if background:
+        return await _queue_uploads(files, username)
+    # at most UPLOAD_CONCURRENCY files of this request in flight; the shared
+    # pool bounds the parsing across requests
+    limit = asyncio.Semaphore(max(Config.upload_concurrency, 1))
+    outcomes = await asyncio.gather(
+        *(_ingest_upload(upload, username, limit) for upload in files)
+    )
+    results = [outcome for ok, outcome in outcomes if ok]
+    errors = [outcome for ok, outcome in outcomes if not ok]
+    if not results and errors:
+        return JSONResponse(status_code=400, content={"uploaded": [], "errors": errors})
+    return {"uploaded": results, "errors": errors}
+
+
+async def _queue_uploads(files: list[UploadFile], username: str):
+    queued, errors = [], []
     for upload in files:
-        content = await upload.read()
         try:
-            results.append(services.upload_sar_file(username, upload.filename, content))
+            temp_path, filename, digest = await asyncio.to_thread(
+                services.spool_sar_upload, username, upload.filename, upload.file
+            )
+            queued.append(
+                await asyncio.to_thread(
+                    jobs.submit, username, temp_path, filename, digest
+                )
+            )
         except ServiceError as exc:
             errors.append({"file": upload.filename, "detail": str(exc)})
-    if not results and errors:
-        return JSONResponse(status_code=400, content={"uploaded": [], "errors": errors})
-    return {"uploaded": results, "errors": errors}
+    status = 400 if errors and not queued else 202
+    return JSONResponse(status_code=status, content={"jobs": queued, "errors": errors})
+
+
+async def _ingest_upload(
+    upload: UploadFile, username: str, limit: asyncio.Semaphore
+) -> tuple[bool, dict]:
+    """(True, summary) or (False, error entry) for one file of POST /files."""
+    async with limit:
+        try:
+            # UploadFile spools large bodies to disk; the service copies the
+            # file object in chunks (in a thread), the parse runs in the pool
+            temp_path, filename, digest = await asyncio.to_thread(
+                services.spool_sar_upload, username, upload.filename, upload.file
+            )
+        except ServiceError as exc:
+            return False, {"file": upload.filename, "detail": str(exc)}
+        except OSError as exc:
+            return False, {"file": upload.filename, "detail": f"spooling failed: {exc}"}
+        pool = services.upload_pool()
+        try:
+            summary = await asyncio.get_running_loop().run_in_executor(
+                pool,
+                functools.partial(
+                    services.ingest_sar_upload,
+                    username,
+                    temp_path,
+                    filename,
+                    digest=digest,
+                ),
+            )
+        except ServiceError as exc:
+            return False, {"file": upload.filename, "detail": str(exc)}
+        except OSError as exc:
+            # one file of the request, the others are unaffected
+            temp_path.unlink(missing_ok=True)
+            return False, {"file": upload.filename, "detail": f"ingest failed: {exc}"}
+        except BrokenProcessPool:
+            services.reset_upload_pool(pool)
+            temp_path.unlink(missing_ok=True)
+            return False, {
+                "file": upload.filename,
+                "detail": "ingest worker died while parsing the file",
+            }
+        services.warm_upload(username, summary["name"])
+        return True, summary
+
+
+@app.post(f"{PREFIX}/files/{{name}}/append")
+def append_file(
+    name: str,
+    file: UploadFile,
+    username: str = Depends(auth.get_current_user),
+):
+    """Append the new part of a growing sar text file to an uploaded one.
+
+    `file` holds the lines added since the last push or the whole current
+    version; rows already stored are skipped per header.
+    """
+    return services.append_sar_data(username, name, file.file)
+
+
+@app.get(f"{PREFIX}/jobs")
+def list_jobs(username: str = Depends(auth.get_current_user)):
+    return {"jobs": jobs.list_jobs(username)}
+
+
+@app.get(f"{PREFIX}/jobs/{{job_id}}")
+def get_job(job_id: int, username: str = Depends(auth.get_current_user)):
+    """State of an ingest job: queued, running, done or failed, with the
+    bytes parsed so far, the sections found and, once done, the upload
+    summary (`result`, `headers`) or the `error`."""
+    return jobs.get(username, job_id)
 
 
 @app.delete(f"{PREFIX}/files/{{name}}")
@@ -259,7 +411,7 @@ def delete_file(name: str, username: str = Depends(auth.get_current_user)):
 
 @app.get(f"{PREFIX}/files/{{name}}")
 def get_file_info(name: str, username: str = Depends(auth.get_current_user)):
-    df = services.load_df(username, name)
+    df = services.load_lf(username, name)
     return {"name": name, **services.file_info(df)}
 
 
@@ -282,9 +434,14 @@ def get_data(
     start: str | None = None,
     end: str | None = None,
     format: str = "json",
+    max_points: int | None = None,
     username: str = Depends(auth.get_current_user),
 ):
-    table, meta = services.get_table(username, name, header, metric, device, start, end)
+    """`max_points` caps the rows: longer series are served from the stored
+    min/max/mean pyramid ("level" = rows per bucket)."""
+    table, meta = services.get_table(
+        username, name, header, metric, device, start, end, max_points
+    )
     if format == "csv":
         buffer = io.StringIO()
         table.to_csv(buffer)
@@ -295,6 +452,7 @@ def get_data(
         "header": meta["header"],
         "alias": meta["alias"],
         "device": meta["device"],
+        "level": meta["level"],
         "rows": len(records),
         "data": records.to_dict(orient="records"),
     }
@@ -311,8 +469,9 @@ def get_statistics(
     format: str = "json",
     username: str = Depends(auth.get_current_user),
 ):
-    table, meta = services.get_table(username, name, header, metric, device, start, end)
-    describe = table.describe()
+    describe, meta = services.get_statistics(
+        username, name, header, metric, device, start, end
+    )
     if format == "csv":
         buffer = io.StringIO()
         describe.to_csv(buffer)
@@ -331,6 +490,34 @@ def get_statistics(
     }
 
 
+@app.get(f"{PREFIX}/fleet/data")
+def get_fleet_data(
+    header: str,
+    metric: str | None = None,
+    device: str | None = None,
+    host: list[str] | None = Query(default=None),
+    start: str | None = None,
+    end: str | None = None,
+    format: str = "json",
+    username: str = Depends(auth.get_current_user),
+):
+    """One header across all uploaded days and hosts (FLEET_DATASET);
+    `host` may repeat, `start`/`end` are ISO dates or timestamps."""
+    table, meta = services.fleet_table(
+        username, header, metric, device, host, start, end
+    )
+    if format == "csv":
+        buffer = io.StringIO()
+        table.to_csv(buffer, index=False)
+        return Response(content=buffer.getvalue(), media_type="text/csv")
+    table["date"] = table["date"].astype(str)
+    return {
+        **meta,
+        "rows": len(table),
+        "data": table.to_dict(orient="records"),
+    }
+
+
 # --------------------------------------------------------------------------
 # charts
 # --------------------------------------------------------------------------
@@ -5,38 +5,49 @@ mng_sar.py / single_file_pl.py / dia_overview_pl.py / multi_files_pl.py do in
 the UI, minus widgets and st.session_state.
 """
 
+import contextlib
 import datetime
+import fcntl
+import hashlib
 import logging
+import multiprocessing
 import os
 import re
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import BinaryIO
 
 import pandas as pd
 import polars as pl
 
 from . import bootstrap  # noqa: F401
 
+import dedup_store
+import derived_cache
 import dia_compute_pl as dia_compute
+import file_catalog
+import fleet_store
+import frame_cache
+import header_store
 import helpers_pl as helpers
 import parse_into_polars as parse_polars
 import pl_helpers2 as pl_h2
-import redis_mng
+import pyramid
+import redis_cache
+import sa_binary
 import sar_ingest
+import sar_store
+import warmup
 from config import Config
 from mng_sar import convert_openpgp_sar_file, is_sar_binary_file
 
 logger = logging.getLogger("sar_api")
 
-DEFAULT_OVERVIEW_ALIASES = [
-    "CPU",
-    "Kernel tables",
-    "Load",
-    "Memory utilization",
-    "Swap utilization",
-]
+DEFAULT_OVERVIEW_ALIASES = dia_compute.DEFAULT_OVERVIEW_ALIASES
 
 _CPU_LIKE = re.compile(r"^CPU|SOFT.*", re.IGNORECASE)
+_SOFT = re.compile(r"^SOFT", re.IGNORECASE)
 _SAFE_NAME = re.compile(r"^[A-Za-z0-9._-]+$")
 
 # Usernames may be plain logins or e-mail addresses. The first character must
@@ -78,120 +89,361 @@ def _validate_file_name(name: str) -> str:
 
 
 def list_sar_files(username: str) -> list[dict]:
-    directory = user_dir(username)
-    entries = [x for x in os.listdir(directory) if (directory / x).is_file()]
-    raw = [x for x in entries if not x.endswith(".parquet")]
-    parquet = [x.removesuffix(".parquet") for x in entries if x.endswith(".parquet")]
-    result = []
-    for name in sorted(set(raw + parquet)):
-        path = directory / name
-        if not path.exists():
-            path = directory / f"{name}.parquet"
-        result.append({"name": name, "size_bytes": path.stat().st_size})
-    return result
-
-
-def upload_sar_file(username: str, filename: str, content: bytes) -> dict:
+    """The user's files from file_catalog: size, host, sar date, time span,
+    restarts and the number of headers; no file is opened."""
+    user_dir(username)
+    return [
+        {
+            key: len(value) if key == "headers" else value
+            for key, value in entry.items()
+            if key != "devices"
+        }
+        for entry in file_catalog.files(username)
+    ]
+
+
+def upload_sar_file(username: str, filename: str, source: BinaryIO) -> dict:
     """Store one SAR file (ASCII or binary) and convert it to parquet.
 
     Mirrors the 'Add Sar Files' flow in mng_sar.file_mng, then parses the
-    file eagerly so the parquet exists when the request returns.
+    file eagerly so the parquet exists when the request returns. `source`
+    is spooled to disk first, so the upload is never held in memory.
     """
-    from magic import Magic
+    temp_path, filename, digest = spool_sar_upload(username, filename, source)
+    summary = ingest_sar_upload(username, temp_path, filename, digest=digest)
+    warm_upload(username, summary["name"])
+    return summary
 
-    directory = user_dir(username)
-    warnings: list[str] = []
 
-    # xz archives are unpacked, sadf JSON is converted to classic sar text
+def warm_upload(username: str, name: str) -> None:
+    """Queue a parsed upload for the background warm-up (warmup). Called
+    in the API process; the upload pool's workers do not warm."""
+    warmup.schedule(sar_path(username, name), username)
+
+
+def spool_sar_upload(
+    username: str, filename: str, source: BinaryIO
+) -> tuple[Path, str, str]:
+    """First half of upload_sar_file: copy `source` to a temp file in the
+    user directory (xz unpacked). Returns the temp path, the file name and
+    the sha256 of the spooled content (dedup_store)."""
+    digest = hashlib.sha256()
     try:
-        content, filename, ingest_warnings = sar_ingest.preprocess_upload(
-            content, filename
+        temp_path, filename = sar_ingest.spool_upload(
+            source, user_dir(username), filename, digest
         )
     except ValueError as exc:
         raise ServiceError(str(exc))
-    warnings.extend(ingest_warnings)
+    return temp_path, filename, digest.hexdigest()
+
+
+def ingest_sar_upload(
+    username: str,
+    temp_path: Path,
+    filename: str,
+    progress=None,
+    digest: str | None = None,
+) -> dict:
+    """Second half of upload_sar_file: detect, convert and parse a spooled
+    upload. Removes the temp file. Runs in the upload pool for POST /files.
+
+    `progress(bytes parsed, sections found)` is called while parsing. With
+    the content `digest`, an upload parsed before is linked from
+    dedup_store instead, and a new one is registered there.
+    """
+    try:
+        if digest is None:
+            return _ingest_spooled(username, temp_path, filename, progress)
+        summary = _link_known_upload(username, filename, digest)
+        if summary is None:
+            summary = _ingest_spooled(username, temp_path, filename, progress)
+            dedup_store.register(
+                digest, sar_store.stored_file(user_dir(username) / summary["name"])
+            )
+        return summary
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def _link_known_upload(username: str, filename: str, digest: str) -> dict | None:
+    """Upload summary for content parsed before, None if it is new."""
+    name = dedup_store.lookup(digest)
+    if name is None:
+        return None
+    warnings: list[str] = []
+    _prepare_overwrite(username, name, warnings)
+    try:
+        parquet_file = dedup_store.link(digest, user_dir(username), name)
+    except OSError as exc:
+        logger.warning("dedup: linking %s failed, parsing it: %s", filename, exc)
+        return None
+    warnings.append(f"{filename}: identical to an earlier upload, parsed data reused")
+    return _upload_summary(name, parquet_file, warnings)
+
+
+_upload_pool: ProcessPoolExecutor | None = None
+
+
+def _init_upload_worker(parse_workers: int) -> None:
+    # the pool already runs uploads side by side; share the cores with the
+    # section-parallel classifier instead of multiplying its workers
+    Config.parse_workers = parse_workers
+
+
+def upload_pool() -> ProcessPoolExecutor:
+    """Process pool that parses uploads off the event loop (UPLOAD_WORKERS)."""
+    global _upload_pool
+    if _upload_pool is None:
+        workers = max(Config.upload_workers, 1)
+        _upload_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_upload_worker,
+            initargs=(max(Config.parse_workers // workers, 1),),
+        )
+    return _upload_pool
+
+
+def reset_upload_pool(broken: ProcessPoolExecutor | None = None) -> None:
+    """Shut the pool down; the next upload_pool() call starts a new one.
+    Called on app shutdown and after a worker of the pool `broken` died
+    (BrokenProcessPool); a pool that already replaced it is kept."""
+    global _upload_pool
+    if broken is not None and broken is not _upload_pool:
+        return
+    if _upload_pool is not None:
+        _upload_pool.shutdown(wait=False, cancel_futures=True)
+        _upload_pool = None
+
+
+def _ingest_spooled(
+    username: str, temp_path: Path, filename: str, progress=None
+) -> dict:
+    from magic import Magic
+
+    directory = user_dir(username)
+    warnings: list[str] = []
+
+    # sadf JSON is ingested without a text round-trip
+    head = sar_ingest.read_head(temp_path)
+    if sar_ingest.is_sadf_json(head):
+        return _upload_sadf_json(username, filename, temp_path, warnings, progress)
+    # binary sa files are decoded natively; sar -A for what that cannot read
+    if sa_binary.is_sa_file(head):
+        summary = _upload_sa_binary(
+            username, filename, temp_path, warnings, progress
+        )
+        if summary is not None:
+            return summary
 
-    detected = Magic().from_buffer(content)
+    detected = Magic().from_file(str(temp_path))
     is_openpgp = "OpenPGP Secret Key" in detected
     is_generic_data = "data" in detected.lower()
-    if is_openpgp or (is_generic_data and is_sar_binary_file(content, filename)):
-        converted, new_name = convert_openpgp_sar_file(content, filename)
+    if is_openpgp or (is_generic_data and is_sar_binary_file(head, filename)):
+        converted, new_name = convert_openpgp_sar_file(str(temp_path), filename)
         if converted is None:
             raise ServiceError(
                 f"Binary SAR file {filename} could not be converted; "
                 "is the sysstat 'sar' binary installed and version-compatible?"
             )
-        content, filename = converted, new_name
-        detected = Magic().from_buffer(content)
+        temp_path, filename = Path(converted), new_name
+        detected = Magic().from_file(converted)
         warnings.append(f"{filename}: binary SAR file converted with sar -A")
 
     if "ASCII text" not in detected:
+        temp_path.unlink(missing_ok=True)
         raise ServiceError(f"{filename}: unsupported file type ({detected})")
 
-    temp_path = directory / f".tmp_{filename}"
-    temp_path.write_bytes(content)
     renamed = helpers.rename_sar_file(str(temp_path), col=_LogCol())
     if not renamed:
+        temp_path.unlink(missing_ok=True)
         raise ServiceError(f"{filename}: could not extract host/date for renaming")
 
-    if (directory / f"{renamed}.parquet").exists():
-        warnings.append(f"{renamed}: existing parquet was overwritten")
-
-    try:
-        redis_mng.del_redis_key_property(
-            f"{Config.rkey_pref}:{username}", f"{renamed}_parquet"
-        )
-    except Exception:
-        pass
+    _prepare_overwrite(username, renamed, warnings)
 
     # Eager conversion (the UI does this lazily on first analysis). Always
-    # re-parse so a re-upload refreshes a stale parquet.
-    df = parse_polars.parse_sar_file(str(directory / renamed), username, DEBUG=False)
-
+    # re-parse so a re-upload refreshes a stale parquet. The streaming parser
+    # keeps memory bounded by its chunk size; the summary is read back lazily.
+    parquet_file = parse_polars.stream_sar_file(
+        str(directory / renamed), DEBUG=False, progress=progress
+    )
+    return _upload_summary(renamed, parquet_file, warnings)
+
+
+def _prepare_overwrite(username: str, name: str, warnings: list[str]) -> None:
+    if sar_store.stored_file(user_dir(username) / name).exists():
+        warnings.append(f"{name}: existing parquet was overwritten")
+    derived_cache.invalidate(user_dir(username) / name)
+    redis_cache.drop(username, name)
+
+
+def _upload_summary(name: str, parquet_file: Path, warnings: list[str]) -> dict:
+    rows, headers = (
+        sar_store.scan(parquet_file)
+        .select(pl.len(), pl.col("header").n_unique())
+        .collect()
+        .row(0)
+    )
     return {
-        "name": renamed,
-        "rows": df.height,
-        "headers": len(pl_h2.get_headers(df)),
+        "name": name,
+        "rows": rows,
+        "headers": headers,
         "warnings": warnings,
     }
 
 
+def _upload_sadf_json(
+    username: str, filename: str, json_path: Path, warnings: list[str], progress=None
+) -> dict:
+    """sadf JSON goes straight to parquet (parse_polars.stream_sadf_json)."""
+    directory = user_dir(username)
+    filename = sar_ingest.strip_json_suffix(filename)
+    try:
+        renamed = sar_ingest.sadf_json_name(str(json_path))
+        _prepare_overwrite(username, renamed, warnings)
+        parquet_file, json_warnings = parse_polars.stream_sadf_json(
+            str(json_path), str(directory / renamed), progress=progress
+        )
+    except ValueError as exc:
+        raise ServiceError(str(exc))
+    warnings.append(f"{filename}: converted from sadf JSON")
+    warnings.extend(f"{filename}: {w}" for w in json_warnings)
+    return _upload_summary(renamed, parquet_file, warnings)
+
+
+def _upload_sa_binary(
+    username: str, filename: str, sa_path: Path, warnings: list[str], progress=None
+) -> dict | None:
+    """Binary sa file straight to parquet (parse_polars.stream_sa_file).
+
+    Returns None, with a warning, if sa_binary cannot decode the file, or
+    cannot decode all of it while sar -A can.
+    """
+    directory = user_dir(username)
+    try:
+        renamed = sar_ingest.sa_binary_name(str(sa_path))
+        _prepare_overwrite(username, renamed, warnings)
+        parquet_file, sa_warnings = parse_polars.stream_sa_file(
+            str(sa_path), str(directory / renamed), progress=progress
+        )
+    except ValueError as exc:
+        warnings.append(f"{filename}: native sa decoding failed ({exc})")
+        return None
+    warnings.append(f"{filename}: binary SAR file decoded natively")
+    warnings.extend(f"{filename}: {w}" for w in sa_warnings)
+    return _upload_summary(renamed, parquet_file, warnings)
+
+
 def delete_sar_file(username: str, name: str) -> None:
     name = _validate_file_name(name)
     directory = user_dir(username)
+    # last reference to a dedup_store entry goes away with this file
+    stored = sar_store.candidates(directory / name)
+    shared = any(dedup_store.is_shared(path) for path in stored)
     removed = False
-    for candidate in (directory / name, directory / f"{name}.parquet"):
+    for candidate in (directory / name, *stored):
         if candidate.exists():
             candidate.unlink()
             removed = True
     if not removed:
         raise ServiceError(f"File {name} not found")
+    header_store.remove_store(directory / name)
+    derived_cache.invalidate(directory / name)
+    file_catalog.refresh(directory / name)
+    for path in stored:
+        frame_cache.invalidate(path)
+    if shared:
+        dedup_store.prune()
+    redis_cache.drop(username, name)
+
+
+@contextlib.contextmanager
+def _user_lock(directory: Path):
+    """Serialize read-modify-write of a user's files across API processes."""
+    fd = os.open(directory, os.O_RDONLY)
     try:
-        redis_mng.del_redis_key_property(
-            f"{Config.rkey_pref}:{username}", f"{name}_parquet"
-        )
-    except Exception:
-        pass
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
 
 
-def load_df(username: str, name: str) -> pl.DataFrame:
+def append_sar_data(username: str, name: str, source: BinaryIO) -> dict:
+    """Add new sar text to an uploaded file without re-parsing it.
+
+    `source` holds the lines added since the last push or the whole current
+    version of the file (xz allowed). Only rows past the last stored time of
+    each header are appended (parse_polars.append_sar_lines); the typed
+    store is rebuilt for those headers only.
+    """
     name = _validate_file_name(name)
     directory = user_dir(username)
-    if not (directory / name).exists() and not (directory / f"{name}.parquet").exists():
-        raise ServiceError(f"File {name} not found")
-    return parse_polars.get_data_frame(str(directory / name), username)
+    parquet_file = sar_store.stored_file(directory / name)
+    with _user_lock(directory):
+        if not parquet_file.exists():
+            if not (directory / name).exists():
+                raise ServiceError(f"File {name} not found")
+            parquet_file = parse_polars.stream_sar_file(str(directory / name), DEBUG=False)
+        try:
+            temp_path, _ = sar_ingest.spool_upload(source, directory, f"append_{name}")
+        except ValueError as exc:
+            raise ServiceError(str(exc))
+        try:
+            head = sar_ingest.read_head(temp_path)
+            if b"\0" in head or sar_ingest.is_sadf_json(head):
+                raise ServiceError(f"{name}: append takes sar text (sar -A output)")
+            shared = dedup_store.is_shared(parquet_file)
+            with open(temp_path, "r") as lines:
+                rows, headers = parse_polars.append_sar_lines(parquet_file, lines)
+        except ValueError as exc:
+            raise ServiceError(f"{name}: {exc}")
+        finally:
+            temp_path.unlink(missing_ok=True)
+    if rows:
+        if shared:
+            dedup_store.prune()
+        redis_cache.drop(username, name)
+        warm_upload(username, name)
+    return {
+        **_upload_summary(name, parquet_file, []),
+        "rows_appended": rows,
+        "headers_changed": headers,
+    }
+
+
+def sar_path(username: str, name: str) -> Path:
+    """Base path of a sar file (without the .parquet/.arrow suffix)."""
+    return user_dir(username) / _validate_file_name(name)
+
+
+def load_df(username: str, name: str) -> pl.DataFrame:
+    path = sar_path(username, name)
+    if not path.exists() and not sar_store.stored_file(path).exists():
+        raise ServiceError(f"File {path.name} not found")
+    return parse_polars.get_data_frame(str(path), username)
 
 
-def file_info(df: pl.DataFrame) -> dict:
+def load_lf(username: str, name: str) -> pl.LazyFrame:
+    """load_df as a LazyFrame (parse_into_polars.get_lazy_frame): header,
+    device and time filters are pushed down to the stored file."""
+    path = sar_path(username, name)
+    if not path.exists() and not sar_store.stored_file(path).exists():
+        raise ServiceError(f"File {path.name} not found")
+    return parse_polars.get_lazy_frame(str(path), username)
+
+
+def file_info(df: pl.DataFrame | pl.LazyFrame) -> dict:
     headers = pl_h2.get_headers(df)
     aliases = helpers.translate_headers(headers)
     os_details = pl_h2.get_os_details_from_df(df)
     restarts = pl_h2.get_restart_headers(df)
-    dates = df["date"]
+    start, end = pl_h2.collect(
+        df.select(pl.col("date").min().alias("start"), pl.col("date").max().alias("end"))
+    ).row(0)
     return {
         "os_details": os_details.strip(),
-        "start": str(dates.min()),
-        "end": str(dates.max()),
+        "start": str(start),
+        "end": str(end),
         "restarts": [r.strip() for r in restarts],
         "headers": [
             {"header": h, "alias": a, "metrics": h.split()}
@@ -200,12 +452,15 @@ def file_info(df: pl.DataFrame) -> dict:
     }
 
 
-def resolve_header(df: pl.DataFrame, name: str) -> tuple[str, str]:
+def resolve_header(df: pl.DataFrame | pl.LazyFrame, name: str) -> tuple[str, str]:
     """Accept an alias ('CPU', 'Load') or a raw header string.
 
     Returns (header, alias).
     """
-    headers = pl_h2.get_headers(df)
+    return _resolve_header_name(pl_h2.get_headers(df), name)
+
+
+def _resolve_header_name(headers: list[str], name: str) -> tuple[str, str]:
     if name in headers:
         alias = helpers.translate_headers([name]).get(name, name)
         return name, alias
@@ -217,10 +472,13 @@ def resolve_header(df: pl.DataFrame, name: str) -> tuple[str, str]:
 
 
 def header_details(username: str, name: str, header_name: str) -> dict:
-    df = load_df(username, name)
+    df = load_lf(username, name)
     header, alias = resolve_header(df, header_name)
     df_h = pl_h2.get_data_frames_from__headers([header], df, "header")[0]
-    devices = dia_compute.get_device_list(df_h)
+    metrics_df = header_store.get_metrics_df(
+        sar_path(username, name), header, df_h, alias
+    )
+    devices = sorted(pl_h2.get_sub_devices_from_df(metrics_df, "sub_device"))
     return {
         "header": header,
         "alias": alias,
@@ -250,41 +508,91 @@ def _parse_bound(value: str | None, reference: pd.Timestamp) -> pd.Timestamp | N
         raise ServiceError(f"Unparsable time value: {value!r}")
 
 
-def filter_time_range(
-    df: pd.DataFrame, start: str | None, end: str | None
-) -> pd.DataFrame:
+def time_bounds(
+    df: pl.DataFrame | pl.LazyFrame, header: str, start: str | None, end: str | None
+) -> tuple[datetime.datetime | None, datetime.datetime | None]:
+    """The start/end of a request as datetimes for prepare_header_frames;
+    'HH:MM' values refer to the day of the header's first sample."""
     if not start and not end:
-        return df
-    reference = df.index.min()
-    start_ts = _parse_bound(start, reference)
-    end_ts = _parse_bound(end, reference)
-    if start_ts is not None:
-        df = df[df.index >= start_ts]
-    if end_ts is not None:
-        df = df[df.index <= end_ts]
-    if df.empty:
+        return None, None
+    first = pl_h2.collect(
+        df.filter(pl.col("header") == header).select(pl.col("date").min())
+    ).item()
+    reference = pd.Timestamp(first)
+    bounds = (_parse_bound(start, reference), _parse_bound(end, reference))
+    return tuple(None if b is None else b.to_pydatetime() for b in bounds)
+
+
+def require_rows(df: pd.DataFrame, start: str | None, end: str | None) -> pd.DataFrame:
+    if (start or end) and df.empty:
         raise ServiceError("Time range selection produced an empty data set")
     return df
 
 
 def prepare_header_frames(
-    df: pl.DataFrame, header: str, device: str | None = None
+    df: pl.DataFrame | pl.LazyFrame,
+    header: str,
+    device: str | None = None,
+    file_name: str | Path | None = None,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
 ) -> list[dict]:
     """Polars header slice -> list of per-device pandas frames.
 
     Wraps dia_compute.prepare_df_for_pandas; `device` picks one sub-device
     (e.g. '3' or 'eth0'), otherwise the UI default is kept (CPU-like headers
-    collapse to the 'all' aggregate).
+    collapse to the 'all' aggregate). With `file_name` (see sar_path) the
+    metrics are read from the typed per-header store. `start`/`end`
+    (time_bounds) limit the rows; on a LazyFrame (load_lf) they, the header
+    and the device are applied while scanning. Results for a `file_name`
+    are kept in derived_cache, so a repeated request skips all of this.
     """
-    df_h = pl_h2.get_data_frames_from__headers([header], df, "header")[0]
-    start, end = df_h["date"].min(), df_h["date"].max()
+    if file_name is None:
+        return _prepare_header_frames(df, header, device, file_name, start, end)
+    params = {"view": "api", "header": header, "device": device, "start": start, "end": end}
+    frames = derived_cache.get(file_name, params)
+    if frames is None:
+        frames = _prepare_header_frames(df, header, device, file_name, start, end)
+        derived_cache.put(file_name, params, frames)
+    return frames
+
+
+def _warm_api_overview(
+    file_name: str, username: str, df: pl.DataFrame, header: str
+) -> None:
+    # the frames of GET /charts/overview without start/end (charts.overview)
+    prepare_header_frames(df, header, file_name=file_name)
+
+
+warmup.register(_warm_api_overview)
+
+
+def _prepare_header_frames(
+    df: pl.DataFrame | pl.LazyFrame,
+    header: str,
+    device: str | None,
+    file_name: str | Path | None,
+    start: datetime.datetime | None,
+    end: datetime.datetime | None,
+) -> list[dict]:
+    df_h = pl_h2.get_data_frames_from__headers(
+        [header], df, "header", pl_h2.date_filter("date", start, end)
+    )[0]
+    if df_h.height == 0 and (start is not None or end is not None):
+        raise ServiceError("Time range selection produced an empty data set")
 
     alias = helpers.translate_headers([header]).get(header, header)
+    metrics_df = None
+    if file_name is not None:
+        metrics_df = header_store.get_metrics_df(
+            file_name, header, df_h, alias, device, start, end
+        )
     if device is not None and _CPU_LIKE.search(alias):
         # prepare_df_for_pandas only yields 'all' for CPU-like headers; build
         # the requested device frame directly (headless variant of
         # dia_compute.prepare_single_device_for_pandas).
-        metrics_df = pl_h2.get_metrics_from_df(df_h, header, alias)
+        if metrics_df is None:
+            metrics_df = pl_h2.get_metrics_from_df(df_h, header, alias)
         device_df = pl_h2.get_df_from_sub_device(metrics_df, "sub_device", str(device))
         if device_df.height == 0:
             raise ServiceError(f"Device {device!r} not found for header {alias!r}")
@@ -299,7 +607,9 @@ def prepare_header_frames(
             }
         ]
 
-    frames = dia_compute.prepare_df_for_pandas(df_h, start, end)
+    frames = dia_compute.prepare_df_for_pandas(
+        df_h, df_h["date"].min(), df_h["date"].max(), metrics_df=metrics_df
+    )
     if device is not None:
         frames = [f for f in frames if str(f["sub_title"]) == str(device)]
         if not frames:
@@ -315,29 +625,217 @@ def get_table(
     device: str | None = None,
     start: str | None = None,
     end: str | None = None,
+    max_points: int | None = None,
 ) -> tuple[pd.DataFrame, dict]:
-    """Time-filtered wide dataframe for one header (optionally one metric)."""
-    df = load_df(username, name)
+    """Time-filtered wide dataframe for one header (optionally one metric).
+
+    With `max_points`, a table longer than that comes from the finest
+    stored pyramid level that fits (header_store.read_level): bucket means
+    plus `<metric>_min`/`<metric>_max`, so peaks survive; meta["level"] is
+    the number of rows per bucket (1 = full resolution).
+    """
+    df = load_lf(username, name)
     header, alias = resolve_header(df, header_name)
-    frames = prepare_header_frames(df, header, device)
+    bounds = time_bounds(df, header, start, end)
+    frames = prepare_header_frames(df, header, device, sar_path(username, name), *bounds)
     frame = frames[0]
-    table = filter_time_range(frame["df"], start, end)
+    table = require_rows(frame["df"], start, end)
+    if metric and metric not in table.columns:
+        raise ServiceError(
+            f"Unknown metric {metric!r}; available: {list(table.columns)}"
+        )
+    level = 1
+    if max_points is not None and len(table) > max_points:
+        table, level = _downsampled_table(
+            username, name, header, frame["sub_title"] or None, table, max_points, bounds
+        )
     if metric:
-        if metric not in table.columns:
-            raise ServiceError(
-                f"Unknown metric {metric!r}; available: {list(table.columns)}"
-            )
-        table = table[[metric]]
+        table = table[[c for c in table.columns if c in _metric_columns(metric)]]
     meta = {
         "header": header,
         "alias": alias,
         "device": frame["sub_title"] or None,
+        "level": level,
         "os_details": pl_h2.get_os_details_from_df(df).strip(),
         "restart_headers": pl_h2.get_restart_headers(df),
     }
     return table, meta
 
 
+def _metric_columns(metric: str) -> tuple[str, str, str]:
+    return metric, f"{metric}{pyramid.MIN_SUFFIX}", f"{metric}{pyramid.MAX_SUFFIX}"
+
+
+def _downsampled_table(
+    username: str,
+    name: str,
+    header: str,
+    device: str | None,
+    table: pd.DataFrame,
+    max_points: int,
+    bounds: tuple,
+) -> tuple[pd.DataFrame, int]:
+    """`table` from the stored pyramid (see get_table); unchanged when the
+    header has no typed store."""
+    if max_points < 1:
+        raise ServiceError("max_points must be positive")
+    try:
+        found = header_store.read_level(
+            sar_path(username, name), header, max_points, device, *bounds
+        )
+    except Exception:
+        found = None
+    if found is None or found[1] == 1:
+        return table, 1
+    level, factor = found
+    columns = [
+        column
+        for metric in table.columns
+        for column in _metric_columns(metric)
+        if column in level.columns
+    ]
+    return level.select("date", *columns).to_pandas().set_index("date"), factor
+
+
+def get_statistics(
+    username: str,
+    name: str,
+    header_name: str,
+    metric: str | None = None,
+    device: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+) -> tuple[pd.DataFrame, dict]:
+    """describe() of the get_table frame: statistics x metrics.
+
+    Without `start`/`end` they come from the statistics stored at ingest
+    (header_store.read_stats), no data rows are read; time windows, and
+    headers the typed store does not hold, are computed from the table.
+    """
+    if not start and not end:
+        found = _stored_statistics(username, name, header_name, metric, device)
+        if found is not None:
+            return found
+    table, meta = get_table(username, name, header_name, metric, device, start, end)
+    return table.describe(), meta
+
+
+def _stored_statistics(
+    username: str,
+    name: str,
+    header_name: str,
+    metric: str | None,
+    device: str | None,
+) -> tuple[pd.DataFrame, dict] | None:
+    path = sar_path(username, name)
+    try:
+        manifest = header_store.read_manifest(path)
+    except Exception:
+        return None
+    if manifest is None:
+        return None
+    try:
+        header, alias = _resolve_header_name(
+            [entry["header"] for entry in manifest["headers"]], header_name
+        )
+    except ServiceError:
+        return None  # not in the store; get_table resolves or reports it
+    stats = header_store.read_stats(path, header)
+    if not stats:
+        return None
+    devices = sorted(d for d in stats if d is not None)
+    if device is not None:
+        if str(device) not in devices:
+            raise ServiceError(f"Device {device!r} not found for header {alias!r}")
+        device = str(device)
+    elif devices:
+        device = _default_device(alias, devices)
+    metrics = stats[device]
+    if metric and metric not in metrics:
+        raise ServiceError(f"Unknown metric {metric!r}; available: {list(metrics)}")
+    describe = pd.DataFrame(
+        {
+            column: [values[stat] for stat in header_store.STATISTICS]
+            for column, values in metrics.items()
+            if not metric or column == metric
+        },
+        index=list(header_store.STATISTICS),
+        dtype=float,
+    )
+    return describe, {"header": header, "alias": alias, "device": device}
+
+
+def _default_device(alias: str, devices: list[str]) -> str:
+    """The device of a header that dia_compute.prepare_df_for_pandas puts
+    first: 'all' for CPU-like headers, else the first in sort order."""
+    if "all" in devices and (alias == "CPU" or _SOFT.search(alias)):
+        return "all"
+    return sorted(devices)[0]
+
+
+def _fleet_bound(value: str | None, end: bool = False) -> datetime.datetime | None:
+    """ISO date or timestamp of a fleet query; a date as `end` covers that
+    whole day."""
+    if not value:
+        return None
+    if re.match(r"^\d{1,2}:\d{2}(:\d{2})?$", value.strip()):
+        raise ServiceError("Fleet queries take ISO dates or timestamps, not HH:MM")
+    bound = _parse_bound(value, None)
+    if end and re.match(r"^\d{4}-\d{2}-\d{2}$", value.strip()):
+        bound += pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    return bound.to_pydatetime()
+
+
+def fleet_table(
+    username: str,
+    header_name: str,
+    metric: str | None = None,
+    device: str | None = None,
+    hosts: list[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+) -> tuple[pd.DataFrame, dict]:
+    """One header over all days and hosts of a user (fleet_store), as
+    (date, host, metrics...) sorted by host and time: a single scan of the
+    partitioned dataset instead of one load per file. `hosts` and the
+    `start`/`end` dates pick the partitions read."""
+    if not Config.fleet_dataset:
+        raise ServiceError("The fleet dataset is turned off (FLEET_DATASET)")
+    catalog = file_catalog.files(username)
+    headers = list(dict.fromkeys(h for entry in catalog for h in entry["headers"]))
+    header, alias = _resolve_header_name(headers, header_name)
+    metrics = header.split()
+    if metric and metric not in metrics:
+        raise ServiceError(f"Unknown metric {metric!r}; available: {metrics}")
+    bounds = _fleet_bound(start), _fleet_bound(end, end=True)
+    lf = fleet_store.scan(username, header, hosts, *bounds)
+    if lf is None:
+        raise ServiceError(f"No fleet data for header {alias!r}")
+    if "device" in lf.collect_schema().names():
+        lf = lf.with_columns(pl.col("device").cast(pl.String))
+        if device is None:
+            devices = lf.select(pl.col("device").unique()).collect()["device"]
+            if devices.len():
+                device = _default_device(alias, devices.drop_nulls().to_list())
+        lf = lf.filter(pl.col("device") == str(device))
+    elif device is not None:
+        raise ServiceError(f"Device {device!r} not found for header {alias!r}")
+    table = (
+        lf.select("date", "host", *([metric] if metric else metrics))
+        .sort("host", "date")
+        .collect()
+    )
+    if table.height == 0:
+        raise ServiceError("The fleet selection produced an empty data set")
+    meta = {
+        "header": header,
+        "alias": alias,
+        "device": None if device is None else str(device),
+        "hosts": table["host"].unique().sort().to_list(),
+    }
+    return table.to_pandas(), meta
+
+
 # ---------------------------------------------------------------------------
 # admin / maintenance: per-user disk usage and age-based cleanup
 # ---------------------------------------------------------------------------
@@ -345,6 +843,8 @@ def get_table(
 # (login history/counter, the headingstable/metric table caches) - it must
 # never appear in per-user reports or be touched by the cleanup.
 EXCLUDED_UPLOAD_DIRS = {"config"}
+# .tmp_ files touched this recently may still be spooled or parsed
+TMP_GRACE_SECONDS = 3600
 
 
 def _existing_user_dir(username: str) -> Path:
@@ -445,14 +945,14 @@ def _collect_cleanup_candidates(directory: Path, days: int, now: float) -> list[
     and real run so the preview always matches the action."""
     candidates = []
 
-    # SAR files: raw + .parquet share a base name and form one unit - never
+    # SAR files: raw + .parquet/.arrow share a base name and form one unit - never
     # delete one half (list_sar_files dedupes the same way).
     entries = [e for e in directory.iterdir() if e.is_file()]
     bases: dict[str, list[Path]] = {}
     for entry in entries:
         if entry.name.startswith("."):
             continue
-        bases.setdefault(entry.name.removesuffix(".parquet"), []).append(entry)
+        bases.setdefault(sar_store.base_path(entry.name), []).append(entry)
     for base_name, members in sorted(bases.items()):
         age, source = _file_age_days(members[0], base_name, now)
         if source == "mtime":
@@ -505,10 +1005,19 @@ def _collect_cleanup_candidates(directory: Path, days: int, now: float) -> list[
                     }
                 )
 
-    # Orphaned upload temp files (crashed/aborted uploads): always. A live
-    # upload's temp file exists only for the split second before renaming.
+    # Orphaned upload temp files (crashed/aborted uploads), regardless of
+    # `days`. Spools of queued/running background jobs (jobs.submit) live
+    # until a worker gets to them and are kept, as is anything touched in
+    # the last TMP_GRACE_SECONDS (uploads being spooled or parsed).
+    from . import jobs
+
+    pending = jobs.pending_spools()
     for entry in sorted(entries):
         if entry.name.startswith(".tmp_"):
+            if entry.resolve() in pending:
+                continue
+            if now - entry.stat().st_mtime < TMP_GRACE_SECONDS:
+                continue
             candidates.append(
                 {
                     "name": entry.name,
@@ -2,6 +2,7 @@
 import time
 import altair as alt
 import dataframe_funcs_pl as ddf
+import pyramid
 import pandas as pd
 
 my_tz = time.tzname[0]
@@ -40,7 +41,7 @@ def _initialize_data_transformer():
         _transformer_initialized = True
 
 def sample_dataframe_for_viz(df, max_rows=5000):
-    """Sample large dataframes to reduce memory usage while preserving distribution.
+    """Downsample large dataframes to reduce memory usage while keeping peaks.
     
     For very large datasets (>100k rows), uses more aggressive sampling.
     
@@ -59,18 +60,9 @@ def sample_dataframe_for_viz(df, max_rows=5000):
     elif df_len > 50000:
         max_rows = min(max_rows, 3000)  # Cap at 3000 for large files
     
-    if df_len <= max_rows:
-        return df
-    
-    # Check if Polars or Pandas
-    if hasattr(df, 'sample'):  # Both have sample method
-        if 'polars' in str(type(df).__module__):
-            # Polars sampling
-            return df.sample(n=max_rows, seed=42)
-        else:
-            # Pandas sampling
-            return df.sample(n=max_rows, random_state=42).sort_index()
-    return df
+    # first/last/min/max row of every metric per time bucket instead of a
+    # random sample, which lost the spikes
+    return pyramid.downsample_frame(df, max_rows)
 
 def draw_single_chart_v1(
     df,
@@ -1,10 +1,10 @@
 #!/usr/bin/python3
 import streamlit as st
-import os
 import gc
 import single_file_pl
 import multi_files_pl
 import dia_overview_pl
+import file_catalog
 import handle_metrics_pl
 import helpers_pl as helpers
 import display_multi
@@ -38,7 +38,7 @@ def analyze(config_c: helpers.configuration, username: str):
     ph4 = col4.empty()
     ph41 = col4.empty()
     
-    sar_files = os.listdir(upload_dir)
+    sar_files = file_catalog.names(username)
     
     try:
         d_idx = analysis_options.index(current_mode)
@@ -79,7 +79,8 @@ def analyze(config_c: helpers.configuration, username: str):
         st.session_state['current_sar_file'] = sar_file
         sar_file_parm = sar_file
         sar_file = f"{upload_dir}/{sar_file}"
-        df =parse_polars.get_data_frame(sar_file, username)
+        # lazy: 'Detailed Metrics View' only reads the selected header
+        df = parse_polars.get_lazy_frame(sar_file, username)
         os_details = pl_helpers.get_os_details_from_df(df)
         with ph4:
             lh.make_vspace(6, ph4)
@@ -89,18 +90,14 @@ def analyze(config_c: helpers.configuration, username: str):
 
     st.markdown('___')
 
-    files_exists = 0
-    for entry in sar_files:
-        if os.path.isfile(f"{upload_dir}/{entry}"):
-            files_exists = 1
-            break
-    if not len(sar_files) or not files_exists:
+    if not len(sar_files):
         st.write('')
         st.warning('Nothing to analyze at the moment. You currently have no sar file uploaded.\n\
                    Upload a file in the "Manage Sar Files" menu on the top bar')
     else:
         if single_multi == 'Graphical Overview':
-            dia_overview_pl.show_dia_overview(username, ph4, sar_file_parm, df, os_details)
+            dia_overview_pl.show_dia_overview(
+                username, ph4, sar_file_parm, pl_helpers.collect(df), os_details)
 
         elif single_multi == 'Detailed Metrics View':
             single_file_pl.single_f(config, username, sar_file_parm, df, os_details)
@@ -109,7 +106,9 @@ def analyze(config_c: helpers.configuration, username: str):
             multi_files_pl.single_multi(config, username, [ph3, ph4, ph41])
 
         elif single_multi == 'Metrics on many devices':
-            display_multi.show_multi(config, username, sar_file_parm, df, os_details)
+            display_multi.show_multi(
+                config, username, sar_file_parm, pl_helpers.collect(df), os_details)
 
         elif single_multi == 'Compare Metrics':
-            handle_metrics_pl.do_metrics(config, username, sar_file_parm, df, os_details) 
+            handle_metrics_pl.do_metrics(
+                config, username, sar_file_parm, pl_helpers.collect(df), os_details) 
@@ -25,6 +25,7 @@ from bokeh.models import (
 from bokeh.embed import components
 from bokeh.resources import CDN
 import dataframe_funcs_pl as ddf
+import pyramid
 
 my_tz = time.tzname[0]
 
@@ -75,14 +76,10 @@ def _set_adaptive_time_ticks(p, df, time_col_name):
 
 
 def sample_dataframe_for_viz(df, max_rows=5000):
-    """Downsample large dataframes using striding for speed and temporal consistency."""
-    if len(df) > max_rows:
-        # Use a ceil-like stride so we actually reduce rows.
-        # Example: len=7000, max_rows=5000 -> step must be 2 (not 1).
-        step = (len(df) + max_rows - 1) // max_rows
-        step = max(1, step)
-        return df.iloc[::step]
-    return df
+    """Downsample large dataframes to max_rows, keeping the first, last,
+    minimum and maximum row of every metric per time bucket, so spikes
+    survive (a stride used to skip them)."""
+    return pyramid.downsample_frame(df, max_rows)
 
 
 def _adaptive_max_rows_for_series(
@@ -10,12 +10,63 @@ class Config(object):
     redis_user = os.getenv("REDIS_USER", "")
     redis_password = os.getenv("REDIS_PASSWORD", "")
     rkey_pref = os.getenv("RKEY_PREF", "user")
+    # after a failed Redis call, wait this long before probing again; the
+    # wait doubles on every failed probe up to redis_retry_max_seconds
+    redis_retry_seconds = float(os.getenv("REDIS_RETRY_SECONDS", 5))
+    redis_retry_max_seconds = float(os.getenv("REDIS_RETRY_MAX_SECONDS", 300))
+    redis_health_check_interval = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+    redis_max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", 32))
+    # in-process LRU cache of parsed frames (frame_cache); 0 turns it off
+    frame_cache_mb = int(os.getenv("FRAME_CACHE_MB", 512))
+    # per-header chart frames (derived_cache): MB kept in memory and result
+    # sets kept on disk per file; 0 turns a tier off
+    derived_cache_mb = int(os.getenv("DERIVED_CACHE_MB", 256))
+    derived_cache_entries = int(os.getenv("DERIVED_CACHE_ENTRIES", 64))
+    # Arrow IPC frames cached in Redis: uncompressed (read without copying),
+    # lz4 or zstd (smaller)
+    redis_ipc_compression = os.getenv("REDIS_IPC_COMPRESSION", "uncompressed")
+    # bounds of the Redis frame cache (redis_cache): total and per-user MB,
+    # and seconds after which an unread entry expires; 0 = no limit
+    redis_cache_mb = int(os.getenv("REDIS_CACHE_MB", 2048))
+    redis_cache_user_mb = int(os.getenv("REDIS_CACHE_USER_MB", 512))
+    redis_cache_idle_ttl = int(os.getenv("REDIS_CACHE_IDLE_TTL", 7 * 24 * 3600))
+    # background warm-up of the overview caches after uploads (warmup):
+    # percent of the time it may spend working, seconds without user
+    # requests before it runs, and recently used files warmed on API start
+    warmup_enabled = os.getenv("WARMUP_ENABLED", "true").lower() in ("true", "1", "t")
+    warmup_cpu_percent = float(os.getenv("WARMUP_CPU_PERCENT", 25))
+    warmup_idle_seconds = float(os.getenv("WARMUP_IDLE_SECONDS", 2))
+    warmup_recent_files = int(os.getenv("WARMUP_RECENT_FILES", 10))
+    # link every parsed upload into the host/day-partitioned dataset of
+    # fleet_store as well (GET /fleet/data)
+    fleet_dataset = os.getenv("FLEET_DATASET", "false").lower() in ("true", "1", "t")
     pdf_name = os.getenv("PDF_NAME", "sar_chart.pdf")
     admin_email = os.getenv("ADMIN_EMAIL", "admin@example-org.com")
     max_metric_header = int(os.getenv("MAX_METRIC_HEADER", 8))
     cols_per_line = int(os.getenv("COLS_PER_LINE", 4))
     max_header_count = int(os.getenv("MAX_HEADER_COUNT", 6))
+    # format of the parsed files: "parquet" or "arrow" (memory-mapped IPC, sar_store)
     file_type = os.getenv("FILE_TYPE", "parquet")
+    # files of at least this size are parsed with the bounded-memory parser
+    parse_streaming_bytes = int(os.getenv("PARSE_STREAMING_BYTES", 256 * 1024 * 1024))
+    parse_chunk_lines = int(os.getenv("PARSE_CHUNK_LINES", 200_000))
+    # files of at least this size are classified by a process pool;
+    # PARSE_WORKERS=1 turns the pool off
+    parse_parallel_bytes = int(os.getenv("PARSE_PARALLEL_BYTES", 32 * 1024 * 1024))
+    parse_workers = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+    # POST /files: uploads parsed side by side in a process pool, and how
+    # many files of one request may be in flight at once
+    upload_workers = int(os.getenv("UPLOAD_WORKERS", os.cpu_count() or 1))
+    upload_concurrency = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+    # layout of the stored parquet files (rows are sorted by header, so
+    # per-header scans skip the row groups of other headers)
+    parquet_row_group_size = int(os.getenv("PARQUET_ROW_GROUP_SIZE", 32_768))
+    parquet_compression = os.getenv("PARQUET_COMPRESSION", "zstd")
+    # compression of FILE_TYPE=arrow files: "uncompressed" keeps reads
+    # zero-copy from the memory map, "lz4" trades that for smaller files
+    arrow_compression = os.getenv("ARROW_COMPRESSION", "uncompressed")
+    # line classifier of the in-memory parser: "python" or "polars" (vectorized)
+    parse_engine = os.getenv("PARSE_ENGINE", "python")
     admin_communication = os.getenv("ADMIN_COMMUNICATION", "slack")
     debug = os.getenv("DEBUG", "True").lower() in ("true", "1", "t")
     use_streamlit_bokeh_component = os.getenv("USE_STREAMLIT_BOKEH_COMPONENT", "True").lower() in (
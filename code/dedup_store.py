@@ -0,0 +1,146 @@
+"""Content-addressed store of parsed uploads.
+
+Users re-upload the same sa file, and several users upload the data of the
+same host. Every upload is hashed while it is spooled (sha256 of the
+decompressed bytes, sar_ingest.spool_upload); the first parse of a content
+is registered here and every later upload of it gets the parsed file and
+typed store as hardlinks instead of being parsed again.
+
+Layout below upload/config/dedup/:
+
+    <digest>/sar.parquet    hardlink of the parsed file (sar.arrow when it
+                            was stored as Arrow IPC, see sar_store)
+    <digest>/sar.typed/     hardlinks of its typed store (header_store)
+    <digest>/name           <hostname>_<sar file date> of the file name
+
+A user's parsed file is another link to the same inode, so its link count is
+the reference count: deleting a user's copy (delete_sar_file,
+cleanup_old_files, the UI) drops one reference, and prune() removes the
+entries only the store itself still holds. Writers must therefore never
+rewrite a parsed file in place - parse_into_polars unlinks before writing.
+
+Hardlinks need the store on the same filesystem as the user directories;
+where linking fails, uploads are simply parsed as before.
+"""
+
+import datetime
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import file_catalog
+import header_store
+import sar_store
+from handle_user_status import get_config_dir
+
+logger = logging.getLogger(__name__)
+
+STORED = "sar"
+NAME = "name"
+
+
+def store_root() -> Path:
+    root = Path(get_config_dir()) / "dedup"
+    root.mkdir(exist_ok=True)
+    return root
+
+
+def _entry(digest: str) -> Path:
+    if not digest.isalnum():
+        raise ValueError(f"invalid digest {digest!r}")
+    return store_root() / digest
+
+
+def _stored(entry: Path) -> Path | None:
+    """The parsed file of a store entry (either format), or None."""
+    for path in sar_store.candidates(entry / STORED):
+        if path.exists():
+            return path
+    return None
+
+
+def lookup(digest: str) -> str | None:
+    """File name a new upload of this content gets, or None if unknown.
+
+    Same scheme as helpers_pl.sar_file_name: the upload date is today's.
+    """
+    entry = _entry(digest)
+    try:
+        suffix = (entry / NAME).read_text()
+    except OSError:
+        return None
+    if _stored(entry) is None:
+        return None
+    return f"{datetime.date.today():%Y-%m-%d}_{suffix}"
+
+
+def link(digest: str, directory: str | Path, name: str) -> Path:
+    """Hardlink the stored parse as `<directory>/<name>` plus its suffix
+    (+ typed store), replacing what is there. Returns the linked path."""
+    source = _stored(_entry(digest))
+    if source is None:
+        raise FileNotFoundError(f"dedup entry {digest} has no parsed file")
+    target = Path(directory) / f"{name}{source.suffix}"
+    # rename() does nothing when both names are links of the same inode
+    if not (target.exists() and os.path.samefile(target, source)):
+        tmp = target.with_name(f".tmp_link_{os.getpid()}_{target.name}")
+        os.link(source, tmp)
+        os.replace(tmp, target)
+    for other in sar_store.candidates(target):
+        if other != target:
+            other.unlink(missing_ok=True)
+    header_store.link_store(source, target)
+    file_catalog.refresh(target)
+    return target
+
+
+def register(digest: str, parquet_file: str | Path) -> None:
+    """Record a freshly parsed upload under its content digest.
+
+    Best effort: a failure only costs the dedup of later uploads.
+    """
+    parquet_file = Path(parquet_file)
+    entry = _entry(digest)
+    if _stored(entry) is not None:
+        return
+    tmp = entry.with_name(f".tmp-{os.getpid()}-{digest}")
+    stored = tmp / f"{STORED}{parquet_file.suffix}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        tmp.mkdir()
+        os.link(parquet_file, stored)
+        header_store.link_store(parquet_file, stored)
+        # <upload date>_<hostname>_<sar file date>
+        (tmp / NAME).write_text(parquet_file.stem.split("_", 1)[1])
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+    except (OSError, IndexError) as exc:
+        logger.warning("dedup: %s not registered: %s", parquet_file.name, exc)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def is_shared(parquet_file: str | Path) -> bool:
+    """True if the parsed file is linked into the store (or elsewhere)."""
+    try:
+        return os.stat(parquet_file).st_nlink > 1
+    except OSError:
+        return False
+
+
+def prune() -> int:
+    """Remove entries no user file links to any more; returns how many."""
+    removed = 0
+    for entry in store_root().iterdir():
+        if entry.name.startswith("."):
+            continue  # register() in progress
+        stored = _stored(entry)
+        try:
+            orphaned = stored is None or stored.stat().st_nlink <= 1
+        except OSError:
+            # interrupted register() or link target gone
+            orphaned = True
+        if orphaned:
+            shutil.rmtree(entry, ignore_errors=True)
+            removed += 1
+    return removed
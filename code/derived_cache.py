@@ -0,0 +1,244 @@
+"""Cache of the per-header chart frames of dia_compute.prepare_df_for_pandas.
+
+Splitting the metrics, filtering devices and time range, create_metrics_df,
+describe() and to_pandas ran again for every header on every "Show
+Diagrams" click and every /charts request, although the result only
+depends on the stored file and (header, device, time range, ...). Results
+are kept in two tiers:
+
+- in memory, LRU bounded by Config.derived_cache_mb (pandas memory usage),
+  shared by the threads of one process;
+- on disk below `<file>.derived/<version>/<key>/` (one Arrow IPC file per
+  frame and its statistics plus meta.json), so other processes and restarts
+  reuse them. At most Config.derived_cache_entries keys are kept per file,
+  the least recently read go first.
+
+The version is the inode, mtime and size of the stored file (sar_store), so
+a re-upload or append is never served stale; older versions are removed
+when the first entry of a new one is written, and `invalidate` removes all
+of a file (delete). A setting of 0 turns the respective tier off.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import polars as pl
+
+import sar_store
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+DERIVED_SUFFIX = ".derived"
+META = "meta.json"
+
+_lock = threading.Lock()
+# (base path, version, key) -> (frames, bytes), least recently used first
+_results: OrderedDict[tuple, tuple[list[dict], int]] = OrderedDict()
+_size = 0
+_counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+
+def derived_dir(file_name: str | Path) -> Path:
+    return Path(f"{sar_store.base_path(file_name)}{DERIVED_SUFFIX}")
+
+
+def _version(file_name: str | Path) -> str | None:
+    try:
+        stat = os.stat(sar_store.stored_file(file_name))
+    except OSError:
+        return None
+    return f"{stat.st_ino}-{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _base(file_name: str | Path) -> str:
+    return os.path.abspath(sar_store.base_path(file_name))
+
+
+def _key(params: dict) -> str:
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()[:32]
+
+
+def _copy(frames: list[dict]) -> list[dict]:
+    # new dicts and shallow frame copies: callers may rebind or add columns
+    return [
+        {**frame, "df": frame["df"].copy(deep=False)} for frame in frames
+    ]
+
+
+def _frames_size(frames: list[dict]) -> int:
+    size = 0
+    for frame in frames:
+        size += int(frame["df"].memory_usage(deep=True).sum())
+        if frame.get("stats_pl") is not None:
+            size += frame["stats_pl"].estimated_size()
+    return size
+
+
+def overview_params(header: str, start, end, alias: str | None) -> dict:
+    """Params of the frames of one header of the graphical overview
+    (dia_overview_pl, warmed by warmup)."""
+    return {
+        "view": "overview",
+        "header": header,
+        "start": start,
+        "end": end,
+        "alias": alias,
+    }
+
+
+def get(file_name: str | Path, params: dict) -> list[dict] | None:
+    """Frames cached for the current version of `file_name`, or None."""
+    version = _version(file_name)
+    if version is None:
+        return None
+    key = (_base(file_name), version, _key(params))
+    with _lock:
+        entry = _results.get(key)
+        if entry is not None:
+            _results.move_to_end(key)
+            _counters["hits"] += 1
+            return _copy(entry[0])
+    frames = _read_disk(file_name, version, key[2])
+    with _lock:
+        _counters["disk_hits" if frames is not None else "misses"] += 1
+    if frames is None:
+        return None
+    _remember(key, frames)
+    return _copy(frames)
+
+
+def put(file_name: str | Path, params: dict, frames: list[dict]) -> None:
+    """Cache the result of prepare_df_for_pandas (or the API's variant of
+    it) for `params` on the current version of `file_name`."""
+    version = _version(file_name)
+    if version is None or not frames:
+        return
+    key = (_base(file_name), version, _key(params))
+    _remember(key, frames)
+    try:
+        _write_disk(file_name, version, key[2], frames)
+    except Exception as e:
+        logger.warning("derived cache: %s not written: %s", file_name, e)
+
+
+def _remember(key: tuple, frames: list[dict]) -> None:
+    global _size
+    budget = Config.derived_cache_mb * 1024 * 1024
+    size = _frames_size(frames)
+    if size > budget:
+        return
+    with _lock:
+        # entries of older versions of the file are of no use any more
+        for old in [k for k in _results if k[0] == key[0] and k[1] != key[1]]:
+            _size -= _results.pop(old)[1]
+        if key in _results:
+            _size -= _results.pop(key)[1]
+        _results[key] = (frames, size)
+        _size += size
+        while _size > budget:
+            _size -= _results.popitem(last=False)[1][1]
+            _counters["evictions"] += 1
+
+
+def _read_disk(file_name, version: str, key: str) -> list[dict] | None:
+    if not Config.derived_cache_entries:
+        return None
+    entry = derived_dir(file_name) / version / key
+    try:
+        meta = json.loads((entry / META).read_text())
+        frames = []
+        for index, item in enumerate(meta):
+            df = sar_store.read(entry / f"{index}.arrow")
+            stats = (
+                sar_store.read(entry / f"{index}.stats.arrow")
+                if item.pop("stats")
+                else None
+            )
+            frames.append(
+                {**item, "df": df.to_pandas().set_index("date"), "stats_pl": stats}
+            )
+        os.utime(entry)  # recency for _trim
+    except (OSError, ValueError, KeyError):
+        return None
+    return frames
+
+
+def _write_disk(file_name, version: str, key: str, frames: list[dict]) -> None:
+    if not Config.derived_cache_entries:
+        return
+    root = derived_dir(file_name)
+    for old in root.glob("*") if root.is_dir() else []:
+        if old.name != version:
+            shutil.rmtree(old, ignore_errors=True)
+    entry = root / version / key
+    if entry.exists():
+        return
+    tmp = entry.with_name(f".tmp-{os.getpid()}-{threading.get_ident()}-{key}")
+    tmp.mkdir(parents=True)
+    try:
+        meta = []
+        for index, frame in enumerate(frames):
+            sar_store.write(
+                pl.from_pandas(frame["df"], include_index=True),
+                tmp / f"{index}.arrow",
+            )
+            stats = frame.get("stats_pl")
+            if stats is not None:
+                sar_store.write(stats, tmp / f"{index}.stats.arrow")
+            meta.append(
+                {
+                    "title": frame["title"],
+                    "sub_title": frame["sub_title"],
+                    "device_num": frame["device_num"],
+                    "stats": stats is not None,
+                }
+            )
+        (tmp / META).write_text(json.dumps(meta))
+        os.replace(tmp, entry)
+    except OSError:
+        # another process wrote the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not entry.exists():
+            raise
+    _trim(root / version)
+
+
+def _trim(version_dir: Path) -> None:
+    entries = []
+    for path in version_dir.iterdir():
+        try:
+            if not path.name.startswith("."):
+                entries.append((path.stat().st_mtime, path))
+        except OSError:
+            continue  # trimmed by another process
+    entries = [path for _, path in sorted(entries)]
+    for old in entries[: max(0, len(entries) - Config.derived_cache_entries)]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def invalidate(file_name: str | Path) -> None:
+    """Forget everything cached for `file_name` (delete)."""
+    global _size
+    base = _base(file_name)
+    with _lock:
+        for key in [k for k in _results if k[0] == base]:
+            _size -= _results.pop(key)[1]
+    shutil.rmtree(derived_dir(file_name), ignore_errors=True)
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "entries": len(_results),
+            "bytes": _size,
+            "budget_bytes": Config.derived_cache_mb * 1024 * 1024,
+            **_counters,
+        }
@@ -0,0 +1,153 @@
+"""Per-device frames of dia_compute_pl.prepare_df_for_pandas, before and after.
+
+Before: one filter over the whole header per device (get_sub_devices_from_df
+plus get_df_from_sub_device), then metric columns and describe() per
+device frame. After: the time range, metric columns and describe() on the
+whole header and one partition_by (pl_helpers2.split_sub_devices,
+describe_sub_devices).
+
+The input is a synthetic per-CPU header of a host with many CPUs ('all',
+0..cpus-1, one sample per minute; the last CPU comes online halfway
+through), shown with every CPU (show_subheaders_for_all, as for headers
+with many block devices or interfaces). Both paths must return the same
+frames and statistics.
+
+    python device_partition_bench.py [cpus] [samples] [repeats]
+"""
+
+import datetime
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("REDIS_ENABLED", "false")
+
+import numpy as np
+import polars as pl
+
+import dia_compute_pl as dia_compute
+import pl_helpers2 as pl_h2
+
+HEADER = "%usr %nice %sys %iowait %steal %irq %soft %guest %gnice %idle"
+
+
+def _metrics_df(cpus: int, samples: int) -> pl.DataFrame:
+    """The layout of header_store.to_metrics_df: date, metrics list,
+    sub_device."""
+    devices = ["all", *(str(cpu) for cpu in range(cpus))]
+    dates = pl.datetime_range(
+        datetime.datetime(2024, 3, 5),
+        datetime.datetime(2024, 3, 5) + datetime.timedelta(minutes=samples - 1),
+        "1m",
+        eager=True,
+    )
+    rng = np.random.default_rng(0)
+    rows = samples * len(devices)
+    typed = pl.DataFrame(
+        {
+            "date": dates.gather(np.repeat(np.arange(samples), len(devices))),
+            "device": np.tile(devices, samples),
+            **{
+                metric: rng.random(rows, dtype=np.float32).round(2) * 100
+                for metric in HEADER.split()
+            },
+        }
+    )
+    # hot-plugged: no samples of the last CPU in the first half
+    typed = typed.filter(
+        (pl.col("device") != devices[-1]) | (pl.col("date") >= dates[samples // 2])
+    )
+    return typed.select(
+        "date",
+        pl.concat_list(HEADER.split()).alias(HEADER),
+        pl.col("device").alias("sub_device"),
+    )
+
+
+def _per_device_filter(df: pl.DataFrame, start, end) -> list[dict]:
+    """prepare_df_for_pandas for a device header as it was: a filter over
+    the whole frame per device."""
+    collect_field = []
+    device_list = pl_h2.get_sub_devices_from_df(df, "sub_device")
+    device_list.sort()
+    device_num = len(device_list) - 1 if "all" in device_list else 1
+    for device in device_list:
+        device_df = pl_h2.get_df_from_sub_device(df, "sub_device", device)
+        if start in device_df["date"] and end in device_df["date"]:
+            device_df = pl_h2.get_date_df(device_df, "date", start, end)
+        device_df = pl_h2.create_metrics_df(device_df, HEADER)
+        numeric_cols = [
+            c for c, t in zip(device_df.columns, device_df.dtypes) if t.is_numeric()
+        ]
+        collect_field.append(
+            {
+                "df": device_df.to_pandas().set_index("date"),
+                "title": "CPU",
+                "device_num": device_num,
+                "sub_title": device,
+                "stats_pl": device_df.select(numeric_cols).describe(),
+            }
+        )
+    return collect_field
+
+
+def _partitioned(df: pl.DataFrame, start, end) -> list[dict]:
+    return dia_compute.prepare_df_for_pandas(
+        df[:, :2],
+        start,
+        end,
+        show_subheaders_for_all=True,
+        alias="CPU",
+        metrics_df=df,
+    )
+
+
+def _same(old: list[dict], new: list[dict]) -> bool:
+    if len(old) != len(new):
+        return False
+    for a, b in zip(old, new):
+        if (a["title"], a["device_num"], a["sub_title"]) != (
+            b["title"],
+            b["device_num"],
+            b["sub_title"],
+        ):
+            return False
+        if not a["df"].equals(b["df"]) or list(a["df"].dtypes) != list(b["df"].dtypes):
+            return False
+        if not a["stats_pl"].equals(b["stats_pl"]):
+            return False
+    return True
+
+
+def _median_time(func, repeats: int, *args) -> tuple[float, list[dict]]:
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs), result
+
+
+def bench(cpus: int, samples: int, repeats: int) -> None:
+    df = _metrics_df(cpus, samples)
+    dates = df["date"].unique().sort()
+    print(f"{cpus} CPUs, {samples} samples: {df.height} rows")
+    for label, start, end in (
+        ("full range", dates[0], dates[-1]),
+        ("middle half", dates[len(dates) // 4], dates[3 * len(dates) // 4]),
+    ):
+        old_time, old = _median_time(_per_device_filter, repeats, df, start, end)
+        new_time, new = _median_time(_partitioned, repeats, df, start, end)
+        speedup = old_time / new_time if new_time else float("inf")
+        print(
+            f"{label:12} {old_time * 1000:9.1f}ms -> {new_time * 1000:8.1f}ms "
+            f"({speedup:5.1f}x)  same result: {_same(old, new)}"
+        )
+
+
+if __name__ == "__main__":
+    cpus = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 1440
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    bench(cpus, samples, repeats)
@@ -10,6 +10,15 @@ from config import Config
 from typing import Any
 import time
 
+# headers preselected in the graphical overview (and GET /charts/overview)
+DEFAULT_OVERVIEW_ALIASES = [
+    'CPU',
+    'Kernel tables',
+    'Load',
+    'Memory utilization',
+    'Swap utilization',
+]
+
 def prepare_df_for_pandas(
         df: pl.DataFrame,
         start: Any,
@@ -17,6 +26,7 @@ def prepare_df_for_pandas(
         show_subheaders_for_all: bool = False,
         alias: str | None = None,
         sub_device_key: str | bool | None = None,
+        metrics_df: pl.DataFrame | None = None,
     ) -> list[dict]:
     df_field = []
     collect_field = []
@@ -30,14 +40,20 @@ def prepare_df_for_pandas(
     title = alias
     
     # 2. Handle Sub-device (Prefer pre-calculated to avoid cache lock)
-    if sub_device_key is None:
+    if metrics_df is not None:
+        sub_device = 'sub_device' in metrics_df.columns
+    elif sub_device_key is None:
         sub_device = pl_h2.get_sub_device_from_header(header_pure)
     else:
         sub_device = sub_device_key
 
     sub_title = ""
     device_num = 1
-    df = pl_h2.get_metrics_from_df(df, header_pure, alias, sub_device_key=sub_device)
+    if metrics_df is not None:
+        # already split metrics from the typed store (header_store)
+        df = metrics_df
+    else:
+        df = pl_h2.get_metrics_from_df(df, header_pure, alias, sub_device_key=sub_device)
 
     if not sub_device:
         df_field.append([df, 0])
@@ -47,13 +63,23 @@ def prepare_df_for_pandas(
         device_num = len(pl_h2.get_sub_devices_from_df(df, 'sub_device')) -1
         df_field.append([device_df, device])
     else:
-        device_list = pl_h2.get_sub_devices_from_df(df, 'sub_device')
-        device_list.sort()
+        # All devices in one pass over the header: time range, metric columns
+        # and describe() on the whole frame, then one partition_by. Filtering
+        # the header once per device was O(devices x rows).
+        df = _get_date_df_per_device(df, start, end)
+        df = pl_h2.create_metrics_df(df, header_pure, drop_sub_device=False)
+        stats = pl_h2.describe_sub_devices(df, 'sub_device')
+        device_frames = pl_h2.split_sub_devices(df, 'sub_device')
+        device_list = sorted(device_frames)
+        if 'all' in device_list:
+            device_num = len(device_list) -1
         for device in device_list:
-            device_df = pl_h2.get_df_from_sub_device(df, 'sub_device', device)
-            df_field.append([device_df, device])
-            if 'all' in device_list:
-                device_num = len(device_list) -1
+            if device:
+                sub_title = device
+            collect_field.append(_collect_entry(
+                device_frames[device].drop('sub_device'), title, device_num,
+                sub_title, stats.get(device)))
+        return collect_field
 
     for df_tuple in df_field:
         if df_tuple[1]:
@@ -72,16 +98,29 @@ def prepare_df_for_pandas(
             if numeric_cols:
                 stats_pl = df.select(numeric_cols).describe()
         
-        df_pandas = df.to_pandas().set_index('date')
-        collect_field.append({
-            'df' :df_pandas, 
-            'title' : title, 
-            'device_num' : device_num, 
-            'sub_title' : sub_title,
-            'stats_pl': stats_pl
-        })
+        collect_field.append(
+            _collect_entry(df, title, device_num, sub_title, stats_pl))
     return collect_field
 
+def _collect_entry(df: pl.DataFrame, title: str, device_num: int,
+        sub_title: str, stats_pl: pl.DataFrame | None) -> dict:
+    return {
+        'df' : df.to_pandas().set_index('date'),
+        'title' : title,
+        'device_num' : device_num,
+        'sub_title' : sub_title,
+        'stats_pl': stats_pl
+    }
+
+def _get_date_df_per_device(df: pl.DataFrame, start: Any, end: Any) -> pl.DataFrame:
+    """pl_h2.get_date_df for the devices whose samples include both `start`
+    and `end`; the others are kept whole, as in the single frame path."""
+    if start is None or end is None:
+        return df
+    in_range = ((pl.col('date') == start).any()
+        & (pl.col('date') == end).any()).over('sub_device')
+    return df.filter(~in_range | pl.col('date').is_between(start, end))
+
 def prepare_single_device_for_pandas(df: pl.DataFrame, start: pl.datetime,  
     end: pl.datetime, device: str, file_name:str) -> pl.DataFrame:
     collect_field = []
@@ -7,6 +7,8 @@ import pl_helpers2 as pl_helpers
 import helpers_pl
 import polars as pl
 import dia_compute_pl as dia_compute
+import derived_cache
+import header_store
 import multi_pdf as mpdf
 import layout_helper_pl as lh
 import bokeh_charts
@@ -294,8 +296,7 @@ def show_dia_overview(username: str, sar_file_col: st.delta_generator.DeltaGener
     sar_file = f'{Config.upload_dir}/{username}/{sar_file}'
     headers = pl_helpers.get_headers(df)
     restart_headers = pl_helpers.get_restart_headers(df)
-    initial_aliases = ['CPU', 'Kernel tables', 'Load', 'Memory utilization',
-    'Swap utilization']
+    initial_aliases = list(dia_compute.DEFAULT_OVERVIEW_ALIASES)
     full_alias_d = helpers_pl.translate_headers(headers)
     full_alias_l = list(full_alias_d.values())
     full_alias_l.sort(reverse=True)
@@ -526,8 +527,34 @@ Please reduce your selection to {MAX_CHARTS} or fewer metrics to prevent browser
                                 'sub_device_key': pl_helpers.get_sub_device_from_header(h)
                             }
 
+                    with (perf.phase('derived_cache.get') if perf else _noop_phase()):
+                        # Frames prepared before for this file version and
+                        # time range (derived_cache); only the rest is computed.
+                        cache_params = {
+                            h: derived_cache.overview_params(
+                                h, start, end, header_props_cache[h]['alias'])
+                            for h in header_list
+                        }
+                        todo_list = []
+                        for h in header_list:
+                            cached = derived_cache.get(sar_file, cache_params[h])
+                            if cached is None:
+                                todo_list.append(h)
+                            else:
+                                st_collect_list_pandas.append(cached)
+
                     with (perf.phase('polars.get_data_frames_from__headers') if perf else _noop_phase()):
-                        df_list = pl_helpers.get_data_frames_from__headers(header_list, df, "header")
+                        df_list = pl_helpers.get_data_frames_from__headers(todo_list, df, "header") if todo_list else []
+
+                    with (perf.phase('header_store.load_metrics_df') if perf else _noop_phase()):
+                        # Ready-split metrics from the typed store; headers it
+                        # cannot provide are parsed from the data strings.
+                        metrics_dfs = {}
+                        for h in todo_list:
+                            try:
+                                metrics_dfs[h] = header_store.load_metrics_df(sar_file, h)
+                            except Exception:
+                                metrics_dfs[h] = None
 
                     with (perf.phase('prepare_df_for_pandas (Parallel)') if perf else _noop_phase()):
                         # polars/pandas work here releases the GIL and scales well with
@@ -544,13 +571,16 @@ Please reduce your selection to {MAX_CHARTS} or fewer metrics to prevent browser
                                     start, 
                                     end, 
                                     alias=header_props_cache.get(pl_df.columns[1], {}).get('alias'),
-                                    sub_device_key=header_props_cache.get(pl_df.columns[1], {}).get('sub_device_key')
+                                    sub_device_key=header_props_cache.get(pl_df.columns[1], {}).get('sub_device_key'),
+                                    metrics_df=metrics_dfs.get(pl_df.columns[1])
                                 ): pl_df for pl_df in df_list
                             }
                             for future in as_completed(f_prep):
                                 try:
                                     df_result = future.result()
                                     st_collect_list_pandas.append(df_result)
+                                    derived_cache.put(
+                                        sar_file, cache_params[f_prep[future].columns[1]], df_result)
                                 except Exception as e:
                                     st.error(f"Error processing header: {e}")
                     collect_list_pandas = [
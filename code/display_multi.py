@@ -6,6 +6,7 @@ import alt
 import bokeh_charts
 import streamlit_bokeh_component as st_bokeh
 import pl_helpers2 as pl_h2
+import header_store
 import sqlite2_polars as s2p
 import layout_helper_pl as lh
 import sqlite2_polars
@@ -73,7 +74,7 @@ def show_multi(config_obj, username, selection, df, os_details):
     large_df_key = f"large_df_{file_name}_{header}_obj"
     if device_list_state:
         if not device_list_state[1] == sar_file:
-            large_df = pl_h2.get_metrics_from_df(df, headerline, selected)
+            large_df = header_store.get_metrics_df(sar_file, headerline, df, selected)
             device_list = pl_h2.get_sub_devices_from_df(large_df, "sub_device")
             device_list.sort()
             if "all" in device_list:
@@ -89,12 +90,12 @@ def show_multi(config_obj, username, selection, df, os_details):
             if st.session_state.get(large_df_key, []):
                 large_df = st.session_state.get(large_df_key)[0]
             else:
-                large_df = pl_h2.get_metrics_from_df(df, headerline, selected)
+                large_df = header_store.get_metrics_df(sar_file, headerline, df, selected)
                 helpers_pl.set_state_key(
                     large_df_key, value=large_df, change_key=sar_file
                 )
     else:
-        large_df = pl_h2.get_metrics_from_df(df, headerline, selected)
+        large_df = header_store.get_metrics_df(sar_file, headerline, df, selected)
         device_list = pl_h2.get_sub_devices_from_df(large_df, "sub_device")
         device_list.sort()
         if "all" in device_list:
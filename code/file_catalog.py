@@ -0,0 +1,317 @@
+"""Per-user catalog of the uploaded sar files (upload/config/catalog.db).
+
+File pickers (UI) and GET /files used to list the user directory and stat
+every file on each render, and knew nothing about a file without loading
+it. The catalog keeps one row per file and user:
+
+    name                 '<upload date>_<host>_<sar date>' (no suffix)
+    stored               suffix of the parsed file (sar_store), NULL while
+                         only the uploaded text exists
+    size_bytes           uploaded text, else the parsed file (as listed before)
+    host, sar_date       from the 'Linux ...' line / the file name
+    start_time, end_time first and last sample
+    restarts             number of RESTART records
+    headers, devices     JSON: headers in file order, {header: [devices]}
+
+Writers call `refresh(path)` after a file was parsed, appended, linked,
+uploaded or deleted; it looks at the disk and updates or removes the row.
+A user directory is scanned once when its catalog is first read. With
+FLEET_DATASET on, refresh also links parsed files into fleet_store. Files
+changed behind the catalog's back are picked up by a rebuild, which
+recreates the fleet dataset too:
+
+    python file_catalog.py rebuild [upload_dir]
+"""
+
+import contextlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+import polars as pl
+
+import fleet_store
+import header_store
+import sar_store
+from config import Config
+from handle_user_status import get_config_dir
+
+logger = logging.getLogger(__name__)
+
+# user directories that hold no uploads (see api.services.EXCLUDED_UPLOAD_DIRS)
+EXCLUDED_DIRS = {"config"}
+
+_SCHEMA = (
+    """
+CREATE TABLE IF NOT EXISTS files (
+    username TEXT NOT NULL,
+    name TEXT NOT NULL,
+    stored TEXT,
+    size_bytes INTEGER NOT NULL,
+    host TEXT,
+    sar_date TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    restarts INTEGER,
+    headers TEXT,
+    devices TEXT,
+    PRIMARY KEY (username, name)
+)
+""",
+    """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY
+)
+""",
+)
+_HOST = re.compile(r"\(([^)]+)\)")
+_DATE = re.compile(r"_(\d{4}-\d{2}-\d{2})$")
+
+
+def _db_path() -> str:
+    return str(Path(get_config_dir()) / "catalog.db")
+
+
+@contextlib.contextmanager
+def _connect():
+    """One transaction on the catalog; commits, then closes."""
+    conn = sqlite3.connect(_db_path(), timeout=30)
+    try:
+        conn.row_factory = sqlite3.Row
+        # pickers read while uploads of other sessions write
+        conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _is_upload(name: str) -> bool:
+    # spooled uploads (.tmp_<name>) and other dot files are not listed
+    return not name.startswith(".")
+
+
+def _describe(directory: Path, name: str) -> dict | None:
+    """Catalog row of `<directory>/<name>` from the disk, None if gone."""
+    raw = directory / name
+    stored = sar_store.stored_file(raw)
+    raw_exists, stored_exists = raw.is_file(), stored.is_file()
+    if not raw_exists and not stored_exists:
+        return None
+    row = {
+        "username": directory.name,
+        "name": name,
+        "stored": stored.suffix if stored_exists else None,
+        "size_bytes": (raw if raw_exists else stored).stat().st_size,
+        "host": None,
+        "sar_date": None,
+        "start_time": None,
+        "end_time": None,
+        "restarts": None,
+        "headers": None,
+        "devices": None,
+    }
+    if stored_exists:
+        try:
+            row.update(_contents(stored, name))
+        except Exception as e:
+            # listed like before, only without the contents
+            logger.warning("catalog: %s not readable: %s", stored, e)
+    return row
+
+
+def _contents(stored: Path, name: str) -> dict:
+    lf = sar_store.scan(stored)
+    columns = lf.collect_schema().names()
+    restart = (
+        pl.col("restart").str.contains("RESTART").sum()
+        if "restart" in columns
+        else pl.lit(0)
+    )
+    headers, start, end, os_details, restarts = (
+        lf.select(
+            pl.col("header").drop_nulls().unique(maintain_order=True).implode(),
+            pl.col("date").min().alias("start"),
+            pl.col("date").max().alias("end"),
+            pl.col("os_details")
+            .filter(pl.col("os_details").str.contains("Linux"))
+            .first(),
+            restart,
+        )
+        .collect()
+        .row(0)
+    )
+    host = _HOST.search(os_details or "")
+    sar_date = _DATE.search(name)
+    if sar_date is not None:
+        sar_date = sar_date.group(1)
+    elif start is not None:
+        sar_date = start.date().isoformat()
+    try:
+        devices = header_store.read_devices(stored)
+    except Exception as e:
+        logger.warning("catalog: no devices for %s: %s", stored, e)
+        devices = {}
+    return {
+        "host": host.group(1) if host else None,
+        "sar_date": sar_date,
+        "start_time": None if start is None else str(start),
+        "end_time": None if end is None else str(end),
+        "restarts": int(restarts or 0),
+        "headers": json.dumps(headers),
+        "devices": json.dumps(devices),
+    }
+
+
+def _store(conn, username: str, name: str, row: dict | None) -> None:
+    if row is None:
+        conn.execute(
+            "DELETE FROM files WHERE username = ? AND name = ?", (username, name)
+        )
+        return
+    columns = ", ".join(row)
+    conn.execute(
+        f"INSERT OR REPLACE INTO files ({columns}) VALUES "
+        f"({', '.join('?' for _ in row)})",
+        tuple(row.values()),
+    )
+
+
+def refresh(path: str | Path) -> None:
+    """Update the row of one file of a user directory from the disk: the
+    uploaded text or parsed file (either suffix) at `path`. A file that no
+    longer exists is removed. Files outside the user directories of
+    Config.upload_dir (parity checks, benches, temp dirs) are ignored.
+    Never raises; a failed update is logged and left to the next rebuild."""
+    path = Path(path)
+    directory, name = path.parent, Path(sar_store.base_path(path)).name
+    if directory.resolve().parent != Path(Config.upload_dir).resolve():
+        return
+    if directory.name in EXCLUDED_DIRS or not _is_upload(name):
+        return
+    try:
+        row = _describe(directory, name)
+        with _connect() as conn:
+            _store(conn, directory.name, name, row)
+    except Exception as e:
+        logger.warning("catalog: %s not updated: %s", path, e)
+        return
+    _sync_fleet(directory, name, row)
+
+
+def _sync_fleet(directory: Path, name: str, row: dict | None) -> None:
+    """Link a parsed file into fleet_store (FLEET_DATASET), or drop it."""
+    if not Config.fleet_dataset:
+        return
+    try:
+        if row and row["stored"] and row["host"] and row["sar_date"]:
+            fleet_store.add(
+                directory / f"{name}{row['stored']}",
+                directory.name,
+                name,
+                row["host"],
+                row["sar_date"],
+            )
+        else:
+            fleet_store.remove(directory.name, name)
+    except Exception as e:
+        logger.warning("fleet dataset: %s/%s not updated: %s", directory, name, e)
+
+
+def refresh_user(username: str, fleet: bool = False) -> int:
+    """Rebuild the rows of one user from the user directory; returns the
+    number of files. With `fleet`, the user's fleet_store dataset is
+    recreated as well."""
+    directory = Path(Config.upload_dir) / username
+    entries = os.listdir(directory) if directory.is_dir() else []
+    names = sorted(
+        {
+            sar_store.base_path(entry)
+            for entry in entries
+            if _is_upload(entry) and (directory / entry).is_file()
+        }
+    )
+    rows = [_describe(directory, name) for name in names]
+    rows = [row for row in rows if row is not None]
+    with _connect() as conn:
+        conn.execute("DELETE FROM files WHERE username = ?", (username,))
+        for row in rows:
+            _store(conn, username, row["name"], row)
+        conn.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
+    if fleet and Config.fleet_dataset:
+        fleet_store.clear(username)
+        for row in rows:
+            _sync_fleet(directory, row["name"], row)
+    return len(rows)
+
+
+def rebuild() -> dict[str, int]:
+    """Recover the whole catalog (and fleet_store dataset) from the upload
+    directory: files per user."""
+    base = Path(Config.upload_dir)
+    users = sorted(
+        entry.name
+        for entry in (base.iterdir() if base.is_dir() else [])
+        if entry.is_dir() and entry.name not in EXCLUDED_DIRS
+    )
+    with _connect() as conn:
+        conn.execute("DELETE FROM files")
+        conn.execute("DELETE FROM users")
+    if Config.fleet_dataset:
+        fleet_store.clear()
+    return {user: refresh_user(user, fleet=True) for user in users}
+
+
+def _as_dict(row: sqlite3.Row) -> dict:
+    return {
+        "name": row["name"],
+        "size_bytes": row["size_bytes"],
+        "parsed": row["stored"] is not None,
+        "host": row["host"],
+        "sar_date": row["sar_date"],
+        "start": row["start_time"],
+        "end": row["end_time"],
+        "restarts": row["restarts"],
+        "headers": json.loads(row["headers"]) if row["headers"] else [],
+        "devices": json.loads(row["devices"]) if row["devices"] else {},
+    }
+
+
+def files(username: str) -> list[dict]:
+    """Catalog rows of a user's files, sorted by name. The user directory
+    is scanned on the first call for a user."""
+    with _connect() as conn:
+        known = conn.execute(
+            "SELECT 1 FROM users WHERE username = ?", (username,)
+        ).fetchone()
+    if known is None:
+        refresh_user(username)
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT * FROM files WHERE username = ? ORDER BY name", (username,)
+        ).fetchall()
+    return [_as_dict(row) for row in rows]
+
+
+def names(username: str) -> list[str]:
+    """Names of a user's files for the file pickers."""
+    return [entry["name"] for entry in files(username)]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print(__doc__)
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) > 2:
+        Config.upload_dir = sys.argv[2]
+    counts = rebuild()
+    for user, count in counts.items():
+        print(f"{user}: {count} files")
+    print(f"{sum(counts.values())} files of {len(counts)} users in the catalog")
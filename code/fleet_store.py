@@ -0,0 +1,143 @@
+"""Host/day-partitioned dataset of all parsed uploads (FLEET_DATASET).
+
+Comparing weeks of one host, or many hosts on one day, meant loading every
+file on its own. With Config.fleet_dataset on, the typed header files of
+every parsed upload (header_store) are also linked into one hive-partitioned
+dataset below upload/config/fleet/:
+
+    user=<user>/host=<host>/day=<sar date>/header=<header>/<file name>.parquet
+
+Partition values are percent-encoded (headers contain spaces, '%' and
+'/'). The partition is called `day` because the typed files have a `date`
+column already. `scan` reads one header of any set of hosts and days as a
+single scan_parquet; polars skips the partitions the filters exclude.
+
+Files are hardlinks of the typed store (no copy; a copy where linking
+fails). The latest upload of a host and day replaces earlier ones.
+file_catalog.refresh keeps the dataset in line with the user directories,
+and `python file_catalog.py rebuild` recreates it. The per-file store is
+unchanged; this is a second index of the same data.
+"""
+
+import datetime
+import logging
+import os
+import shutil
+from pathlib import Path
+from urllib.parse import quote
+
+import polars as pl
+
+import header_store
+from handle_user_status import get_config_dir
+
+logger = logging.getLogger(__name__)
+
+FLEET_DIR = "fleet"
+HIVE_SCHEMA = {
+    "user": pl.String,
+    "host": pl.String,
+    "day": pl.Date,
+    "header": pl.String,
+}
+
+
+def root() -> Path:
+    return Path(get_config_dir()) / FLEET_DIR
+
+
+def _value(value: str) -> str:
+    return quote(str(value), safe="")
+
+
+def _user_dir(username: str) -> Path:
+    return root() / f"user={_value(username)}"
+
+
+def _partition(username: str, host: str, day: str, header: str) -> Path:
+    return (
+        _user_dir(username)
+        / f"host={_value(host)}"
+        / f"day={_value(day)}"
+        / f"header={_value(header)}"
+    )
+
+
+def _prune(directory: Path, stop: Path) -> None:
+    """Remove `directory` and its parents up to `stop` while empty."""
+    while directory != stop and directory.is_relative_to(stop):
+        try:
+            directory.rmdir()
+        except OSError:
+            return
+        directory = directory.parent
+
+
+def add(
+    stored_file: str | Path, username: str, name: str, host: str, day: str
+) -> int:
+    """Link the typed headers of one parsed upload into the dataset, in
+    place of earlier files of the same host and day. Returns the number of
+    headers linked."""
+    manifest = header_store.read_manifest(stored_file)
+    if manifest is None:
+        return 0
+    remove(username, name)
+    store = header_store.store_dir(stored_file)
+    target_name = f"{name}.parquet"
+    for entry in manifest["headers"]:
+        directory = _partition(username, host, day, entry["header"])
+        directory.mkdir(parents=True, exist_ok=True)
+        for old in directory.glob("*.parquet"):
+            if old.name != target_name:
+                old.unlink(missing_ok=True)
+        # no .parquet suffix: scans must not see it half written
+        tmp = directory / f".tmp-{os.getpid()}-{name}"
+        try:
+            os.link(store / entry["file"], tmp)
+        except OSError:
+            shutil.copyfile(store / entry["file"], tmp)
+        os.replace(tmp, directory / target_name)
+    return len(manifest["headers"])
+
+
+def remove(username: str, name: str) -> None:
+    """Drop the files of one upload (deleted, or about to be re-linked)."""
+    user_dir = _user_dir(username)
+    if not user_dir.is_dir():
+        return
+    for path in user_dir.glob(f"host=*/day=*/header=*/{name}.parquet"):
+        path.unlink(missing_ok=True)
+        _prune(path.parent, user_dir)
+
+
+def clear(username: str | None = None) -> None:
+    """Remove the dataset of one user, or all of it (rebuild)."""
+    shutil.rmtree(_user_dir(username) if username else root(), ignore_errors=True)
+
+
+def scan(
+    username: str,
+    header: str,
+    hosts: list[str] | None = None,
+    start: datetime.datetime | None = None,
+    end: datetime.datetime | None = None,
+) -> pl.LazyFrame | None:
+    """One header of a user's uploads as a LazyFrame: the typed columns
+    (date, [device], metrics...) plus `host` and `day`. `hosts` and the
+    `start`/`end` datetimes select partitions before any file is opened.
+    None if the dataset holds nothing for the header."""
+    user_dir = _user_dir(username)
+    pattern = f"host=*/day=*/header={_value(header)}/*.parquet"
+    if not any(user_dir.glob(pattern)):
+        return None
+    lf = pl.scan_parquet(
+        user_dir / pattern, hive_partitioning=True, hive_schema=HIVE_SCHEMA
+    )
+    if hosts:
+        lf = lf.filter(pl.col("host").is_in(hosts))
+    if start is not None:
+        lf = lf.filter(pl.col("day") >= start.date(), pl.col("date") >= start)
+    if end is not None:
+        lf = lf.filter(pl.col("day") <= end.date(), pl.col("date") <= end)
+    return lf.drop("user", "header")
@@ -0,0 +1,93 @@
+"""Process-wide LRU cache of parsed frames.
+
+parse_into_polars.get_data_frame used to re-read the parquet (or pull the
+whole Redis entry) on every Streamlit rerun and API request. The decoded
+frames are kept here instead, keyed by the stored file's path, mtime and
+size, so a rewritten file (re-upload, append) is never served stale. The
+cache is bounded by Config.frame_cache_mb of DataFrame.estimated_size();
+the least recently used frames are dropped first. The UI, the API and the
+MCP server (which goes through the API) share it within their process.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import polars as pl
+
+from config import Config
+
+_lock = threading.Lock()
+# (path, mtime_ns, size) -> (frame, estimated bytes), least recently used first
+_frames: OrderedDict[tuple, tuple[pl.DataFrame, int]] = OrderedDict()
+_size = 0
+_counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _budget() -> int:
+    return Config.frame_cache_mb * 1024 * 1024
+
+
+def _key(parquet_file: str | Path) -> tuple | None:
+    try:
+        stat = os.stat(parquet_file)
+    except OSError:
+        return None
+    return os.path.abspath(parquet_file), stat.st_mtime_ns, stat.st_size
+
+
+def _drop(key: tuple) -> None:
+    global _size
+    _, size = _frames.pop(key)
+    _size -= size
+
+
+def get(parquet_file: str | Path) -> pl.DataFrame | None:
+    """The cached frame of the current version of `parquet_file`, or None."""
+    key = _key(parquet_file)
+    with _lock:
+        entry = _frames.get(key) if key else None
+        if entry is None:
+            _counters["misses"] += 1
+            return None
+        _frames.move_to_end(key)
+        _counters["hits"] += 1
+    # a shallow copy: in-place changes of the caller stay out of the cache
+    return entry[0].clone()
+
+
+def put(parquet_file: str | Path, df: pl.DataFrame) -> None:
+    """Cache `df` as the content of `parquet_file` as it is now."""
+    global _size
+    key = _key(parquet_file)
+    size = df.estimated_size()
+    if key is None or size > _budget():
+        return
+    with _lock:
+        # older versions of the file are of no use any more
+        for old in [k for k in _frames if k[0] == key[0]]:
+            _drop(old)
+        _frames[key] = (df, size)
+        _size += size
+        while _size > _budget():
+            _drop(next(iter(_frames)))
+            _counters["evictions"] += 1
+
+
+def invalidate(parquet_file: str | Path) -> None:
+    """Forget every cached version of `parquet_file` (deleted files)."""
+    path = os.path.abspath(parquet_file)
+    with _lock:
+        for key in [k for k in _frames if k[0] == path]:
+            _drop(key)
+
+
+def stats() -> dict:
+    with _lock:
+        return {
+            "entries": len(_frames),
+            "bytes": _size,
+            "budget_bytes": _budget(),
+            **_counters,
+        }
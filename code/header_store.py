@@ -0,0 +1,536 @@
+"""Typed per-header storage written next to the parsed parquet file.
+
+The parquet written by parse_into_polars keeps the metrics of a row in one
+free-text ``data`` column, and pl_helpers2.get_metrics_from_df used to split
+and cast that string again on every view. At ingest every header is now also
+written to its own parquet file below ``<file>.typed/``: one Float32 column
+per metric plus a categorical ``device`` column for headers with sub-devices
+(CPU, DEV, IFACE, FILESYSTEM, ...). A manifest maps headers to files and
+records which parquet file the store was built from. Headers with long
+series also get min/max/mean levels (pyramid.build_levels) in
+``h<index>.x<rows per bucket>.parquet``; read_level picks one by a point
+budget. ``stats.parquet`` holds the describe() statistics of every header,
+device and metric over the whole file (read_stats), so full-range
+statistics need no data rows.
+
+Files parsed before the store existed (or changed since) are migrated on
+first access, or in bulk:
+
+    python header_store.py migrate [upload_dir]
+"""
+
+import json
+import os
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import polars as pl
+
+import pyramid
+import sar_store
+
+STORE_SUFFIX = ".typed"
+MANIFEST = "manifest.json"
+STATS = "stats.parquet"
+STORE_VERSION = 3  # 2: pyramid levels, 3: statistics
+# the rows of pandas' DataFrame.describe(), in its order
+STATISTICS = ("count", "mean", "std", "min", "25%", "50%", "75%", "max")
+# parsed stats.parquet of the most recently read stores
+STATS_CACHE_FILES = 256
+
+_stats_lock = threading.Lock()
+_stats_cache: OrderedDict[Path, tuple[tuple, dict]] = OrderedDict()
+# store builds of one file are serialized (rebuilds also start from reads:
+# read_manifest); reentrant, write_store runs inside update_store
+_build_locks = [threading.RLock() for _ in range(64)]
+
+
+def base_path(file_name: str | Path) -> str:
+    """'<dir>/<name>' for both '<dir>/<name>' and its stored file."""
+    return sar_store.base_path(file_name)
+
+
+def store_dir(file_name: str | Path) -> Path:
+    return Path(f"{base_path(file_name)}{STORE_SUFFIX}")
+
+
+def _source_stamp(parquet_file: Path) -> dict:
+    stat = parquet_file.stat()
+    return {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+
+
+def _typed_frame(df: pl.DataFrame, header: str) -> tuple[pl.DataFrame, bool]:
+    """(date, data) rows of one header -> date, [device], one column per metric.
+
+    A leading device token is detected from the data itself: rows carrying
+    one token more than the header has metrics belong to a sub-device header.
+    """
+    metrics = header.split()
+    tokens = df.select(
+        pl.col("date"), pl.col("data").str.extract_all(r"\S+").alias("_tokens")
+    )
+    device = tokens.height > 0 and tokens["_tokens"].list.len().max() > len(metrics)
+    offset = 1 if device else 0
+    columns = [pl.col("date")]
+    if device:
+        columns.append(
+            pl.col("_tokens").list.get(0).cast(pl.Categorical).alias("device")
+        )
+    columns.extend(
+        pl.col("_tokens")
+        .list.get(index + offset, null_on_oob=True)
+        .cast(pl.Float32, strict=False)
+        .round(2)
+        .alias(metric)
+        for index, metric in enumerate(metrics)
+    )
+    return tokens.select(columns), device
+
+
+def _header_stats(typed: pl.DataFrame, header: str, device: bool) -> pl.DataFrame:
+    """describe() statistics of a typed frame: one row per device and metric
+    (header, device, metric, *STATISTICS); device is null without devices.
+
+    Like pandas, std has one degree of freedom and the quartiles are
+    interpolated linearly; nulls are not counted.
+    """
+    keys = ["device"] if device else []
+    value = pl.col("value")
+    if device:
+        typed = typed.with_columns(pl.col("device").cast(pl.String))
+    return (
+        typed.unpivot(index=["date", *keys], variable_name="metric", value_name="value")
+        .with_columns(value.cast(pl.Float64))
+        .group_by([*keys, "metric"], maintain_order=True)
+        .agg(
+            value.count().cast(pl.Float64).alias("count"),
+            value.mean().alias("mean"),
+            value.std().alias("std"),
+            value.min().alias("min"),
+            value.quantile(0.25, "linear").alias("25%"),
+            value.quantile(0.5, "linear").alias("50%"),
+            value.quantile(0.75, "linear").alias("75%"),
+            value.max().alias("max"),
+        )
+        .select(
+            pl.lit(header).alias("header"),
+            (pl.col("device") if device else pl.lit(None, pl.String)).alias("device"),
+            "metric",
+            "count",
+            # the precision of the metric columns, like describe() of them
+            pl.col(STATISTICS[1:]).cast(pl.Float32),
+        )
+    )
+
+
+def _write_header(
+    directory: Path, file: str, df: pl.DataFrame, header: str
+) -> tuple[dict, pl.DataFrame]:
+    """Typed file and pyramid levels of one header; returns its manifest
+    entry and its statistics (_header_stats)."""
+    typed, device = _typed_frame(df, header)
+    typed.write_parquet(directory / file)
+    levels = {}
+    for factor, level in pyramid.build_levels(typed, device).items():
+        levels[str(factor)] = f"{Path(file).stem}.x{factor}.parquet"
+        level.write_parquet(directory / levels[str(factor)])
+    entry = {
+        "header": header,
+        "file": file,
+        "device": device,
+        "rows": typed.height,
+        "levels": levels,
+    }
+    return entry, _header_stats(typed, header, device)
+
+
+def _write_stats(directory: Path, stats: list[pl.DataFrame]) -> None:
+    if stats:
+        pl.concat(stats).write_parquet(directory / STATS)
+
+
+def _entry_files(entry: dict) -> list[str]:
+    return [entry["file"], *entry.get("levels", {}).values()]
+
+
+def _build_lock(file_name: str | Path) -> threading.RLock:
+    key = os.path.abspath(base_path(file_name))
+    return _build_locks[hash(key) % len(_build_locks)]
+
+
+def _own_name(target: Path, kind: str) -> Path:
+    """'<target>.<kind>-<pid>-<thread>': not shared with other builders."""
+    return target.with_name(
+        f"{target.name}.{kind}-{os.getpid()}-{threading.get_ident()}"
+    )
+
+
+def _tmp_dir(target: Path) -> Path:
+    tmp = _own_name(target, "tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir()
+    return tmp
+
+
+def _swap_in(tmp: Path, target: Path) -> None:
+    """Replace `target` by the freshly written directory `tmp`."""
+    old = _own_name(target, "old")
+    if target.exists():
+        os.replace(target, old)
+    os.replace(tmp, target)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def write_store(parquet_file: str | Path) -> Path:
+    """Build the typed store for one parsed parquet file.
+
+    Headers are read one at a time through a lazy scan, so memory is bound
+    by the largest header rather than the whole file.
+    """
+    parquet_file = Path(parquet_file)
+    with _build_lock(parquet_file):
+        _build_store(parquet_file)
+    return store_dir(parquet_file)
+
+
+def _build_store(parquet_file: Path) -> dict:
+    """write_store with the build lock held; returns the new manifest."""
+    target = store_dir(parquet_file)
+    tmp = _tmp_dir(target)
+    try:
+        lf = sar_store.scan(parquet_file)
+        headers = (
+            lf.select(pl.col("header").unique(maintain_order=True))
+            .collect()["header"]
+            .to_list()
+        )
+        entries, stats = [], []
+        for index, header in enumerate(headers):
+            if len(set(header.split())) != len(header.split()):
+                continue  # duplicate metric names, readers fall back to parsing
+            df = lf.filter(pl.col("header") == header).select("date", "data").collect()
+            entry, header_stats = _write_header(tmp, f"h{index:04d}.parquet", df, header)
+            entries.append(entry)
+            stats.append(header_stats)
+        _write_stats(tmp, stats)
+        manifest = {
+            "version": STORE_VERSION,
+            "source": _source_stamp(parquet_file),
+            "headers": entries,
+        }
+        (tmp / MANIFEST).write_text(json.dumps(manifest))
+        _swap_in(tmp, target)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return manifest
+
+
+def update_store(parquet_file: str | Path, headers: list[str]) -> Path:
+    """Rebuild only `headers` after rows were appended to `parquet_file`
+    (parse_into_polars.append_sar_lines). The files of the other headers
+    are hardlinked into the new store; without a current store, the whole
+    store is written."""
+    parquet_file = Path(parquet_file)
+    with _build_lock(parquet_file):
+        return _update_store(parquet_file, headers)
+
+
+def _update_store(parquet_file: Path, headers: list[str]) -> Path:
+    target = store_dir(parquet_file)
+    try:
+        manifest = json.loads((target / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return write_store(parquet_file)
+    if manifest.get("version") != STORE_VERSION:
+        return write_store(parquet_file)
+
+    tmp = _tmp_dir(target)
+    try:
+        entries = {entry["header"]: entry for entry in manifest["headers"]}
+        next_index = len(list(target.glob("h????.parquet")))
+        lf = sar_store.scan(parquet_file)
+        for header, entry in entries.items():
+            if header not in headers:
+                for file in _entry_files(entry):
+                    os.link(target / file, tmp / file)
+        stats = []
+        if (target / STATS).exists():
+            stats.append(
+                pl.read_parquet(target / STATS).filter(
+                    ~pl.col("header").is_in(headers)
+                )
+            )
+        for header in headers:
+            if len(set(header.split())) != len(header.split()):
+                continue  # duplicate metric names, readers fall back to parsing
+            if header in entries:
+                file = entries[header]["file"]
+            else:
+                while (target / f"h{next_index:04d}.parquet").exists():
+                    next_index += 1
+                file = f"h{next_index:04d}.parquet"
+                next_index += 1
+            df = lf.filter(pl.col("header") == header).select("date", "data").collect()
+            entries[header], header_stats = _write_header(tmp, file, df, header)
+            stats.append(header_stats)
+        _write_stats(tmp, stats)
+        manifest = {
+            "version": STORE_VERSION,
+            "source": _source_stamp(parquet_file),
+            "headers": list(entries.values()),
+        }
+        (tmp / MANIFEST).write_text(json.dumps(manifest))
+        _swap_in(tmp, target)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return target
+
+
+def link_store(source: str | Path, target: str | Path) -> None:
+    """Hardlink the store of the parquet file `source` as the store of
+    `target` (no data is copied; see dedup_store)."""
+    source_dir, target_dir = store_dir(source), store_dir(target)
+    with _build_lock(target):
+        tmp = _tmp_dir(target_dir)
+        try:
+            for entry in source_dir.iterdir():
+                os.link(entry, tmp / entry.name)
+            _swap_in(tmp, target_dir)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+
+def remove_store(file_name: str | Path) -> None:
+    with _build_lock(file_name):
+        shutil.rmtree(store_dir(file_name), ignore_errors=True)
+
+
+def _current_manifest(parquet_file: Path) -> dict | None:
+    """Manifest if the store exists and was built from this parquet file."""
+    try:
+        manifest = json.loads((store_dir(parquet_file) / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != STORE_VERSION:
+        return None
+    if manifest.get("source") != _source_stamp(parquet_file):
+        return None
+    return manifest
+
+
+def read_manifest(file_name: str | Path) -> dict | None:
+    """Manifest of an up-to-date store; migrates old or stale files.
+
+    Returns None when there is no parsed parquet file to build from.
+    """
+    parquet_file = sar_store.stored_file(file_name)
+    if not parquet_file.exists():
+        return None
+    manifest = _current_manifest(parquet_file)
+    if manifest is None:
+        with _build_lock(parquet_file):
+            # another thread may have rebuilt it while we waited
+            manifest = _current_manifest(parquet_file)
+            if manifest is None:
+                manifest = _build_store(parquet_file)
+    return manifest
+
+
+def read_header(
+    file_name: str | Path,
+    header: str,
+    device: str | None = None,
+    start=None,
+    end=None,
+) -> pl.DataFrame | None:
+    """Typed frame (date, [device], metrics...) of one header, or None.
+
+    `device` and the `start`/`end` datetimes are applied while scanning;
+    `device` is ignored for headers without sub-devices.
+    """
+    manifest = read_manifest(file_name)
+    if manifest is None:
+        return None
+    for entry in manifest["headers"]:
+        if entry["header"] == header:
+            typed = pl.scan_parquet(store_dir(file_name) / entry["file"])
+            if device is not None and "device" in typed.collect_schema().names():
+                typed = typed.filter(pl.col("device") == str(device))
+            if start is not None:
+                typed = typed.filter(pl.col("date") >= start)
+            if end is not None:
+                typed = typed.filter(pl.col("date") <= end)
+            return typed.collect()
+    return None
+
+
+def read_level(
+    file_name: str | Path,
+    header: str,
+    max_rows: int,
+    device: str | None = None,
+    start=None,
+    end=None,
+) -> tuple[pl.DataFrame, int] | None:
+    """The finest resolution of one header whose series fit into `max_rows`
+    rows, as (frame, rows per bucket), or None without a store entry.
+
+    Level frames carry the mean per bucket in the metric columns and
+    `<metric>_min` / `<metric>_max` (pyramid); resolution 1 is the typed
+    frame itself. Without `device`, the longest device series counts. If
+    no level fits, the coarsest is returned.
+    """
+    manifest = read_manifest(file_name)
+    if manifest is None:
+        return None
+    for entry in manifest["headers"]:
+        if entry["header"] != header:
+            continue
+        levels = [(1, entry["file"])] + sorted(
+            (int(factor), file) for factor, file in entry.get("levels", {}).items()
+        )
+        for factor, file in levels:
+            typed = pl.scan_parquet(store_dir(file_name) / file)
+            has_device = "device" in typed.collect_schema().names()
+            if device is not None and has_device:
+                typed = typed.filter(pl.col("device") == str(device))
+            if start is not None:
+                typed = typed.filter(pl.col("date") >= start)
+            if end is not None:
+                typed = typed.filter(pl.col("date") <= end)
+            rows = (
+                typed.group_by("device").len().select(pl.col("len").max())
+                if has_device and device is None
+                else typed.select(pl.len())
+            ).collect().item()
+            if not rows or rows <= max_rows or factor == levels[-1][0]:
+                return typed.collect(), factor
+    return None
+
+
+def _load_stats(path: Path) -> dict:
+    """stats.parquet as {header: {device: {metric: {statistic: value}}}},
+    memoized per file version."""
+    stat = path.stat()
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _stats_lock:
+        cached = _stats_cache.get(path)
+        if cached is not None and cached[0] == stamp:
+            _stats_cache.move_to_end(path)
+            return cached[1]
+    stats: dict = {}
+    for row in pl.read_parquet(path).iter_rows(named=True):
+        devices = stats.setdefault(row["header"], {})
+        devices.setdefault(row["device"], {})[row["metric"]] = {
+            statistic: row[statistic] for statistic in STATISTICS
+        }
+    with _stats_lock:
+        _stats_cache[path] = (stamp, stats)
+        while len(_stats_cache) > STATS_CACHE_FILES:
+            _stats_cache.popitem(last=False)
+    return stats
+
+
+def read_stats(file_name: str | Path, header: str) -> dict | None:
+    """Stored describe() statistics of one header as {device: {metric:
+    {statistic: value}}} (device None without sub-devices), or None without
+    a store entry."""
+    manifest = read_manifest(file_name)
+    if manifest is None:
+        return None
+    try:
+        return _load_stats(store_dir(file_name) / STATS).get(header)
+    except OSError:
+        return None
+
+
+def read_devices(file_name: str | Path) -> dict[str, list[str]]:
+    """Sub-devices of every header that has them, from the stored
+    statistics: {header: [devices, sorted]}."""
+    if read_manifest(file_name) is None:
+        return {}
+    try:
+        stats = _load_stats(store_dir(file_name) / STATS)
+    except OSError:
+        return {}
+    return {
+        header: sorted(device for device in devices if device is not None)
+        for header, devices in stats.items()
+        if any(device is not None for device in devices)
+    }
+
+
+def to_metrics_df(typed: pl.DataFrame, header: str) -> pl.DataFrame:
+    """Typed frame -> the layout of pl_helpers2.get_metrics_from_df.
+
+    (date, <header> as list of floats, sub_device) - no string parsing.
+    """
+    columns = [pl.col("date"), pl.concat_list(header.split()).alias(header)]
+    if "device" in typed.columns:
+        columns.append(pl.col("device").cast(pl.String).alias("sub_device"))
+    return typed.select(columns)
+
+
+def load_metrics_df(
+    file_name: str | Path, header: str, device=None, start=None, end=None
+) -> pl.DataFrame | None:
+    typed = read_header(file_name, header, device, start, end)
+    if typed is None:
+        return None
+    return to_metrics_df(typed, header)
+
+
+def get_metrics_df(
+    file_name: str | Path,
+    header: str,
+    df: pl.DataFrame,
+    alias: str,
+    device: str | None = None,
+    start=None,
+    end=None,
+) -> pl.DataFrame:
+    """Metrics of one header from the typed store.
+
+    Falls back to splitting the data strings of the header frame `df` when
+    the store cannot provide the header. `device`, `start` and `end` only
+    narrow the store read (read_header); `df` is expected to be filtered
+    the same way already.
+    """
+    import pl_helpers2 as pl_h2
+
+    try:
+        metrics_df = load_metrics_df(file_name, header, device, start, end)
+    except Exception:
+        metrics_df = None
+    if metrics_df is None:
+        metrics_df = pl_h2.get_metrics_from_df(df, header, alias)
+    return metrics_df
+
+
+def migrate(upload_dir: str | Path) -> list[str]:
+    """Build missing or stale stores for every stored file below upload_dir."""
+    migrated = []
+    for parquet_file in sorted(Path(upload_dir).glob("*/*")):
+        if parquet_file.parent.name == "config" or not sar_store.is_stored(parquet_file):
+            continue
+        if _current_manifest(parquet_file) is not None:
+            continue
+        write_store(parquet_file)
+        migrated.append(str(parquet_file))
+    return migrated
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        from config import Config
+
+        for name in migrate(sys.argv[2] if len(sys.argv) > 2 else Config.upload_dir):
+            print(f"migrated {name}")
+    else:
+        print("usage: python header_store.py migrate [upload_dir]")
@@ -8,6 +8,7 @@ import re
 import dataframe_funcs_pl as dff
 import layout_helper_pl as lh
 import sqlite2_polars
+import file_catalog
 from datetime import datetime
 from config import Config
 
@@ -207,11 +208,7 @@ def metric_popover(prop_list, col=None, key=None):
     st.markdown("######")
 
 def get_sar_files(user_name: str, col: st.delta_generator.DeltaGenerator=None, key: str=None):
-    sar_files_raw = [x for x in os.listdir(f'{Config.upload_dir}/{user_name}') \
-        if os.path.isfile(f'{Config.upload_dir}/{user_name}/{x}') ]
-    sar_files_pre = [x for x in sar_files_raw if not x.endswith('.parquet') ]
-    sar_files_parquet = [x.replace(".parquet", "") for x in sar_files_raw if x.endswith('.parquet')]
-    sar_files = sorted(list(set(sar_files_parquet + sar_files_pre)))
+    sar_files = file_catalog.names(user_name)
     lh.make_vspace(1, col)
     if not col:
         col1, col2, col3 = st.columns([2,1, 1])
@@ -242,10 +239,10 @@ def font_expander(default_size, title, description, col=None, key=None):
 
         return size
 
-def rename_sar_file(file_path, col=None):
+def sar_file_name(os_details: list) -> str:
+    """<date_of_upload>_<hostname>_<sar file creation date> from the split
+    'Linux ...' line (see extract_os_details)."""
     import re
-    col = col if col else st
-    os_details = extract_os_details(file_path)
     hostname = os_details[2].strip("(|)")
     date = os_details[3]
     
@@ -266,9 +263,14 @@ def rename_sar_file(file_path, col=None):
             break
     
     today = datetime.today().strftime("%Y-%m-%d")
+    return f'{today}_{hostname}_{date}'
+
+
+def rename_sar_file(file_path, col=None):
+    col = col if col else st
+    rename_name = sar_file_name(extract_os_details(file_path))
     base_name = os.path.basename(file_path)
     dir_name = os.path.dirname(file_path)
-    rename_name = f'{today}_{hostname}_{date}'
     renamed_name = f'{dir_name}/{rename_name}'
     try:
         os.system(f'mv {file_path} {dir_name}/{rename_name}')
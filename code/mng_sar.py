@@ -1,14 +1,22 @@
 #!/usr/bin/python3
+import hashlib
 import os
 import pandas as pd
 import streamlit as st
 from magic import Magic
 from datetime import datetime
 import subprocess
-import tempfile
-import redis_mng
+import redis_cache
+import dedup_store
+import derived_cache
+import file_catalog
+import header_store
 import helpers_pl as helpers
+import parse_into_polars as parse_polars
+import sa_binary
 import sar_ingest
+import sar_store
+import warmup
 from config import Config
 import visual_funcs as visf
 
@@ -79,58 +87,125 @@ def is_sar_binary_file(file_content: bytes, filename: str) -> bool:
     return binary_indicators >= 2
 
 
-def convert_openpgp_sar_file(file_content: bytes, original_filename: str) -> tuple[bytes, str]:
+def convert_openpgp_sar_file(input_path: str, original_filename: str) -> tuple[str, str]:
     """
     Convert OpenPGP Secret Key SAR file to ASCII format using sar command.
     
     Args:
-        file_content: Raw bytes of the uploaded file
+        input_path: Spooled upload (removed after the conversion)
         original_filename: Original filename (e.g., 'sa20250726')
     
     Returns:
-        tuple: (converted_bytes_data, new_filename) or (None, None) if conversion failed
+        tuple: (converted_file_path, new_filename) or (None, None) if conversion failed
     """
+    # Generate output filename: sa20250726 -> sar20250726
+    if original_filename.startswith('sa') and len(original_filename) >= 10:
+        new_filename = 'sar' + original_filename[2:]
+    else:
+        new_filename = f"sar_{original_filename}"
+    # next to the (uniquely named) spool file: uploads of one name may convert at once
+    output_path = f'{input_path}.sar'
+
+    # Run the sar conversion command without LANG; stdout goes straight
+    # to the output file so the text never sits in memory
+    env = {k: v for k, v in os.environ.items() if k != 'LANG'}
+    result = None
     try:
-        # Generate output filename: sa20250726 -> sar20250726
-        if original_filename.startswith('sa') and len(original_filename) >= 10:
-            new_filename = 'sar' + original_filename[2:]
-        else:
-            new_filename = f"sar_{original_filename}"
-        
-        # Create temporary file for input
-        with tempfile.NamedTemporaryFile(delete=False, suffix='_input') as temp_input:
-            temp_input.write(file_content)
-            temp_input_path = temp_input.name
-        
-        # Run the sar conversion command
-        # Use shell=True to handle the unset LANG part properly
-        full_cmd = f"unset LANG; sar -A -t -f {temp_input_path}"
-        
-        result = subprocess.run(
-            full_cmd,
-            shell=True,
-            capture_output=True,
-            text=False  # We want bytes output
-        )
-        
-        if result.returncode == 0:
-            # Read the converted output as bytes
-            converted_data = result.stdout
-            
-            # Clean up temporary file
-            os.unlink(temp_input_path)
-            
-            return converted_data, new_filename
-        else:
-            # Clean up temporary file on error
-            os.unlink(temp_input_path)
-            
-            print(f"SAR conversion failed: {result.stderr.decode()}")
-            return None, None
-            
+        with open(output_path, 'wb') as output:
+            result = subprocess.run(
+                ['sar', '-A', '-t', '-f', input_path],
+                stdout=output,
+                stderr=subprocess.PIPE,
+                env=env,
+            )
     except Exception as e:
         print(f"Error during SAR conversion: {e}")
-        return None, None
+    finally:
+        os.unlink(input_path)
+
+    if result is not None and result.returncode == 0:
+        return output_path, new_filename
+    if result is not None:
+        print(f"SAR conversion failed: {result.stderr.decode()}")
+    if os.path.exists(output_path):
+        os.unlink(output_path)
+    return None, None
+
+
+def ingest_sadf_json(json_path: str, filename: str, upload_dir: str,
+        username: str, digest: str | None = None) -> list[str]:
+    """
+    Parse a spooled sadf JSON export directly into the parquet layout.
+
+    Returns the upload warnings, raises ValueError on broken JSON.
+    """
+    filename = sar_ingest.strip_json_suffix(filename)
+    warnings = [f"{filename}: converted from sadf JSON"]
+    try:
+        renamed_name = sar_ingest.sadf_json_name(json_path)
+        if sar_store.stored_file(f"{upload_dir}/{renamed_name}").exists():
+            warnings.append(f"A processed Parquet version of **{filename}** already existed and was updated.")
+        parquet_file, json_warnings = parse_polars.stream_sadf_json(
+            json_path, f'{upload_dir}/{renamed_name}')
+    finally:
+        if os.path.exists(json_path):
+            os.unlink(json_path)
+    warnings.extend(f"{filename}: {w}" for w in json_warnings)
+    if digest:
+        dedup_store.register(digest, parquet_file)
+    redis_cache.drop(username, renamed_name)
+    derived_cache.invalidate(f'{upload_dir}/{renamed_name}')
+    warmup.schedule(f'{upload_dir}/{renamed_name}', username)
+    return warnings
+
+
+def link_known_upload(digest: str, filename: str, upload_dir: str,
+        username: str) -> list[str] | None:
+    """
+    Link the parsed parquet of content uploaded before (dedup_store).
+
+    Returns the upload warnings, None if the content is new (or linking
+    failed) and the upload has to be parsed.
+    """
+    renamed_name = dedup_store.lookup(digest)
+    if renamed_name is None:
+        return None
+    warnings = [f"{filename}: identical to an earlier upload, parsed data reused"]
+    if sar_store.stored_file(f"{upload_dir}/{renamed_name}").exists():
+        warnings.append(f"A processed Parquet version of **{filename}** already existed and was updated.")
+    try:
+        dedup_store.link(digest, upload_dir, renamed_name)
+    except OSError as e:
+        print(f"dedup: linking {filename} failed: {e}")
+        return None
+    redis_cache.drop(username, renamed_name)
+    derived_cache.invalidate(f'{upload_dir}/{renamed_name}')
+    warmup.schedule(f'{upload_dir}/{renamed_name}', username)
+    return warnings
+
+
+def ingest_sa_binary(sa_path: str, filename: str, upload_dir: str,
+        username: str, digest: str | None = None) -> list[str]:
+    """
+    Decode a spooled binary sa file directly into the parquet layout.
+
+    Returns the upload warnings. Raises ValueError if sa_binary cannot read
+    the file (or all of it, with sar installed), which is then left in place
+    for the sar -A fallback.
+    """
+    warnings = [f"{filename}: binary SAR file decoded natively"]
+    renamed_name = sar_ingest.sa_binary_name(sa_path)
+    if sar_store.stored_file(f"{upload_dir}/{renamed_name}").exists():
+        warnings.append(f"A processed Parquet version of **{filename}** already existed and was updated.")
+    parquet_file, sa_warnings = parse_polars.stream_sa_file(
+        sa_path, f'{upload_dir}/{renamed_name}')
+    warnings.extend(f"{filename}: {w}" for w in sa_warnings)
+    if digest:
+        dedup_store.register(digest, parquet_file)
+    redis_cache.drop(username, renamed_name)
+    derived_cache.invalidate(f'{upload_dir}/{renamed_name}')
+    warmup.schedule(f'{upload_dir}/{renamed_name}', username)
+    return warnings
 
 
 def nav_to_overview():
@@ -148,22 +223,17 @@ def nav_to_multi():
 def file_mng(upload_dir: str, username:str):
     col1, _, _, _ = visf.create_columns(4,[0,1,1,1])
     manage_files = ['Show Sar Files','Add Sar Files', 'Delete Sar Files']
-    sar_files = [ x for x in os.listdir(upload_dir) if os.path.isfile(f'{upload_dir}/{x}')]
-    
-    # Separate ASCII SAR files from parquet files and ensure uniqueness
-    sar_files_uploaded = [x for x in sar_files if not x.endswith(('.parquet'))]
-    sar_files_parquet = [x.replace('.parquet', '') for x in sar_files if x.endswith('.parquet')]
-    sar_files = sorted(list(set(sar_files_parquet + sar_files_uploaded)))
-    
-    file_size = [os.path.getsize(f'{upload_dir}/{x}') if os.path.exists(f'{upload_dir}/{x}') 
-                else os.path.getsize(f'{upload_dir}/{x}.parquet') for x in sar_files]
+    # uploaded and parsed files, one entry per name (file_catalog)
+    catalog = file_catalog.files(username)
+    sar_files = [x['name'] for x in catalog]
+    file_size = [x['size_bytes'] for x in catalog]
 
     managef_options = col1.selectbox(
         'Show/Add/Delete', manage_files)
 
     st.markdown('___')
     if managef_options == 'Add Sar Files':
-        upload_hint = "SAR files must be in Posix format, decimal seperator has to be '.'. OpenPGP Secret Key files (binary SAR files), sadf JSON exports (sadf -j) and xz-compressed files will be automatically converted."
+        upload_hint = "SAR files must be in Posix format, decimal seperator has to be '.'. binary SAR files (sa files, decoded natively, with sar -A for activities the native decoder does not know), sadf JSON exports (sadf -j) and xz-compressed files will be automatically converted."
         convert_cmd = "```unset LANG; sar -A -t -f <binary_file> > <ascii_file>```"
         sar_convert_hint = f"""{upload_hint} \
         \nManual conversion command: {convert_cmd}"""
@@ -182,53 +252,83 @@ def file_mng(upload_dir: str, username:str):
                             upload_warnings.append(f"File **{u_file.name}** already exists and has been overwritten.")
 
                         f_check = Magic()
-                        bytes_data = u_file.read()
 
-                        # xz entpacken / sadf-JSON in sar-Text konvertieren
+                        # in Stücken nach .tmp_<zufall>_<name> schreiben, xz dabei entpacken,
+                        # sadf-JSON direkt nach parquet
+                        digest = hashlib.sha256()
                         try:
-                            bytes_data, new_name, ingest_warns = (
-                                sar_ingest.preprocess_upload(bytes_data, u_file.name)
-                            )
-                            u_file.name = new_name
-                            upload_warnings.extend(ingest_warns)
+                            temp_path, file_name = sar_ingest.spool_upload(
+                                u_file, upload_dir, u_file.name, digest)
                         except ValueError as e:
                             col1.error(str(e))
                             continue
+                        temp_path = str(temp_path)
+                        digest = digest.hexdigest()
+
+                        # schon einmal geparst: parquet per Hardlink übernehmen
+                        known_warns = link_known_upload(
+                            digest, file_name, upload_dir, username)
+                        if known_warns is not None:
+                            os.unlink(temp_path)
+                            upload_warnings.extend(known_warns)
+                            upload_count += 1
+                            continue
+                        head = sar_ingest.read_head(temp_path)
 
-                        res = f_check.from_buffer(bytes_data)
+                        if sar_ingest.is_sadf_json(head):
+                            try:
+                                json_warns = ingest_sadf_json(
+                                    temp_path, file_name, upload_dir, username,
+                                    digest)
+                            except ValueError as e:
+                                col1.error(str(e))
+                                continue
+                            upload_warnings.extend(json_warns)
+                            upload_count += 1
+                            continue
+
+                        # binäre sa-Dateien ohne sar dekodieren, sar -A nur als Fallback
+                        if sa_binary.is_sa_file(head):
+                            try:
+                                upload_warnings.extend(ingest_sa_binary(
+                                    temp_path, file_name, upload_dir, username,
+                                    digest))
+                                upload_count += 1
+                                continue
+                            except ValueError as e:
+                                upload_warnings.append(
+                                    f"{file_name}: native sa decoding failed ({e}), trying sar -A")
+
+                        res = f_check.from_file(temp_path)
 
                         is_openpgp_detected = "OpenPGP Secret Key" in res
                         is_generic_data = "data" in res.lower()
-                        is_binary_sar = is_sar_binary_file(bytes_data, u_file.name)
+                        is_binary_sar = is_sar_binary_file(head, file_name)
                         
                         if is_openpgp_detected or (is_generic_data and is_binary_sar):
-                            converted_data, new_filename = convert_openpgp_sar_file(bytes_data, u_file.name)
-                            if converted_data is not None:
-                                bytes_data = converted_data
-                                u_file.name = new_filename
-                                res = f_check.from_buffer(bytes_data)
+                            converted_path, new_filename = convert_openpgp_sar_file(temp_path, file_name)
+                            if converted_path is not None:
+                                temp_path = converted_path
+                                file_name = new_filename
+                                res = f_check.from_file(temp_path)
                             else:
-                                col1.error(f"Failed to convert {u_file.name}.")
+                                col1.error(f"Failed to convert {file_name}.")
                                 continue
                         
                         if "ASCII text" in res:
-                            temp_path = f'{upload_dir}/.tmp_{u_file.name}'
-                            with open(temp_path, 'wb') as targetf:
-                                targetf.write(bytes_data)
-                            
                             renamed_name = helpers.rename_sar_file(temp_path, col=None)
                             
                             # Check if the renamed file already exists as parquet
-                            if os.path.exists(f"{upload_dir}/{renamed_name}.parquet"):
-                                upload_warnings.append(f"A processed Parquet version of **{u_file.name}** already existed and was updated.")
+                            if sar_store.stored_file(f"{upload_dir}/{renamed_name}").exists():
+                                upload_warnings.append(f"A processed Parquet version of **{file_name}** already existed and was updated.")
                             
                             upload_count += 1
                             
-                            try:
-                                rkey = f"{Config.rkey_pref}:{username}"
-                                basename = renamed_name.split("/")[-1]
-                                redis_mng.del_redis_key_property(rkey, f'{basename}_parquet')
-                            except: pass
+                            redis_cache.drop(username, renamed_name.split("/")[-1])
+                            derived_cache.invalidate(f'{upload_dir}/{renamed_name.split("/")[-1]}')
+                            file_catalog.refresh(f'{upload_dir}/{renamed_name.split("/")[-1]}')
+                        else:
+                            os.unlink(temp_path)
                 
                 if upload_count > 0:
                     st.session_state['upload_success'] = True
@@ -254,25 +354,25 @@ def file_mng(upload_dir: str, username:str):
             if col1.button('Delete selected Files'):
                 for file in dfiles:
                     # Construct Redis property key correctly: basename + "_parquet"
-                    r_item = f'{file}_parquet'  # file already contains the basename without .parquet extension
-                    df_file = f'{upload_dir}/{file}.parquet'
+                    r_item = f'{file}_parquet'  # file already contains the basename without .parquet/.arrow extension
+                    df_files = sar_store.candidates(f'{upload_dir}/{file}')
                     fs_file = f'{upload_dir}/{file}'
-                    os.system(f'rm -f {df_file}')
+                    shared = any(dedup_store.is_shared(x) for x in df_files)
+                    for df_file in df_files:
+                        os.system(f'rm -f {df_file}')
                     os.system(f'rm -f {fs_file}')
-                    try:
-                        rkey = f"{Config.rkey_pref}:{username}"
-                        print(
-                            f'delete {rkey}, {r_item} from redis at {datetime.now().strftime("%m/%d/%y %H:%M:%S")}')
-                        redis_mng.del_redis_key_property(rkey, r_item)
-                    except Exception as e:
-                        print(f'{rkey}, {r_item} not available in redis db or redis \
-                            db not online, exception  is {e}')
+                    header_store.remove_store(fs_file)
+                    derived_cache.invalidate(fs_file)
+                    file_catalog.refresh(fs_file)
+                    if shared:
+                        dedup_store.prune()
+                    print(
+                        f'delete {username}, {r_item} from redis at {datetime.now().strftime("%m/%d/%y %H:%M:%S")}')
+                # one pipeline for all selected files
+                redis_cache.drop(username, *dfiles)
 
-                sar_files = os.listdir(upload_dir)
                 # Update file list to reflect current state after deletion
-                sar_files_uploaded = [x for x in sar_files if not x.endswith(('.parquet'))]
-                sar_files_parquet = [x.replace('.parquet', '') for x in sar_files if x.endswith('.parquet')]
-                sar_files = sar_files_parquet + sar_files_uploaded
+                sar_files = file_catalog.names(username)
                 dfiles = dfiles_ph.multiselect(
                     'Choose your Files to delete', sar_files, default=None)
         else:
@@ -9,8 +9,9 @@ import pl_helpers2 as pl_helpers
 import layout_helper_pl as lh
 import parse_into_polars as parse_polars
 import dia_compute_pl as dia_compute
+import file_catalog
 import re
-from os import path, listdir
+from os import path
 from config import Config
 
 
@@ -31,12 +32,8 @@ def single_multi(config_dict: dict, username: str, ph_list: list):
     sel_field = []
     for ph in ph_list:
         ph.empty()
-    sar_files = [x for x in listdir(upload_dir) if path.isfile(f"{upload_dir}/{x}")]
-    # exclude parquet files
-    sar_files_pre = [x for x in sar_files if not x.endswith(".parquet")]
-    sar_files = [x.replace(".parquet", "") for x in sar_files if x.endswith(".parquet")]
-    sar_files.extend(sar_files_pre)
-    sar_files = sorted(list(set(sar_files))) # Ensure uniqueness to avoid DuplicateElementId
+    # one entry per name, uploaded or parsed (no DuplicateElementId)
+    sar_files = file_catalog.names(username)
 
     sel_all = st.checkbox("***Select All***", key="select_all")
     st.write("\n")
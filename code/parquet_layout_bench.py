@@ -0,0 +1,67 @@
+"""Per-header load time of the stored parquet layout, before and after.
+
+Before: the rows of the given file in their order there, written with plain
+write_parquet defaults as ingest did up to now (pass a file parsed before
+the sorted layout to get the old section order). After: the layout of
+sar_store.write (sorted by header, Config.parquet_row_group_size rows per
+group, zstd, statistics).
+Both files hold the same rows of a parsed sar file; every header is loaded
+with scan_parquet(...).filter(header == X), like a per-header read does.
+
+    python parquet_layout_bench.py <parquet file> [repeats]
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("REDIS_ENABLED", "false")
+
+import polars as pl
+import sar_store
+
+
+def _load_times(parquet_file: Path, headers: list[str], repeats: int) -> dict:
+    times = {}
+    for header in headers:
+        runs = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            pl.scan_parquet(parquet_file).filter(pl.col("header") == header).collect()
+            runs.append(time.perf_counter() - start)
+        times[header] = statistics.median(runs)
+    return times
+
+
+def bench(parquet_file: Path, repeats: int) -> None:
+    df = pl.read_parquet(parquet_file)
+    headers = df["header"].unique(maintain_order=True).to_list()
+    with tempfile.TemporaryDirectory(prefix="parquet_layout_") as work_dir:
+        before = Path(work_dir) / "before.parquet"
+        after = Path(work_dir) / "after.parquet"
+        df.write_parquet(before)
+        sar_store.write(df.sort("header", maintain_order=True), after)
+        old = _load_times(before, headers, repeats)
+        new = _load_times(after, headers, repeats)
+        sizes = before.stat().st_size, after.stat().st_size
+
+    print(f"{parquet_file}: {df.height} rows, {len(headers)} headers")
+    print(f"file size: {sizes[0]} -> {sizes[1]} bytes")
+    for header in headers:
+        speedup = old[header] / new[header] if new[header] else float("inf")
+        print(
+            f"{old[header] * 1000:8.2f}ms -> {new[header] * 1000:8.2f}ms "
+            f"({speedup:4.1f}x)  {header[:60]}"
+        )
+    total_old, total_new = sum(old.values()), sum(new.values())
+    print(f"all headers: {total_old * 1000:.1f}ms -> {total_new * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    bench(Path(sys.argv[1]), int(sys.argv[2]) if len(sys.argv) > 2 else 5)
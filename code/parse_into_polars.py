@@ -1,11 +1,21 @@
 import re
 import io
 import logging
+import multiprocessing
 import os.path
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import redis_mng
+import redis_cache
 import polars as pl
 import pl_helpers2
+import file_catalog
+import header_store
+import frame_cache
+import sar_store
+import sar_ingest
 import config as Config
 
 logger = logging.getLogger(__name__)
@@ -13,56 +23,81 @@ logger = logging.getLogger(__name__)
 #@cache_data  # Disabled to allow proper Redis cleanup on file re-upload
 def get_data_frame(file_name: str, user_name: str) -> pl.DataFrame:
     """
-    Load structure containing data frames from redis or parquet file
+    Load structure containing data frames from the process cache
+    (frame_cache), redis or the stored file (sar_store)
     """
+    cache_file = sar_store.stored_file(file_name)
+    df = frame_cache.get(cache_file)
+    if df is None:
+        df = _load_data_frame(file_name, user_name)
+        frame_cache.put(cache_file, df)
+    return df
+
+
+def _load_data_frame(file_name: str, user_name: str) -> pl.DataFrame:
     # load from redis
-    parquet_file = Path(f"{file_name}.parquet")
+    parquet_file = sar_store.stored_file(file_name)
     if not os.path.exists(parquet_file):
         parquet_file = Path(file_name)
     rs = redis_mng.get_redis_conn(decode=False)
     basename = os.path.basename(file_name)
     if rs:
-        r_item = f"{Config.Config.rkey_pref}:{user_name}"
-        file_name_parquet = f"{basename}_parquet"
-        parquet_obj = redis_mng.get_redis_val(r_item, property=file_name_parquet)
-        if parquet_obj:
-            parquet_mem = io.BytesIO(parquet_obj)
-        else:
-            parquet_mem = io.BytesIO(b'')
+        df = redis_mng.convert_df_from_redis(redis_cache.get(user_name, basename))
+        if df is not None:
+            return df
         try:
-            df = pl.read_parquet(parquet_mem)
+            df = sar_store.read(parquet_file)
         except Exception as e:
-            try:
-                df = pl.read_parquet(parquet_file)
-            except Exception as e:
-                df = parse_sar_file(parquet_file, user_name, DEBUG=False)
-            try:
-                parquet_obj = df.to_pandas().to_parquet()
-                redis_mng.set_redis_key(
-                    parquet_obj,
-                    r_item,
-                    property=file_name_parquet,
-                )
-                logger.debug("%s, %s saved to redis", r_item, file_name_parquet)
-            except Exception as e:
-                logger.warning(
-                    "could not connect to redis server or save %s to redis server: %s",
-                    file_name_parquet,
-                    e,
-                )
-            else:
-                return df
+            df = parse_sar_file(parquet_file, user_name, DEBUG=False)
+        try:
+            redis_cache.put(user_name, basename, redis_mng.convert_df_for_redis(df))
+            logger.debug("%s of %s saved to redis", basename, user_name)
+        except Exception as e:
+            logger.warning(
+                "could not connect to redis server or save %s to redis server: %s",
+                basename,
+                e,
+            )
     elif os.path.exists(parquet_file):
         try:
-            df = pl.read_parquet(parquet_file)
+            df = sar_store.read(parquet_file)
         except Exception as e:
             df = parse_sar_file(parquet_file, user_name, DEBUG=False)
-        return df
     else:
         df = parse_sar_file(parquet_file, user_name, DEBUG=False)
     return df
 
 
+def get_lazy_frame(file_name: str, user_name: str) -> pl.LazyFrame:
+    """Lazy variant of get_data_frame for reads of a few headers.
+
+    Scans the stored file instead of loading it (sar_store.scan), so header,
+    device and time filters are pushed down and only the matching row
+    groups are read. A frame already in frame_cache is used instead; files
+    without a stored file go through get_data_frame (parse, Redis) once.
+    """
+    stored_file = sar_store.stored_file(file_name)
+    if stored_file.exists():
+        df = frame_cache.get(stored_file)
+        if df is not None:
+            return df.lazy()
+        return sar_store.scan(stored_file)
+    return get_data_frame(file_name, user_name).lazy()
+
+
+reg_ignore = re.compile(
+    r"^(\d{2}:\d{2}:\d{2}.*bus.*idvendor|.*intr.*intr/s|.*temp.*device|.*mhz)",
+    re.IGNORECASE,
+)
+reg_delete_us_time = re.compile(r" AM | PM ", re.IGNORECASE)
+reg_replace_comma = re.compile(r"(\d+),(\d+)")
+reg_linux_restart = re.compile("LINUX RESTART")
+reg_time = re.compile(r"(^\d{2}:\d{2}:\d{2})")
+reg_fibre = re.compile(r"^(\d{2}:\d{2}:\d{2}.*fch_.*FCHOST)", re.IGNORECASE)
+reg_filesystem = re.compile(r"^\d{2}:\d{2}:\d{2}.*filesystem", re.IGNORECASE)
+empty_line = re.compile(r"^\s*$")
+
+
 def handle_fibre_and_fs(line: str) -> str:
     am_pm_search = re.compile(r"AM|PM", re.IGNORECASE)
     tmp_line = line.split()
@@ -77,32 +112,180 @@ def handle_fibre_and_fs(line: str) -> str:
     return line
 
 
-def parse_sar_file(file_path: str, username: str, DEBUG: bool = False) -> pl.DataFrame:
-    file_dict = {}
-    df = pl.DataFrame()
-    os_details = pl_helpers2.extract_os_details_from_file(file_path)
-    content = open(file_path, "r").readlines()
-    real_path = Path(file_path).absolute().as_posix()
-    parquet_file = Path(f"{real_path}.parquet")
+class _ParseState:
+    """State of the line classifier, carried from one chunk to the next."""
+
+    __slots__ = ("header", "header_str", "ignore_data", "fc_host", "filesystem")
+
+    def __init__(self):
+        self.header = False
+        self.header_str = ""
+        self.ignore_data = False
+        self.fc_host = False
+        self.filesystem = False
+
+
+class _LineCollector:
+    """Keeps every data line in memory, grouped by header (file_dict)."""
+
+    def __init__(self):
+        self.file_dict = {}
+        self.first_data = None
+
+    def add_header(self, header_str: str) -> None:
+        self.file_dict.setdefault(header_str, [])
+
+    def append(self, header_str: str, line: str) -> None:
+        if self.first_data is None:
+            self.first_data = line
+        self.file_dict[header_str].append(line)
+
+    def extend(self, header_str: str, lines: list[str]) -> None:
+        if self.first_data is None:
+            self.first_data = lines[0]
+        self.file_dict[header_str].extend(lines)
+
+    def frame(self) -> pl.DataFrame:
+        """The rows in the stored section order (_section_order)."""
+        headers, data = [], []
+        for key in _section_order(self.file_dict, self.first_data):
+            lines = self.file_dict[key]
+            headers.extend([key] * len(lines))
+            data.extend(lines)
+        return pl.DataFrame([headers, data], schema=["header", "data"])
+
 
-    reg_ignore = re.compile(
-        r"^(\d{2}:\d{2}:\d{2}.*bus.*idvendor|.*intr.*intr/s|.*temp.*device|.*mhz)",
-        re.IGNORECASE,
+def _time_format(first_data: str) -> str:
+    """"AM_PM" if the data lines carry AM/PM times, else "24"."""
+    return "AM_PM" if reg_delete_us_time.search(first_data) else "24"
+
+
+def _section_order(headers, first_data: str | None) -> list[str]:
+    """The raw section headers, ordered by the header they are stored as.
+
+    Stored files are sorted by header (file order within a header, which
+    is the time order), so every row group covers few headers and its
+    min/max statistics let scan_parquet(...).filter(header == X) skip the
+    others. The order is fixed before _finalize_frame, so the eager and the
+    streaming parser write identical files.
+    """
+    headers = list(headers)
+    if first_data is None or len(headers) < 2:
+        return headers
+    names = pl.LazyFrame({"header": headers, "_raw": headers})
+    names = pl_helpers2.clean_header(names, "header", _time_format(first_data))
+    return names.sort("header", maintain_order=True).collect()["_raw"].to_list()
+
+
+def _sort_sections(df: pl.DataFrame, first_data: str | None) -> pl.DataFrame:
+    """Raw (header, data) rows of _classify_vectorized in _section_order."""
+    order = _section_order(df["header"].unique(maintain_order=True), first_data)
+    rank = pl.DataFrame({"header": order}).with_row_index("_rank")
+    return (
+        df.join(rank, on="header", how="left", maintain_order="left")
+        .sort("_rank", maintain_order=True)
+        .drop("_rank")
     )
-    reg_delete_us_time = re.compile(r" AM | PM ", re.IGNORECASE)
-    reg_replace_comma = re.compile(r"(\d+),(\d+)")
-    reg_linux_restart = re.compile("LINUX RESTART")
-    reg_time = re.compile(r"(^\d{2}:\d{2}:\d{2})")
-    reg_fibre = re.compile(r"^(\d{2}:\d{2}:\d{2}.*fch_.*FCHOST)", re.IGNORECASE)
-    reg_filesystem = re.compile(r"^\d{2}:\d{2}:\d{2}.*filesystem", re.IGNORECASE)
-    empty_line = re.compile(r"^\s*$")
-    header = False
-    header_str = ""
-    ignore_data = False
-    fc_host = False
-    filesystem = False
-    restart_field = []
-    for line in content:
+
+
+def _unshare(parquet_file: Path) -> None:
+    """Remove the previous stored file (of either format) before writing a
+    new one: it may be a hardlink shared with other users (dedup_store) or
+    mapped by another process (sar_store), never write through it."""
+    for stored_file in sar_store.candidates(parquet_file):
+        stored_file.unlink(missing_ok=True)
+
+
+def _spill_progress(progress, source):
+    """_SectionSpill callback reporting progress(bytes read from the binary
+    file object `source`, sections found); None without a `progress`. The
+    final spill runs after `source` is closed and is not reported."""
+    if progress is None:
+        return None
+    return lambda sections: source.closed or progress(source.tell(), sections)
+
+
+class _SectionSpill:
+    """Like _LineCollector, but spills the buffered lines to Arrow IPC
+    batches once `chunk_lines` lines are held, so memory stays bounded.
+
+    Batches are kept per header, which reproduces the grouping of file_dict
+    (lines in file order) when they are scanned back in _section_order,
+    like _LineCollector.frame.
+    """
+
+    def __init__(self, directory: str, chunk_lines: int, progress=None):
+        self.directory = directory
+        self.chunk_lines = max(1, chunk_lines)
+        self.buffers: dict[str, list[str]] = {}
+        self.batches: dict[str, list[str]] = {}
+        self.buffered = 0
+        self.first_data = None
+        # called with the number of sections found after every spill
+        self.progress = progress
+
+    def add_header(self, header_str: str) -> None:
+        if header_str not in self.buffers:
+            self.buffers[header_str] = []
+            self.batches[header_str] = []
+
+    def append(self, header_str: str, line: str) -> None:
+        if self.first_data is None:
+            self.first_data = line
+        self.buffers[header_str].append(line)
+        self.buffered += 1
+        if self.buffered >= self.chunk_lines:
+            self.flush()
+
+    def extend(self, header_str: str, lines: list[str]) -> None:
+        if self.first_data is None:
+            self.first_data = lines[0]
+        self.buffers[header_str].extend(lines)
+        self.buffered += len(lines)
+        if self.buffered >= self.chunk_lines:
+            self.flush()
+
+    def flush(self) -> None:
+        for index, (key, lines) in enumerate(self.buffers.items()):
+            if not lines:
+                continue
+            batch = os.path.join(
+                self.directory, f"{index:05d}_{len(self.batches[key]):06d}.arrow"
+            )
+            pl.DataFrame(
+                [[key] * len(lines), lines], schema=["header", "data"]
+            ).write_ipc(batch)
+            self.batches[key].append(batch)
+            lines.clear()
+        self.buffered = 0
+        if self.progress is not None:
+            self.progress(len(self.buffers))
+
+    def scan(self) -> pl.LazyFrame:
+        self.flush()
+        order = _section_order(self.batches, self.first_data)
+        batches = [batch for key in order for batch in self.batches[key]]
+        if not batches:
+            raise ValueError("no sar data found")
+        return pl.scan_ipc(batches)
+
+
+def _classify_lines(lines, state: _ParseState, sink, restart_field: list) -> None:
+    """Sort sar text lines into headers and data lines.
+
+    Header lines are registered via sink.add_header, data lines are handed to
+    sink.append together with their header, LINUX RESTART lines end up in
+    restart_field. `state` is updated in place so a file can be fed in
+    several chunks.
+    """
+    header = state.header
+    header_str = state.header_str
+    ignore_data = state.ignore_data
+    fc_host = state.fc_host
+    filesystem = state.filesystem
+    add_header = sink.add_header
+    append = sink.append
+    for line in lines:
         if empty_line.search(line):
             header = True
             ignore_data = False
@@ -132,76 +315,649 @@ def parse_sar_file(file_path: str, username: str, DEBUG: bool = False) -> pl.Dat
                 # first FILESYSTEM section gets rotated by handle_fibre_and_fs
                 filesystem = False
             header_str = " ".join(line.split()[1:])
-            if not file_dict.get(header_str):
-                file_dict[header_str] = []
+            add_header(header_str)
             header = False
         else:
             if fc_host or filesystem:
                 line = handle_fibre_and_fs(line)
-            file_dict[header_str].append(line)
+            append(header_str, line)
+    state.header = header
+    state.header_str = header_str
+    state.ignore_data = ignore_data
+    state.fc_host = fc_host
+    state.filesystem = filesystem
+
+
+PARSE_ENGINES = ("python", "polars")
+
+# lines per task handed to the process pool by _classify_parallel
+SECTION_CHUNK_LINES = 50_000
+
+
+def _section_chunks(lines, chunk_lines: int):
+    """Cut the line stream into runs of about chunk_lines lines.
+
+    Cuts are only made in front of a blank line. A blank line resets the
+    classifier (next time line is a header, nothing ignored) and that header
+    line sets fc_host/filesystem again, so every run classified with a fresh
+    _ParseState yields exactly what the serial loop yields for it.
+    """
+    chunk = []
+    for line in lines:
+        if len(chunk) >= chunk_lines and empty_line.search(line):
+            yield chunk
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield chunk
+
+
+def _classify_chunk(lines: list[str]) -> tuple[dict, list, str | None]:
+    """Process pool worker: classify one run of whole sections."""
+    collector = _LineCollector()
+    restart_field = []
+    _classify_lines(lines, _ParseState(), collector, restart_field)
+    return collector.file_dict, restart_field, collector.first_data
 
-    for key in file_dict:
-        length = len(file_dict[key])
-        columns = [
-            "header",
-            "data",
+
+def _merge_chunk(result: tuple, sink, restart_field: list) -> None:
+    file_dict, restarts, first_data = result
+    if sink.first_data is None:
+        sink.first_data = first_data
+    for header_str, data in file_dict.items():
+        sink.add_header(header_str)
+        if data:
+            sink.extend(header_str, data)
+    restart_field.extend(restarts)
+
+
+def _classify_parallel(lines, sink, restart_field: list, workers: int) -> None:
+    """Section-parallel variant of _classify_lines.
+
+    Runs of whole sections are classified in a process pool and merged into
+    `sink` in file order. At most 2 * workers runs are in flight, so the
+    streaming parser keeps its memory bound.
+    """
+    # spawn: forking a process that runs polars (and Streamlit) threads
+    # can deadlock the children
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        for chunk in _section_chunks(lines, SECTION_CHUNK_LINES):
+            pending.append(executor.submit(_classify_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                _merge_chunk(pending.popleft().result(), sink, restart_field)
+        while pending:
+            _merge_chunk(pending.popleft().result(), sink, restart_field)
+
+
+def _classify_file(lines, sink, restart_field: list, parallel: bool) -> None:
+    workers = Config.Config.parse_workers
+    if parallel and workers > 1:
+        _classify_parallel(lines, sink, restart_field, workers)
+    else:
+        _classify_lines(lines, _ParseState(), sink, restart_field)
+
+
+def _use_pool(file_path: str, parallel: bool | None) -> bool:
+    if parallel is None:
+        return os.path.getsize(file_path) >= Config.Config.parse_parallel_bytes
+    return parallel
+
+
+def _rotate_fibre_fs(frame, column: str, alias: str):
+    """Vectorized handle_fibre_and_fs: frame[column] with the last column
+    moved to position 1 (2 when the second token carries AM/PM), tokens
+    joined by one space, as frame[alias]. Works on eager and lazy frames."""
+    line, head = pl.col("_line"), pl.col("_head")
+    middle_len = pl.col("_middle_len")
+    return (
+        frame.with_columns(
+            _line=pl.col(column).str.strip_chars().str.replace_all(r"\s+", " ")
+        )
+        .with_columns(
+            _head=pl.when(
+                line.str.extract(r"^\S+ (\S+)").str.contains("(?i)AM|PM")
+            )
+            .then(line.str.extract(r"^(\S+ \S+)"))
+            .otherwise(line.str.extract(r"^(\S+)")),
+            _last=line.str.extract(r"(\S+)$"),
+        )
+        .with_columns(
+            _middle_len=line.str.len_chars().cast(pl.Int64)
+            - head.str.len_chars().cast(pl.Int64)
+            - pl.col("_last").str.len_chars().cast(pl.Int64)
+            - 2
+        )
+        .with_columns(
+            # too few tokens: list.insert followed by list.pop changes nothing
+            pl.when(middle_len > 0)
+            .then(
+                pl.concat_str(
+                    [
+                        head,
+                        pl.col("_last"),
+                        line.str.slice(
+                            head.str.len_chars() + 1, middle_len.clip(lower_bound=0)
+                        ),
+                    ],
+                    separator=" ",
+                )
+            )
+            .otherwise(line)
+            .alias(alias)
+        )
+        .drop("_line", "_head", "_last", "_middle_len")
+    )
+
+
+def _classify_vectorized(text: str) -> tuple[pl.DataFrame, list, str | None]:
+    """Polars engine for _classify_lines over the whole file at once.
+
+    Returns the (header, data) frame in file_dict order, the restart lines
+    and the first data line - exactly what _LineCollector collects:
+
+    - blank lines open a new section (cumulative sum); section 0 (before
+      the first blank line) has no header, its data lines are dropped
+      (the line classifier fails on such files)
+    - the first time line of a section that is no LINUX RESTART line is
+      the header; if it matches reg_ignore the rest of the section is
+      skipped, restart lines included
+    - data lines of sections whose header matches reg_fibre or
+      reg_filesystem are rotated like handle_fibre_and_fs does it
+
+    Sections are contiguous, so "first row of its section" and "belongs to
+    the header of its section" are shift/forward_fill comparisons instead
+    of window expressions.
+    """
+    line = pl.col("line")
+    section = pl.col("section")
+    candidate = ~pl.col("_restart")
+    first = pl.col("_first")
+    last_row = text.count("\n")
+    # section of the header (first candidate) the row belongs to
+    header_section = pl.when(first).then(section).forward_fill()
+    rows = (
+        pl.LazyFrame({"line": [text]})
+        .select(line.str.split("\n"))
+        .explode("line")
+        .with_row_index("_row")
+        .with_columns(section=line.str.contains(empty_line.pattern).cum_sum())
+        # everything else the classifier skips before looking at it
+        .filter(line.str.contains(reg_time.pattern))
+        .with_columns(_restart=line.str.contains(reg_linux_restart.pattern))
+        .with_columns(
+            _first=candidate
+            & (section > 0)
+            & (
+                section
+                != pl.when(candidate).then(section).forward_fill().shift(1)
+            ).fill_null(True)
+        )
+        .with_columns(
+            _ignored=first & line.str.contains(f"(?i){reg_ignore.pattern}"),
+            _after_header=(header_section == section).fill_null(False),
+        )
+        .with_columns(
+            _dropped=pl.col("_after_header")
+            & pl.when(first).then(pl.col("_ignored")).forward_fill(),
+        )
+        .with_columns(
+            _header=first & ~pl.col("_ignored"),
+            _data=candidate & ~first & pl.col("_after_header") & ~pl.col("_dropped"),
+            _restart=pl.col("_restart") & ~pl.col("_dropped"),
+        )
+        .filter(pl.col("_header") | pl.col("_data") | pl.col("_restart"))
+        .with_columns(
+            # readlines() keeps the line end, except on an unterminated last line
+            raw=pl.when(pl.col("_row") < last_row)
+            .then(line + "\n")
+            .otherwise(line),
+        )
+        .collect()
+    )
+
+    restart_field = (
+        rows.filter(pl.col("_restart"))
+        .select(pl.col("raw") + " " + line.str.extract(r"^(\S+)"))
+        .to_series()
+        .to_list()
+    )
+
+    fc, fs = pl.col("_fc"), pl.col("_fs")
+    headers = (
+        rows.lazy()
+        .filter(pl.col("_header"))
+        .with_columns(_fc=line.str.contains(f"(?i){reg_fibre.pattern}"))
+        .pipe(_rotate_fibre_fs, "line", "_once")
+        .pipe(_rotate_fibre_fs, "_once", "_twice")
+        .with_columns(
+            # reg_filesystem sees the line after the fibre rotation
+            _fs=pl.when(fc)
+            .then(pl.col("_once"))
+            .otherwise(line)
+            .str.contains(f"(?i){reg_filesystem.pattern}"),
+        )
+        .with_columns(
+            out=pl.when(fc & fs)
+            .then("_twice")
+            .when(fc | fs)
+            .then("_once")
+            .otherwise("raw")
+        )
+        .select(
+            "section",
+            header=pl.col("out").str.extract_all(r"\S+").list.slice(1).list.join(" "),
+            _rotated=fc | fs,
+            _header_row=pl.col("_row"),
+        )
+        .with_columns(_order=pl.col("_header_row").min().over("header"))
+        .collect()
+    )
+
+    # the header decides for the data lines of its whole section
+    data = rows.filter(pl.col("_data")).join(headers, on="section", how="inner")
+    data = pl.concat(
+        [
+            data.filter(~pl.col("_rotated")).with_columns(data=pl.col("raw")),
+            data.filter(pl.col("_rotated")).pipe(_rotate_fibre_fs, "line", "data"),
         ]
-        data = [[key] * length, file_dict[key]]
-        new_rows = pl.DataFrame(data, schema=columns)
-        df = df.vstack(new_rows)
-    # create os_details column
-    os_precol = pl.Series("os_details", [os_details])
-    os_column = pl.Series("os_details", [""] * (len(df) - 1))
-    os_column = os_precol.append(os_column)
-    df = df.with_columns(os_column)
-    # create restart column
-    length_restart_field = len(restart_field)
-    if length_restart_field > 0:
-        restart_precol = pl.Series("restart", restart_field)
-        restart_col = pl.Series(
-            "Linux_Restart", [""] * (len(df) - length_restart_field)
-        )
-        restart_col = restart_precol.append(restart_col)
-        df = df.with_columns(restart_col)
-    # check for AM/PM in time format first row of df column data
-    s = df.to_series(1)[0]
-    if reg_delete_us_time.search(s):
-        TIME_FORMAT = "AM_PM"
+    )
+    if data.height:
+        first_data = data.filter(pl.col("_row") == pl.col("_row").min())["data"][0]
     else:
-        TIME_FORMAT = "24"
-    if reg_replace_comma.search(s):
-        df = pl_helpers2.replace_comma_with_point(df, "data")
-
-    df = pl_helpers2.df_clean_data(df, "header")
-    df = pl_helpers2.df_reset_date(df, os_details, "data", "date", tformat=TIME_FORMAT)
-    df = pl_helpers2.clean_header(df, "header", TIME_FORMAT)
-    df = pl_helpers2.df_clean_spaces(df, "data")
-    df.write_parquet(parquet_file)
-    base_name = os.path.basename(parquet_file)
+        first_data = None
+    # one integer sort key is much cheaper than sorting by two columns
+    df = data.sort(
+        pl.col("_order").cast(pl.UInt64) * (1 << 32) + pl.col("_row")
+    ).select("header", "data")
+    return df, restart_field, first_data
+
+
+def _with_restarts(lf: pl.LazyFrame, restart_field: list) -> pl.LazyFrame:
+    """The restart lines as the first values of the restart column (by the
+    row number in `_row`)."""
+    return lf.with_columns(
+        pl.col("_row")
+        .replace_strict(
+            list(range(len(restart_field))),
+            restart_field,
+            default="",
+            return_dtype=pl.String,
+        )
+        .alias("restart")
+    )
+
+
+def _finalize_frame(
+    lf: pl.LazyFrame, os_details: str, restart_field: list, first_data: str
+) -> pl.LazyFrame:
+    """Turn the raw (header, data) rows into the stored layout.
+
+    Runs lazily so the eager and the streaming parser share it: os_details
+    goes into the first row, the restart lines into the first rows of the
+    restart column, then dates and headers are cleaned up.
+    """
+    lf = lf.with_row_index("_row").with_columns(
+        pl.when(pl.col("_row") == 0)
+        .then(pl.lit(os_details, dtype=pl.String))
+        .otherwise(pl.lit(""))
+        .alias("os_details")
+    )
+    if restart_field:
+        lf = _with_restarts(lf, restart_field)
+    lf = lf.drop("_row")
+    # check for AM/PM in time format first row of column data
+    TIME_FORMAT = _time_format(first_data)
+    if reg_replace_comma.search(first_data):
+        lf = pl_helpers2.replace_comma_with_point(lf, "data")
+
+    lf = pl_helpers2.df_clean_data(lf, "header")
+    lf = pl_helpers2.df_reset_date(lf, os_details, "data", "date", tformat=TIME_FORMAT)
+    lf = pl_helpers2.clean_header(lf, "header", TIME_FORMAT)
+    lf = pl_helpers2.df_clean_spaces(lf, "data")
+    return lf
+
 
+def _cache_parsed_df(df: pl.DataFrame, parquet_file: Path, username: str) -> None:
+    base_name = os.path.basename(parquet_file)
     rs = redis_mng.get_redis_conn()
     if rs:
-        r_item = f"{Config.Config.rkey_pref}:{username}"
-        file_name_parquet = f'{base_name.replace(".parquet", "_parquet")}'
-        p_obj = redis_mng.get_redis_val(r_item, property=file_name_parquet)
-        if not p_obj:
+        name = sar_store.base_path(base_name)
+        p_obj = redis_cache.get(username, name)
+        if not (p_obj and p_obj.startswith(redis_mng.FRAME_FORMAT)):
             try:
-                mem_obj = df.to_pandas().to_parquet()
-                redis_mng.set_redis_key(mem_obj, r_item, property=file_name_parquet)
-                logger.debug("%s, %s saved to redis", r_item, file_name_parquet)
+                redis_cache.put(username, name, redis_mng.convert_df_for_redis(df))
+                logger.debug("%s of %s saved to redis", name, username)
             except Exception as e:
                 logger.warning(
                     "could not connect to redis server or save %s to redis server: %s",
-                    file_name_parquet,
+                    name,
                     e,
                 )
 
+
+def parse_sar_file(
+    file_path: str,
+    username: str,
+    DEBUG: bool = False,
+    streaming: bool | None = None,
+    parallel: bool | None = None,
+    engine: str | None = None,
+) -> pl.DataFrame:
+    """Parse an ASCII sar file into the parquet layout and return it.
+
+    streaming=None picks the bounded-memory parser (stream_sar_file) for
+    files of at least Config.parse_streaming_bytes. parallel=None classifies
+    files of at least Config.parse_parallel_bytes section-parallel in a
+    process pool (Config.parse_workers); parallel=False keeps it serial.
+    engine ("python" or "polars", default Config.parse_engine) selects the
+    line classifier of the in-memory path; "polars" runs the vectorized
+    _classify_vectorized and ignores `parallel`.
+    """
+    engine = engine or Config.Config.parse_engine
+    if engine not in PARSE_ENGINES:
+        raise ValueError(f"unknown parse engine {engine!r}")
+    if streaming is None:
+        streaming = os.path.getsize(file_path) >= Config.Config.parse_streaming_bytes
+    if streaming:
+        parquet_file = stream_sar_file(file_path, DEBUG=DEBUG, parallel=parallel)
+        df = sar_store.read(parquet_file)
+        _cache_parsed_df(df, parquet_file, username)
+        return df
+
+    os_details = pl_helpers2.extract_os_details_from_file(file_path)
+    real_path = Path(file_path).absolute().as_posix()
+    parquet_file = sar_store.new_file(real_path)
+
+    if engine == "polars":
+        with open(file_path, "r") as sar_file:
+            df, restart_field, first_data = _classify_vectorized(sar_file.read())
+        df = _sort_sections(df, first_data)
+    else:
+        content = open(file_path, "r").readlines()
+        collector = _LineCollector()
+        restart_field = []
+        _classify_file(
+            content, collector, restart_field, _use_pool(file_path, parallel)
+        )
+        df = collector.frame()
+        first_data = collector.first_data
+    df = _finalize_frame(df.lazy(), os_details, restart_field, first_data).collect()
+    _unshare(parquet_file)
+    sar_store.write(df, parquet_file)
+    header_store.write_store(parquet_file)
+    _cache_parsed_df(df, parquet_file, username)
+
     if not DEBUG:
         os.system(f"rm -rf {real_path}")
+    file_catalog.refresh(parquet_file)
 
     return df
 
 
+def stream_sar_file(
+    file_path: str,
+    DEBUG: bool = False,
+    chunk_lines: int | None = None,
+    parallel: bool | None = None,
+    progress=None,
+) -> Path:
+    """Bounded-memory variant of parse_sar_file; returns the parquet path.
+
+    The file is read line by line and classified exactly like in
+    parse_sar_file, but data lines are spilled to Arrow IPC batches every
+    `chunk_lines` lines (Config.parse_chunk_lines by default). The
+    post-processing then runs as one lazy query over the batches and is
+    streamed into the parquet file, so peak memory follows the chunk size,
+    not the file size. The parquet content is identical to parse_sar_file,
+    and the typed per-header store (header_store) is written next to it.
+    The Redis cache is not filled here; get_data_frame does that on first use.
+    `progress(bytes read, sections found)` is called after every spill.
+    """
+    if chunk_lines is None:
+        chunk_lines = Config.Config.parse_chunk_lines
+    os_details = pl_helpers2.extract_os_details_from_file(file_path)
+    real_path = Path(file_path).absolute().as_posix()
+    parquet_file = sar_store.new_file(real_path)
+
+    restart_field = []
+    parallel = _use_pool(file_path, parallel)
+    with tempfile.TemporaryDirectory(
+        prefix=".tmp_parse_", dir=os.path.dirname(real_path)
+    ) as spill_dir:
+        with open(file_path, "r") as sar_file:
+            spill = _SectionSpill(
+                spill_dir, chunk_lines, _spill_progress(progress, sar_file.buffer)
+            )
+            _classify_file(sar_file, spill, restart_field, parallel)
+        lf = _finalize_frame(spill.scan(), os_details, restart_field, spill.first_data)
+        _unshare(parquet_file)
+        sar_store.write(lf, parquet_file)
+    header_store.write_store(parquet_file)
+
+    if not DEBUG:
+        os.system(f"rm -rf {real_path}")
+    file_catalog.refresh(parquet_file)
+
+    return parquet_file
+
+
+def _classify_sadf_blocks(items, sink, restart_field: list) -> dict:
+    """_classify_lines for the items of sar_ingest.iter_sadf_json.
+
+    sadf_json_to_sar_text renders every block as a blank line, a header line
+    and data lines, all starting with the same time. The classifier's rules
+    for such a block are applied to it directly instead of to the text.
+    Returns the host metadata.
+    """
+    host = {}
+    # Once the time itself passed reg_time, the rules only depend on what
+    # follows its first 8 characters, so they are evaluated once per header.
+    classified = {}
+    for kind, *payload in items:
+        if kind == "host":
+            host = payload[0]
+            continue
+        if kind == "restart":
+            line = f"{payload[0]}\n"
+            if reg_time.search(line):
+                restart_field.append(f"{line} {line.split()[0]}")
+            continue
+        time, header, values = payload
+        if not reg_time.match(time):
+            continue
+        key = (time[8:], header)
+        if key not in classified:
+            classified[key] = _classify_sadf_header(f"{time} {header}\n")
+        if classified[key] is None:
+            continue
+        header_str, rotate = classified[key]
+        sink.add_header(header_str)
+        lines = [f"{time} {value}\n" for value in values]
+        if rotate:
+            lines = [handle_fibre_and_fs(data) for data in lines]
+        if lines:
+            sink.extend(header_str, lines)
+    return host
+
+
+def _classify_sadf_header(line: str) -> tuple[str, bool] | None:
+    """(header_str, rotate data lines) for a header line, None if ignored."""
+    if reg_ignore.search(line):
+        return None
+    fc_host = bool(reg_fibre.search(line))
+    if fc_host:
+        line = handle_fibre_and_fs(line)
+    filesystem = bool(reg_filesystem.search(line))
+    if filesystem:
+        line = handle_fibre_and_fs(line)
+    return " ".join(line.split()[1:]), fc_host or filesystem
+
+
+def _stream_blocks(items, target: str, chunk_lines: int | None, progress=None) -> Path:
+    """Spill, finalize and store the items of sar_ingest.iter_sadf_json
+    (or iter_sa_binary) as the stored file of `target` (sar_store)."""
+    if chunk_lines is None:
+        chunk_lines = Config.Config.parse_chunk_lines
+    real_target = Path(target).absolute().as_posix()
+    parquet_file = sar_store.new_file(real_target)
+
+    restart_field = []
+    with tempfile.TemporaryDirectory(
+        prefix=".tmp_parse_", dir=os.path.dirname(real_target)
+    ) as spill_dir:
+        spill = _SectionSpill(spill_dir, chunk_lines, progress)
+        host = _classify_sadf_blocks(items, spill, restart_field)
+        os_details = pl_helpers2.clean_os_details(
+            f"{sar_ingest.sadf_os_details(host)}\n"
+        )
+        lf = _finalize_frame(spill.scan(), os_details, restart_field, spill.first_data)
+        _unshare(parquet_file)
+        sar_store.write(lf, parquet_file)
+    header_store.write_store(parquet_file)
+    file_catalog.refresh(parquet_file)
+    return parquet_file
+
+
+def stream_sadf_json(
+    json_file: str,
+    target: str,
+    DEBUG: bool = False,
+    chunk_lines: int | None = None,
+    progress=None,
+) -> tuple[Path, list[str]]:
+    """Ingest a sadf -j export straight into the stored file of `target`.
+
+    Produces what sar_ingest.sadf_json_to_sar_text followed by
+    parse_sar_file produces, without rendering and re-parsing the text: the
+    JSON is read incrementally, every header block is classified as its text
+    would be, spilled like in stream_sar_file and finalized the same way.
+    Returns the parquet path and the conversion warnings. Raises ValueError
+    on broken JSON. `progress` as in stream_sar_file.
+    """
+    warnings: set[str] = set()
+    with open(json_file, "rb") as source:
+        parquet_file = _stream_blocks(
+            sar_ingest.iter_sadf_json(source, warnings),
+            target,
+            chunk_lines,
+            _spill_progress(progress, source),
+        )
+
+    if not DEBUG:
+        os.remove(json_file)
+
+    return parquet_file, sorted(warnings)
+
+
+def stream_sa_file(
+    sa_file: str,
+    target: str,
+    DEBUG: bool = False,
+    chunk_lines: int | None = None,
+    progress=None,
+    complete: bool | None = None,
+) -> tuple[Path, list[str]]:
+    """stream_sadf_json for a binary sa file, decoded without the sar binary
+    (sar_ingest.iter_sa_binary). Raises ValueError if sa_binary cannot read
+    the file, or cannot read all of it while sar is installed (`complete`,
+    see sa_binary.iter_sa_records); the caller then falls back to sar -A.
+    """
+    warnings: set[str] = set()
+    with open(sa_file, "rb") as source:
+        parquet_file = _stream_blocks(
+            sar_ingest.iter_sa_binary(source, warnings, complete),
+            target,
+            chunk_lines,
+            _spill_progress(progress, source),
+        )
+
+    if not DEBUG:
+        os.remove(sa_file)
+
+    return parquet_file, sorted(warnings)
+
+
+def append_sar_lines(parquet_file: str | Path, lines) -> tuple[int, list[str]]:
+    """Append the rows of `lines` that `parquet_file` does not hold yet.
+
+    `lines` is sar text: the lines added to a file since the last push, or
+    the whole current version of it. They are classified like in
+    parse_sar_file; of every header only the rows past the last stored
+    timestamp of that header are kept, plus restarts not seen before. Data
+    lines whose header is not part of `lines` cannot be classified and are
+    dropped.
+
+    The parquet is rewritten from its current row groups plus the new rows
+    (no re-parse of the stored data), sorted by header again with the new
+    rows after the stored ones, and replaced atomically; the typed
+    store is only rebuilt for the headers that got rows. Returns the number
+    of rows appended and those headers.
+    """
+    parquet_file = Path(parquet_file)
+    stored = sar_store.scan(parquet_file)
+    columns = stored.collect_schema().names()
+    os_details = (
+        stored.filter(pl.col("os_details").str.contains("Linux"))
+        .select("os_details")
+        .head(1)
+        .collect()
+        .item()
+    )
+    known_restarts = set()
+    if "restart" in columns:
+        known_restarts = set(
+            stored.filter(pl.col("restart").str.contains("RESTART"))
+            .select("restart")
+            .collect()["restart"]
+        )
+    last = stored.group_by("header").agg(pl.col("date").max().alias("_last"))
+
+    collector = _LineCollector()
+    restart_field = []
+    _classify_lines(lines, _ParseState(), collector, restart_field)
+    if collector.first_data is None:
+        return 0, []
+    delta = (
+        _finalize_frame(collector.frame().lazy(), os_details, [], collector.first_data)
+        .with_columns(os_details=pl.lit(""))
+        .join(last, on="header", how="left", maintain_order="left")
+        .filter(pl.col("_last").is_null() | (pl.col("date") > pl.col("_last")))
+        .drop("_last")
+        .collect()
+    )
+    if delta.is_empty():
+        return 0, []
+
+    new_restarts = [line for line in restart_field if line not in known_restarts]
+    if new_restarts:
+        delta = _with_restarts(delta.with_row_index("_row"), new_restarts).drop("_row")
+        if "restart" not in columns:
+            columns.insert(columns.index("date"), "restart")
+            stored = stored.with_columns(restart=pl.lit(""))
+    elif "restart" in columns:
+        delta = delta.with_columns(restart=pl.lit(""))
+
+    tmp = parquet_file.with_name(f".tmp_append_{os.getpid()}_{parquet_file.name}")
+    try:
+        sar_store.write(
+            pl.concat(
+                [stored.select(columns), delta.lazy().select(columns)]
+            ).sort("header", maintain_order=True),
+            tmp,
+        )
+        # a new inode: other links of the old file (dedup_store) keep theirs
+        os.replace(tmp, parquet_file)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+    headers = delta["header"].unique(maintain_order=True).to_list()
+    header_store.update_store(parquet_file, headers)
+    file_catalog.refresh(parquet_file)
+    return delta.height, headers
+
+
 if __name__ == "__main__":
     # big
     # my_file = "sar20230605.parquet"
@@ -0,0 +1,188 @@
+"""Compare the parse engines of parse_into_polars on a corpus of sar files.
+
+Every file is parsed by the legacy line-by-line classifier (the reference)
+and by the variants below; the resulting frames must be identical. sadf
+JSON exports (*.json) are converted to sar text for the reference and
+compared against the direct ingest of stream_sadf_json. Binary sa files are
+converted with ``sar -A`` (the sysstat version that wrote them must be
+installed) and every header sa_binary decodes must match that output; the
+headers it does not decode are listed (uploads send those files through
+sar -A).
+
+    python parse_parity.py <sar file or directory> ...
+
+Exits with 1 if any file differs or fails to parse.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from polars.testing import assert_frame_equal
+
+os.environ.setdefault("REDIS_ENABLED", "false")
+
+import parse_into_polars as parse_polars
+import polars as pl
+import sa_binary
+import sar_ingest
+import sar_store
+
+VARIANTS = {
+    "polars": {"engine": "polars", "streaming": False},
+    "streaming": {"engine": "python", "streaming": True, "parallel": False},
+    "parallel": {"engine": "python", "streaming": False, "parallel": True},
+}
+REFERENCE = {"engine": "python", "streaming": False, "parallel": False}
+
+
+def _parse(sar_file: Path, work_dir: str, kwargs: dict) -> tuple[object, float]:
+    copy = Path(work_dir) / sar_file.name
+    shutil.copy(sar_file, copy)
+    start = time.perf_counter()
+    df = parse_polars.parse_sar_file(str(copy), "parity", DEBUG=True, **kwargs)
+    elapsed = time.perf_counter() - start
+    copy.unlink()
+    shutil.rmtree(Path(f"{copy}.typed"), ignore_errors=True)
+    sar_store.stored_file(copy).unlink()
+    return df, elapsed
+
+
+def _parse_json(json_file: Path, work_dir: str) -> tuple[object, float]:
+    copy = Path(work_dir) / json_file.name
+    shutil.copy(json_file, copy)
+    target = Path(work_dir) / sar_ingest.strip_json_suffix(json_file.name)
+    start = time.perf_counter()
+    parquet_file, _ = parse_polars.stream_sadf_json(str(copy), str(target))
+    elapsed = time.perf_counter() - start
+    df = sar_store.read(parquet_file)
+    shutil.rmtree(Path(f"{target}.typed"), ignore_errors=True)
+    parquet_file.unlink()
+    return df, elapsed
+
+
+def check_json(json_file: Path) -> bool:
+    with tempfile.TemporaryDirectory(prefix="parse_parity_") as work_dir:
+        (Path(work_dir) / "text").mkdir()
+        text_file = Path(work_dir) / "text" / sar_ingest.strip_json_suffix(json_file.name)
+        start = time.perf_counter()
+        text, _ = sar_ingest.sadf_json_to_sar_text(json_file.read_bytes())
+        text_file.write_text(text)
+        convert_time = time.perf_counter() - start
+        reference, ref_time = _parse(text_file, work_dir, REFERENCE)
+        ref_time += convert_time
+        try:
+            df, elapsed = _parse_json(json_file, work_dir)
+            assert_frame_equal(df, reference)
+        except Exception as e:
+            print(f"FAIL {json_file} [sadf-json]: {e}")
+            return False
+    speedup = ref_time / elapsed if elapsed else float("inf")
+    print(
+        f"ok   {json_file} [sadf-json] {reference.height} rows, "
+        f"{ref_time:.2f}s -> {elapsed:.2f}s ({speedup:.1f}x)"
+    )
+    return True
+
+
+def _sar_text(sa_file: Path, text_file: Path) -> None:
+    env = {k: v for k, v in os.environ.items() if k != "LANG"}
+    with open(text_file, "wb") as output:
+        subprocess.run(
+            ["sar", "-A", "-t", "-f", str(sa_file)], stdout=output, env=env, check=True
+        )
+
+
+def check_sa(sa_file: Path) -> bool:
+    if not sa_binary.sar_available():
+        print(f"FAIL {sa_file} [sa-binary]: sar is not installed")
+        return False
+    with tempfile.TemporaryDirectory(prefix="parse_parity_") as work_dir:
+        (Path(work_dir) / "text").mkdir()
+        text_file = Path(work_dir) / "text" / f"sar_{sa_file.name}"
+        start = time.perf_counter()
+        _sar_text(sa_file, text_file)
+        convert_time = time.perf_counter() - start
+        reference, ref_time = _parse(text_file, work_dir, REFERENCE)
+        ref_time += convert_time
+        copy = Path(work_dir) / sa_file.name
+        shutil.copy(sa_file, copy)
+        try:
+            start = time.perf_counter()
+            parquet_file, _ = parse_polars.stream_sa_file(
+                str(copy), str(Path(work_dir) / f"native_{sa_file.name}"),
+                complete=False,
+            )
+            elapsed = time.perf_counter() - start
+            # row order within a header is not part of the comparison
+            columns = ["header", "date", "data"]
+            df = sar_store.read(parquet_file).select(columns).sort(columns)
+            headers = df["header"].unique().to_list()
+            assert_frame_equal(
+                df,
+                reference.filter(pl.col("header").is_in(headers))
+                .select(columns)
+                .sort(columns),
+            )
+        except Exception as e:
+            print(f"FAIL {sa_file} [sa-binary]: {e}")
+            return False
+    reference_headers = reference["header"].drop_nulls().unique()
+    missing = reference_headers.filter(~reference_headers.is_in(headers))
+    speedup = ref_time / elapsed if elapsed else float("inf")
+    print(
+        f"ok   {sa_file} [sa-binary] {df.height} of {reference.height} rows, "
+        f"{ref_time:.2f}s -> {elapsed:.2f}s ({speedup:.1f}x)"
+    )
+    for header in missing.sort():
+        print(f"     not decoded natively: {header}")
+    return True
+
+
+def check_file(sar_file: Path) -> bool:
+    if sar_file.suffix == ".json":
+        return check_json(sar_file)
+    if sa_binary.is_sa_file(sar_ingest.read_head(sar_file, 2)):
+        return check_sa(sar_file)
+    ok = True
+    with tempfile.TemporaryDirectory(prefix="parse_parity_") as work_dir:
+        reference, ref_time = _parse(sar_file, work_dir, REFERENCE)
+        for name, kwargs in VARIANTS.items():
+            try:
+                df, elapsed = _parse(sar_file, work_dir, kwargs)
+                assert_frame_equal(df, reference)
+            except Exception as e:
+                print(f"FAIL {sar_file} [{name}]: {e}")
+                ok = False
+                continue
+            speedup = ref_time / elapsed if elapsed else float("inf")
+            print(
+                f"ok   {sar_file} [{name}] {reference.height} rows, "
+                f"{ref_time:.2f}s -> {elapsed:.2f}s ({speedup:.1f}x)"
+            )
+    return ok
+
+
+def sar_files(paths: list[str]) -> list[Path]:
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(
+                p for p in sorted(path.iterdir())
+                if p.is_file() and p.suffix != ".parquet"
+            )
+        else:
+            files.append(path)
+    return files
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    results = [check_file(f) for f in sar_files(sys.argv[1:])]
+    sys.exit(0 if all(results) else 1)
@@ -1,18 +1,24 @@
 import re
+from datetime import datetime
+
 import polars as pl
 from sqlite2_polars import get_header_from_alias, get_sub_device_from_header
 
 
-def extract_os_details_from_file(file):
+def clean_os_details(line: str) -> str:
     reg_time = re.compile(r"^.*\d{2}/\d{2}/\d{2}.*$")
+    os_details = line.replace("[", "").replace("]", "")
+    if reg_time.search(os_details):
+        os_details = re.sub(r'(\d{2}/\d{2}/\d{2,4})', 
+            lambda x: x.group().replace('/', '-'), os_details)
+    return os_details
+
+
+def extract_os_details_from_file(file):
     with open(file, "r") as sar_file:
         for _, line in enumerate(sar_file):
             if "Linux" in line:
-                os_details = line.replace("[", "").replace("]", "")
-                if reg_time.search(os_details):
-                    os_details = re.sub(r'(\d{2}/\d{2}/\d{2,4})', 
-                        lambda x: x.group().replace('/', '-'), os_details)
-                return os_details
+                return clean_os_details(line)
 
 
 def format_date(os_details: str) -> tuple:
@@ -52,14 +58,15 @@ def df_reset_date(
 ) -> pl.DataFrame:
     date_str, format = format_date(os_details)
     # Extract the time portion from the column based on the tformat
+    # expressions only (no df.select): works for DataFrame and LazyFrame
     if tformat == "AM_PM":
-        date_column = df.select(
+        date_column = (
             pl.col(column_name)
             .str.extract(r"(^\d{2}:\d{2}:\d{2}\s+(AM|PM))")
             .alias(alias)
         )
     else:
-        date_column = df.select(
+        date_column = (
             pl.col(column_name).str.extract(r"(^\d{2}:\d{2}:\d{2})\s+").alias(alias)
         )
     df = df.with_columns(date_column)
@@ -175,12 +182,70 @@ def get_df_from_sub_device(
     return df.filter(pl.col(column) == sub_device)
 
 
-def create_metrics_df(df: pl.DataFrame, column: str) -> pl.DataFrame:
+def split_sub_devices(df: pl.DataFrame, column: str) -> dict:
+    """One frame per device in a single pass over the rows (instead of a
+    get_df_from_sub_device filter per device), in order of appearance."""
+    if column not in df.columns:
+        return {}
+    return {
+        key[0]: frame
+        for key, frame in df.partition_by(
+            column, as_dict=True, maintain_order=True
+        ).items()
+    }
+
+
+DESCRIBE_STATISTICS = (
+    "count", "null_count", "mean", "std", "min", "25%", "50%", "75%", "max"
+)
+
+
+def describe_sub_devices(df: pl.DataFrame, column: str) -> dict:
+    """describe() of the numeric columns of every device, computed in one
+    group_by over the whole frame; {device: frame as describe() returns it},
+    empty without numeric columns."""
+    metrics = [c for c, t in zip(df.columns, df.dtypes) if t.is_numeric()]
+    if not metrics or column not in df.columns:
+        return {}
+    aggs = []
+    for metric in metrics:
+        col = pl.col(metric)
+        aggs.extend(
+            (col.count(), col.null_count(), col.mean(), col.std(), col.min())
+        )
+        aggs.extend(col.quantile(q, "nearest") for q in (0.25, 0.5, 0.75))
+        aggs.append(col.max())
+    width = len(DESCRIBE_STATISTICS)
+    grouped = df.group_by(column, maintain_order=True).agg(
+        agg.cast(pl.Float64).alias(f"{index}") for index, agg in enumerate(aggs)
+    )
+    # one row per device and statistic, then one frame per device
+    statistics = grouped.select(
+        column,
+        pl.lit(list(DESCRIBE_STATISTICS), dtype=pl.List(pl.String)).alias(
+            "statistic"
+        ),
+        *(
+            pl.concat_list(
+                f"{index * width + offset}" for offset in range(width)
+            ).alias(metric)
+            for index, metric in enumerate(metrics)
+        ),
+    ).explode("statistic", *metrics)
+    return {
+        device: frame.drop(column)
+        for device, frame in split_sub_devices(statistics, column).items()
+    }
+
+
+def create_metrics_df(
+    df: pl.DataFrame, column: str, drop_sub_device: bool = True
+) -> pl.DataFrame:
     header_list = column.split()
     for index in range(len(header_list)):
         df = df.with_columns(pl.col(column).list.get(index).alias(header_list[index]))
     df.drop_in_place(column)
-    if "sub_device" in df.columns:
+    if drop_sub_device and "sub_device" in df.columns:
         df.drop_in_place("sub_device")
     return df
 
@@ -209,8 +274,16 @@ def get_date_df(
     return df.filter(pl.col(column) >= start).filter(pl.col(column) <= end)
 
 
-def get_headers(df: pl.DataFrame) -> list:
-    return df.unique("header")["header"].to_list()
+def collect(df: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame:
+    """Collect a LazyFrame (parse_into_polars.get_lazy_frame); DataFrames
+    pass through. Lets the helpers below take either."""
+    if isinstance(df, pl.LazyFrame):
+        return df.collect()
+    return df
+
+
+def get_headers(df: pl.DataFrame | pl.LazyFrame) -> list:
+    return collect(df.select("header").unique())["header"].to_list()
 
 
 def get_data_frames_from_header(header: str, df: pl.DataFrame) -> pl.DataFrame:
@@ -218,32 +291,55 @@ def get_data_frames_from_header(header: str, df: pl.DataFrame) -> pl.DataFrame:
     return df.filter(pl.col("header") == header)
 
 
-def get_os_details_from_df(df: pl.DataFrame) -> str:
-    return df.filter(pl.col("os_details").str.contains("Linux"))[
-        "os_details"
-    ].to_list()[0]
+def get_os_details_from_df(df: pl.DataFrame | pl.LazyFrame) -> str:
+    return collect(
+        df.select("os_details").filter(pl.col("os_details").str.contains("Linux"))
+    )["os_details"].to_list()[0]
 
 
-def get_restart_headers(df: pl.DataFrame) -> list:
+def get_restart_headers(df: pl.DataFrame | pl.LazyFrame) -> list:
     if column_exists(df, "restart"):
-        return df.filter(pl.col("restart").str.contains("RESTART"))["restart"].to_list()
+        return collect(
+            df.select("restart").filter(pl.col("restart").str.contains("RESTART"))
+        )["restart"].to_list()
     else:
         return []
 
 
-def column_exists(df: pl.DataFrame, column_name: str) -> bool:
-    return column_name in df.columns
+def column_exists(df: pl.DataFrame | pl.LazyFrame, column_name: str) -> bool:
+    return column_name in df.collect_schema().names()
+
+
+def date_filter(
+    column: str, start: datetime | None = None, end: datetime | None = None
+) -> pl.Expr:
+    """`start <= column <= end`, either bound optional."""
+    condition = pl.lit(True)
+    if start is not None:
+        condition &= pl.col(column) >= start
+    if end is not None:
+        condition &= pl.col(column) <= end
+    return condition
 
 
-def get_data_frames_from__headers(headers: list, df: pl.DataFrame, column: str) -> list:
+def get_data_frames_from__headers(
+    headers: list,
+    df: pl.DataFrame | pl.LazyFrame,
+    column: str,
+    condition: pl.Expr | None = None,
+) -> list:
+    """(date, <header>) frame of every header. On a LazyFrame the header
+    filter and `condition` (on date/data) are pushed down to the scan."""
     df_list = []
     df = df.select(pl.col("*").exclude("os_details", "restart"))
     for header in headers:
         single_df = df.filter(pl.col(column) == header)
+        if condition is not None:
+            single_df = single_df.filter(condition)
         single_df = single_df.select(pl.col("*").exclude("header"))
         single_df = single_df.select(["date", "data"])
         single_df = single_df.rename({"data": header})
-        df_list.append(single_df)
+        df_list.append(collect(single_df))
     return df_list
 
 
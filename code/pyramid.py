@@ -0,0 +1,107 @@
+"""Peak-preserving downsampling of sar time series.
+
+Charts used to stride-sample (bokeh_charts) or randomly sample (alt) frames
+that exceed their point budget, which drops exactly the short spikes one
+looks for in sar data. Two replacements live here:
+
+- `build_levels` aggregates a typed header frame (header_store) into
+  coarser levels of LEVELS rows per bucket and device, keeping the mean as
+  the metric column plus `<metric>_min` and `<metric>_max`. header_store
+  writes them at ingest next to the full-resolution file, and readers with
+  a point budget (the /data endpoint) pick the finest level that fits.
+- `peak_positions` picks, for frames already in memory, the rows holding
+  the minimum and maximum of every numeric column per bucket (min/max
+  decimation), so a downsampled line chart still reaches every extreme.
+"""
+
+import numpy as np
+import polars as pl
+import polars.selectors as cs
+
+# rows per bucket of the stored levels, finest first
+LEVELS = (10, 60, 600)
+MIN_SUFFIX = "_min"
+MAX_SUFFIX = "_max"
+
+
+def build_levels(typed: pl.DataFrame, device: bool) -> dict[int, pl.DataFrame]:
+    """Levels of a typed frame (date, [device], metrics...), keyed by the
+    number of rows per bucket. Levels that would not reduce any series are
+    skipped, so small files get none."""
+    keys = ["device"] if device else []
+    metrics = [c for c in typed.columns if c not in ("date", "device")]
+    if typed.height == 0 or not metrics:
+        return {}
+    rows = (
+        typed.group_by(keys).len()["len"].max() if keys else typed.height
+    )
+    position = pl.int_range(pl.len())
+    if keys:
+        position = position.over(keys)
+    levels = {}
+    for factor in LEVELS:
+        if rows <= factor:
+            break
+        levels[factor] = (
+            typed.with_columns((position // factor).alias("_bucket"))
+            .group_by([*keys, "_bucket"], maintain_order=True)
+            .agg(
+                pl.col("date").first(),
+                *(pl.col(m).mean().round(2).alias(m) for m in metrics),
+                *(pl.col(m).min().alias(f"{m}{MIN_SUFFIX}") for m in metrics),
+                *(pl.col(m).max().alias(f"{m}{MAX_SUFFIX}") for m in metrics),
+            )
+            .drop("_bucket")
+            .select("date", *keys, pl.exclude("date", *keys))
+        )
+    return levels
+
+
+def peak_positions(values: np.ndarray, max_rows: int) -> np.ndarray:
+    """Sorted row positions of `values` (rows x numeric columns) that keep
+    at most `max_rows` rows: per bucket the first and last row and the rows
+    of each column's minimum and maximum. A `max_rows` below
+    2 * columns + 2 gets one bucket, trimmed to the first and last row and
+    the extremes of the first columns."""
+    rows, columns = values.shape
+    if rows <= max_rows:
+        return np.arange(rows)
+    if columns == 0:
+        step = (rows + max_rows - 1) // max_rows
+        return np.arange(0, rows, step)
+    # first, last, minimum and maximum of every column per bucket (M4)
+    buckets = max(1, max_rows // (2 * columns + 2))
+    bucket = np.arange(rows) * buckets // rows
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    keep = [starts, np.r_[starts[1:], rows] - 1]
+    values = values.astype(float, copy=False)
+    for reduce, fill in ((np.maximum, -np.inf), (np.minimum, np.inf)):
+        filled = np.where(np.isnan(values), fill, values)
+        extremes = reduce.reduceat(filled, starts, axis=0)
+        for column in range(columns):
+            hits = np.flatnonzero(filled[:, column] == extremes[bucket, column])
+            # the first row per bucket that reaches the extreme
+            keep.append(hits[np.r_[True, bucket[hits][1:] != bucket[hits][:-1]]])
+    if buckets * (2 * columns + 2) <= max_rows:
+        return np.unique(np.concatenate(keep))
+    # budget too small for one bucket: first and last row, then the
+    # maximum and minimum of column 0, 1, ... until max_rows are picked
+    maxima, minima = keep[2 : 2 + columns], keep[2 + columns :]
+    candidates = np.concatenate(
+        [keep[0], keep[1], *(np.r_[high, low] for high, low in zip(maxima, minima))]
+    )
+    _, first = np.unique(candidates, return_index=True)
+    return np.sort(candidates[np.sort(first)][:max_rows])
+
+
+def downsample_frame(df, max_rows: int):
+    """A pandas or polars frame reduced to at most `max_rows` rows with
+    peak_positions over its numeric columns; shorter frames are returned
+    as they are."""
+    if len(df) <= max_rows:
+        return df
+    if isinstance(df, pl.DataFrame):
+        numeric = df.select(cs.numeric()).to_numpy().astype(float)
+        return df[peak_positions(numeric, max_rows)]
+    numeric = df.select_dtypes("number").to_numpy(dtype=float, na_value=np.nan)
+    return df.iloc[peak_positions(numeric, max_rows)]
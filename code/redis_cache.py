@@ -0,0 +1,251 @@
+"""Size accounting, budgets and idle expiry of the frames cached in Redis.
+
+Parsed frames live in one hash per user (`<rkey_pref>:<user>`, field
+`<file>_parquet`, redis_mng.convert_df_for_redis). Nothing used to bound
+them: every file a user ever opened stayed cached. Next to the hashes this
+module keeps
+
+    sar:cache:lru      sorted set  "<user>/<field>" -> last access (epoch s)
+    sar:cache:bytes    hash        "<user>/<field>" -> size of the entry
+    sar:cache:counters hash        hits, misses, evictions, expired
+
+and on every fill evicts the least recently used entries until the user is
+within Config.redis_cache_user_mb and all users are within
+Config.redis_cache_mb; entries not read for Config.redis_cache_idle_ttl
+seconds are dropped, and the hash of a user who stops reading expires as a
+whole after the same time. A budget or TTL of 0 disables that limit.
+
+All processes (UI, API workers) share the accounting through Redis. It is
+best effort: concurrent fills may briefly overshoot a budget, and entries
+removed behind its back (redis_mng.delete_redis_keys, an expired hash) are
+reconciled on the next sweep.
+"""
+
+import logging
+import time
+
+import redis_mng
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+LRU_KEY = "sar:cache:lru"
+BYTES_KEY = "sar:cache:bytes"
+COUNTERS_KEY = "sar:cache:counters"
+COUNTERS = ("hits", "misses", "evictions", "expired")
+
+
+def user_key(user: str) -> str:
+    return f"{Config.rkey_pref}:{user}"
+
+
+def field(name: str) -> str:
+    """Hash field of the frame of the sar file `name` (base name)."""
+    return f"{name}_parquet"
+
+
+def _member(user: str, name: str) -> str:
+    return f"{user}/{field(name)}"
+
+
+def _split(member: str) -> tuple[str, str]:
+    # file names never contain "/", user names might
+    user, _, hash_field = member.rpartition("/")
+    return user, hash_field
+
+
+def _budget(megabytes: int) -> int:
+    return megabytes * 1024 * 1024
+
+
+def get(user: str, name: str) -> bytes | None:
+    """Cached value of the sar file `name` of `user`, or None."""
+    rs = redis_mng.get_redis_conn(decode=False)
+    if not rs:
+        return None
+    member = _member(user, name)
+    try:
+        data = rs.hget(user_key(user), field(name))
+        pipe = rs.pipeline()
+        if data is None:
+            pipe.hincrby(COUNTERS_KEY, "misses", 1)
+            # gone behind our back (expired hash, manual delete)
+            pipe.zrem(LRU_KEY, member)
+            pipe.hdel(BYTES_KEY, member)
+        else:
+            pipe.hincrby(COUNTERS_KEY, "hits", 1)
+            # also adopts entries cached before the accounting existed
+            pipe.zadd(LRU_KEY, {member: time.time()})
+            pipe.hset(BYTES_KEY, member, len(data))
+            if Config.redis_cache_idle_ttl:
+                pipe.expire(user_key(user), Config.redis_cache_idle_ttl)
+        pipe.execute()
+        return data
+    except Exception as e:
+        redis_mng.report_error(e)
+        logger.warning("redis cache read of %s failed: %s", member, e)
+        return None
+
+
+def put(user: str, name: str, data: bytes) -> bool:
+    """Cache `data` for the sar file `name` of `user` and enforce the
+    budgets. False if it was not cached (Redis off, larger than a budget)."""
+    rs = redis_mng.get_redis_conn(decode=False)
+    if not rs:
+        return False
+    budgets = [
+        _budget(mb)
+        for mb in (Config.redis_cache_mb, Config.redis_cache_user_mb)
+        if mb
+    ]
+    if budgets and len(data) > min(budgets):
+        drop(user, name)
+        return False
+    member = _member(user, name)
+    try:
+        pipe = rs.pipeline()
+        pipe.hset(user_key(user), field(name), data)
+        pipe.zadd(LRU_KEY, {member: time.time()})
+        pipe.hset(BYTES_KEY, member, len(data))
+        if Config.redis_cache_idle_ttl:
+            pipe.expire(user_key(user), Config.redis_cache_idle_ttl)
+        pipe.execute()
+        sweep(keep=member)
+        return True
+    except Exception as e:
+        redis_mng.report_error(e)
+        logger.warning("redis cache fill of %s failed: %s", member, e)
+        return False
+
+
+def drop(user: str, *names: str) -> None:
+    """Remove the cached frames of `names` (re-upload, delete) in one
+    pipeline."""
+    _drop_members([_member(user, name) for name in names])
+
+
+def _drop_members(members: list[str], counter: str | None = None) -> None:
+    rs = redis_mng.get_redis_conn(decode=False)
+    if not rs or not members:
+        return
+    try:
+        pipe = rs.pipeline()
+        for member in members:
+            user, hash_field = _split(member)
+            pipe.hdel(user_key(user), hash_field)
+            pipe.zrem(LRU_KEY, member)
+            pipe.hdel(BYTES_KEY, member)
+        if counter:
+            pipe.hincrby(COUNTERS_KEY, counter, len(members))
+        pipe.execute()
+    except Exception as e:
+        redis_mng.report_error(e)
+        logger.warning("redis cache drop failed: %s", e)
+
+
+def _entries(rs) -> list[tuple[str, float, int]]:
+    """(member, last access, bytes) of all tracked entries, oldest first."""
+    sizes = {
+        member.decode(): int(size) for member, size in rs.hgetall(BYTES_KEY).items()
+    }
+    return [
+        (member.decode(), score, sizes.get(member.decode(), 0))
+        for member, score in rs.zrange(LRU_KEY, 0, -1, withscores=True)
+    ]
+
+
+def sweep(keep: str | None = None) -> None:
+    """Expire idle entries, then evict least recently used ones until every
+    user and the total are within budget. `keep` (the entry just filled)
+    is evicted last."""
+    rs = redis_mng.get_redis_conn(decode=False)
+    if not rs:
+        return
+    now = time.time()
+    try:
+        entries = _entries(rs)
+    except Exception as e:
+        redis_mng.report_error(e)
+        return
+    if Config.redis_cache_idle_ttl:
+        idle = [m for m, last, _ in entries if now - last > Config.redis_cache_idle_ttl]
+        _drop_members(idle, "expired")
+        entries = [e for e in entries if e[0] not in idle]
+    if keep:
+        entries.sort(key=lambda entry: entry[0] == keep)
+
+    evicted = set()
+    user_budget = _budget(Config.redis_cache_user_mb)
+    if user_budget:
+        per_user: dict[str, int] = {}
+        for member, _, size in entries:
+            user = _split(member)[0]
+            per_user[user] = per_user.get(user, 0) + size
+        for member, _, size in entries:
+            user = _split(member)[0]
+            if per_user[user] > user_budget:
+                evicted.add(member)
+                per_user[user] -= size
+    total_budget = _budget(Config.redis_cache_mb)
+    if total_budget:
+        total = sum(size for member, _, size in entries if member not in evicted)
+        for member, _, size in entries:
+            if total <= total_budget:
+                break
+            if member not in evicted:
+                evicted.add(member)
+                total -= size
+    _drop_members(sorted(evicted), "evictions")
+
+
+def stats() -> dict:
+    """Budgets, bytes and entries per user and file, and the counters of
+    all processes. Entries whose hash field is gone are reconciled first.
+    `connection` is the state of this process's client (redis_mng)."""
+    result = {
+        "enabled": False,
+        "budget_bytes": _budget(Config.redis_cache_mb),
+        "user_budget_bytes": _budget(Config.redis_cache_user_mb),
+        "idle_ttl_seconds": Config.redis_cache_idle_ttl,
+        "connection": redis_mng.connection_stats(),
+    }
+    rs = redis_mng.get_redis_conn(decode=False)
+    if not rs:
+        return result
+    try:
+        entries = _entries(rs)
+        pipe = rs.pipeline()
+        for member, _, _ in entries:
+            pipe.hexists(user_key(_split(member)[0]), _split(member)[1])
+        exists = pipe.execute()
+        _drop_members([e[0] for e, found in zip(entries, exists) if not found])
+        entries = [e for e, found in zip(entries, exists) if found]
+        counters = {
+            key.decode(): int(value) for key, value in rs.hgetall(COUNTERS_KEY).items()
+        }
+    except Exception as e:
+        redis_mng.report_error(e)
+        logger.warning("redis cache stats failed: %s", e)
+        return result
+
+    now = time.time()
+    users: dict[str, dict] = {}
+    for member, last, size in entries:
+        user, hash_field = _split(member)
+        record = users.setdefault(user, {"username": user, "bytes": 0, "files": []})
+        record["bytes"] += size
+        record["files"].append(
+            {
+                "name": hash_field.removesuffix("_parquet"),
+                "bytes": size,
+                "idle_seconds": round(now - last),
+            }
+        )
+    result.update(
+        enabled=True,
+        total_bytes=sum(user["bytes"] for user in users.values()),
+        entries=len(entries),
+        users=sorted(users.values(), key=lambda user: user["bytes"], reverse=True),
+        **{name: counters.get(name, 0) for name in COUNTERS},
+    )
+    return result
@@ -0,0 +1,55 @@
+"""Cost of a Redis cache fill and hit for a parsed sar file, old vs new.
+
+Old: df.to_pandas().to_parquet() to fill, pl.read_parquet to read back.
+New: redis_mng.convert_df_for_redis / convert_df_from_redis (tagged Arrow
+IPC) with every compression of Config.redis_ipc_compression. Only the
+(de)serialization is timed; the Redis round trip moves the same bytes.
+
+    python redis_cache_bench.py <parquet file> [repeats]
+"""
+
+import io
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("REDIS_ENABLED", "false")
+
+import polars as pl
+import redis_mng
+from config import Config
+
+
+def _median(function, repeats: int) -> tuple[float, object]:
+    runs, result = [], None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        runs.append(time.perf_counter() - start)
+    return statistics.median(runs), result
+
+
+def bench(parquet_file: str, repeats: int) -> None:
+    df = pl.read_parquet(parquet_file)
+    print(f"{parquet_file}: {df.height} rows")
+    print(f"{'format':<22}{'fill':>10}{'hit':>10}{'bytes':>14}")
+
+    fill, blob = _median(lambda: df.to_pandas().to_parquet(), repeats)
+    hit, _ = _median(lambda: pl.read_parquet(io.BytesIO(blob)), repeats)
+    print(f"{'pandas parquet (old)':<22}{fill * 1000:>8.1f}ms{hit * 1000:>8.1f}ms{len(blob):>14}")
+
+    for compression in ("uncompressed", "lz4", "zstd"):
+        Config.redis_ipc_compression = compression
+        fill, blob = _median(lambda: redis_mng.convert_df_for_redis(df), repeats)
+        hit, back = _median(lambda: redis_mng.convert_df_from_redis(blob), repeats)
+        assert back.equals(df)
+        label = f"arrow ipc {compression}"
+        print(f"{label:<22}{fill * 1000:>8.1f}ms{hit * 1000:>8.1f}ms{len(blob):>14}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    bench(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -1,49 +1,130 @@
 #!/usr/bin/python3
+import io
 from streamlit import button as st_button
+import polars as pl
+import pyarrow as pa
 import redis
+import threading
+import time
 import visual_funcs as visf
 from config import Config
 import logging
 
-# Module-level cache for Redis connections and status
-_redis_cache = {}
-_redis_disabled = False
+# One connection pool per decode flag. Failures trip a circuit breaker
+# instead of disabling Redis for good: while it is open callers get None and
+# fall back to disk at no cost; after a backoff window (doubling up to
+# Config.redis_retry_max_seconds) the next caller probes with a ping.
+_pools = {}
+_clients = {}
+_lock = threading.Lock()
+_breaker = {
+    "state": "half-open",  # probe on first use
+    "retry_at": 0.0,
+    "backoff": None,
+}
+_metrics = {
+    "failures": 0,
+    "fallbacks": 0,
+    "trips": 0,
+    "recoveries": 0,
+}
 
-def get_redis_conn(decode=True):
-    global _redis_disabled
 
-    if _redis_disabled or not Config.redis_enabled:
-        return None
+def _client(decode):
+    if decode not in _clients:
+        connection_params = {
+            "host": Config.redis_host,
+            "port": Config.redis_port,
+            "encoding": "utf-8",
+            "decode_responses": decode,
+            "socket_timeout": 1.0,           # Fast failure if Redis is down
+            "socket_connect_timeout": 1.0,   # Fast failure if Redis is down
+            "retry_on_timeout": False,
+            "health_check_interval": Config.redis_health_check_interval,
+            "max_connections": Config.redis_max_connections,
+        }
+        if Config.redis_user:
+            connection_params["username"] = Config.redis_user
+        if Config.redis_password:
+            connection_params["password"] = Config.redis_password
+        _pools[decode] = redis.ConnectionPool(**connection_params)
+        _clients[decode] = redis.StrictRedis(connection_pool=_pools[decode])
+    return _clients[decode]
 
-    cache_key = f"conn_{decode}"
-    if cache_key in _redis_cache:
-        return _redis_cache[cache_key]
-
-    connection_params = {
-        "host": Config.redis_host,
-        "port": Config.redis_port,
-        "encoding": "utf-8",
-        "decode_responses": decode,
-        "socket_timeout": 1.0,           # Fast failure if Redis is down
-        "socket_connect_timeout": 1.0,   # Fast failure if Redis is down
-        "retry_on_timeout": False,
-    }
-    if Config.redis_user:
-        connection_params["username"] = Config.redis_user
-    if Config.redis_password:
-        connection_params["password"] = Config.redis_password
 
+def report_error(exc):
+    """Open the circuit breaker if `exc` means Redis is unreachable. Callers
+    that catch errors of their own Redis commands pass them here."""
+    if isinstance(exc, (redis.ConnectionError, redis.TimeoutError)):
+        _trip(exc)
+
+
+def _trip(exc):
+    with _lock:
+        _metrics["failures"] += 1
+        backoff = _breaker["backoff"] or Config.redis_retry_seconds
+        if _breaker["backoff"] is None:  # was healthy (or never probed)
+            _metrics["trips"] += 1
+            logging.warning("redis unreachable (%s), retrying in %ss", exc, backoff)
+        _breaker["state"] = "open"
+        _breaker["retry_at"] = time.monotonic() + backoff
+        _breaker["backoff"] = min(backoff * 2, Config.redis_retry_max_seconds)
+        pools = list(_pools.values())
+    # drop the broken sockets, the probe reconnects
+    for pool in pools:
+        pool.disconnect()
+
+
+def get_redis_conn(decode=True):
+    """Pooled client, or None while Redis is disabled or unreachable."""
+    if not Config.redis_enabled:
+        return None
+    with _lock:
+        if _breaker["state"] == "open":
+            if time.monotonic() < _breaker["retry_at"]:
+                _metrics["fallbacks"] += 1
+                return None
+            _breaker["state"] = "half-open"
+        probe = _breaker["state"] == "half-open"
+        rs = _client(decode)
+    if not probe:
+        return rs
     try:
-        rs = redis.StrictRedis(**connection_params)
-        # Probe reachability exactly once. The 1s connect timeout applies only
-        # to this ping; on failure we disable Redis for the whole process so no
-        # later operation pays the timeout again (and callers fall back cleanly).
         rs.ping()
-        _redis_cache[cache_key] = rs
-        return rs
-    except Exception:
-        _redis_disabled = True
+    except Exception as e:
+        _trip(e)
+        with _lock:
+            _metrics["fallbacks"] += 1
         return None
+    with _lock:
+        if _breaker["state"] == "half-open":
+            _breaker["state"] = "closed"
+            if _breaker["backoff"] is not None:
+                _metrics["recoveries"] += 1
+            _breaker["backoff"] = None
+    return rs
+
+
+def connection_stats():
+    """Circuit breaker state, failure/fallback counters and pool sizes."""
+    with _lock:
+        result = {
+            "enabled": Config.redis_enabled,
+            "state": _breaker["state"] if Config.redis_enabled else "disabled",
+            "retry_in_seconds": max(0.0, round(_breaker["retry_at"] - time.monotonic(), 1))
+                if _breaker["state"] == "open" else 0.0,
+            **_metrics,
+        }
+        pools = dict(_pools)
+    result["pools"] = {
+        ("str" if decode else "bytes"): {
+            "connections": getattr(pool, "_created_connections", None),
+            "in_use": len(getattr(pool, "_in_use_connections", ())),
+            "max_connections": pool.max_connections,
+        }
+        for decode, pool in pools.items()
+    }
+    return result
 
 # for pickled connections we need connect with decode False
 def get_rs():
@@ -59,8 +140,8 @@ def show_keys():
     try:
         for key in rs.scan_iter('*'):
             klist.append(key)
-    except Exception:
-        pass
+    except Exception as e:
+        report_error(e)
     return klist
 
 def show_hash_keys(hash):
@@ -68,7 +149,8 @@ def show_hash_keys(hash):
     if not rs: return []
     try:
         return rs.hkeys(hash)
-    except Exception:
+    except Exception as e:
+        report_error(e)
         return []
 
 def delete_redis_keys():
@@ -79,20 +161,33 @@ def delete_redis_keys():
     hash = col1.selectbox('Select hash', show_keys())
     hash_keys = col1.multiselect('Select n keys', show_hash_keys(hash))
     if st_button('Submit'):
-        try:
-            for hkey in hash_keys:
-                rs.hdel(hash, hkey)
-        except Exception:
-            pass
+        del_redis_key_properties(hash, hash_keys, decode=True)
 
 def redis_tasks(col):
     cols = visf.create_columns(4,[0,1,1,1])
     col1 = cols[0]
-    redis_actions = ['Delete Redis Keys']
+    redis_actions = ['Delete Redis Keys', 'Show Cache Usage']
     r_ph = col1.empty()
     redis_sel = r_ph.selectbox('Redis Tasks', redis_actions, key="m_redis")
     if redis_sel == 'Delete Redis Keys':
         delete_redis_keys()
+    elif redis_sel == 'Show Cache Usage':
+        show_cache_usage(col1)
+
+def show_cache_usage(col):
+    import redis_cache
+    stats = redis_cache.stats()
+    if not stats['enabled']:
+        col.write('Redis is not available')
+        return
+    col.write(f"{stats['total_bytes']/1024/1024:.1f} of {stats['budget_bytes']/1024/1024:.0f} MB "
+              f"in {stats['entries']} entries, {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['evictions']} evicted, {stats['expired']} expired")
+    rows = [{'User': user['username'], 'File': file['name'],
+             'Size': f"{round(file['bytes']/1024/1024, 2)} MB",
+             'Idle': f"{file['idle_seconds']//3600} h"}
+            for user in stats['users'] for file in user['files']]
+    col.dataframe(rows)
 
 def get_redis_val(rkey, decode=False, property=None):
     rs = get_redis_conn(decode=decode)
@@ -103,9 +198,21 @@ def get_redis_val(rkey, decode=False, property=None):
             return rs.hget(rkey, property)
         else:
             return rs.get(rkey)
-    except Exception:
+    except Exception as e:
+        report_error(e)
         return None
 
+def get_redis_vals(rkey, properties, decode=False):
+    """Several fields of the hash `rkey` in one round trip (None for missing)."""
+    rs = get_redis_conn(decode=decode)
+    if not rs or not properties:
+        return [None] * len(properties)
+    try:
+        return rs.hmget(rkey, properties)
+    except Exception as e:
+        report_error(e)
+        return [None] * len(properties)
+
 def set_redis_key(data, rkey, property=None, decode=False):
     """data -> dict or value
        key_pref, e.g user
@@ -123,17 +230,50 @@ def set_redis_key(data, rkey, property=None, decode=False):
         else:
             rs.set(rkey, data)
     except Exception as e:
-        pass
+        report_error(e)
 
 def del_redis_key_property(rkey, property, decode=False):
+    del_redis_key_properties(rkey, [property], decode=decode)
+
+def del_redis_key_properties(rkey, properties, decode=False):
+    """Remove several fields of the hash `rkey` with one HDEL."""
     rs = get_redis_conn(decode=decode)
-    if not rs:
+    if not rs or not properties:
         return None
     try:
-        if rs.hexists(rkey, property):
-            rs.hdel(rkey, property)
-    except Exception:
-        pass
+        rs.hdel(rkey, *properties)
+    except Exception as e:
+        report_error(e)
+
+# Parsed frames are cached as this tag followed by the frame as an Arrow IPC
+# file. Entries without it (the pandas parquet blobs of older versions) are
+# treated as misses and overwritten on the next fill.
+FRAME_FORMAT = b"SARIPC1\n"
+
 
-def convert_df_for_redis(df):
-    return df.to_pandas().to_parquet()
+def convert_df_for_redis(df: pl.DataFrame) -> bytes:
+    """Polars frame -> Redis value, without a pandas round trip.
+
+    Compressed with Config.redis_ipc_compression: uncompressed entries are
+    read back without copying, lz4 or zstd trade that for less Redis memory.
+    """
+    buffer = io.BytesIO()
+    buffer.write(FRAME_FORMAT)
+    df.write_ipc(buffer, compression=Config.redis_ipc_compression)
+    return buffer.getvalue()
+
+
+def convert_df_from_redis(data: bytes | None) -> pl.DataFrame | None:
+    """Redis value of convert_df_for_redis -> frame; None for a miss, an
+    entry of another format or a broken one.
+
+    The Arrow buffers of an uncompressed entry point into `data` itself.
+    """
+    if not data or not data.startswith(FRAME_FORMAT):
+        return None
+    try:
+        ipc = pa.ipc.open_file(pa.py_buffer(memoryview(data)[len(FRAME_FORMAT):]))
+        return pl.from_arrow(ipc.read_all())
+    except Exception:
+        logging.warning("broken frame in redis ignored")
+        return None
@@ -0,0 +1,806 @@
+"""Reader for binary sysstat data files (sa files) without the sar binary.
+
+Decodes the current sysstat data file format (format magic 0x2175, written
+by sysstat 11.x and 12.x) from Python: file magic, file header, activity
+list, record headers and the per-activity statistics of every record. The
+raw counters are turned into the values sar prints (rates over the record
+interval, percentages, derived memory figures) and emitted as statistics
+entries shaped like the ones of ``sadf -j``, so sar_ingest renders them into
+the same header blocks as a JSON upload (sar_ingest.iter_sa_binary).
+
+Decoded activities: what sadc collects by default (CPU, process/context
+switch, swapping, paging, I/O, memory plus swap utilisation, kernel tables,
+queue/load, TTY, network interfaces and their errors, NFS client and
+server, sockets, hugepages, softnet, pressure stall), with ``-S DISK``
+(disks, fibre channel hosts) and with ``-S SNMP`` / ``-S IPV6`` (IP, ICMP,
+TCP and UDP counters, IPv6 sockets). Interrupts and CPU frequency are
+dropped like in the JSON path. Any other activity (power management,
+filesystems), or a structure version not listed in _DECODERS, would be
+lost: where the sar binary is installed such files raise ValueError so
+that ``sar -A`` converts all of it; without it the activity is skipped with
+a warning. Files in an older format, or whose layout does not check out,
+raise ValueError as well; callers fall back to ``sar -A``.
+
+Layout (all integers in the byte order of the host that wrote the file):
+
+    file_magic   sysstat/format magic, version, header size, types
+    file_header  time, CPU count, activity count, uname strings, ...
+    file_activity[sa_act_nr]
+    records      record_header followed by, depending on the type:
+                 R_STATS      every activity: [item count], items
+                 R_RESTART    new CPU count
+                 R_COMMENT    comment text
+"""
+
+import contextlib
+import shutil
+import struct
+import sys
+
+SYSSTAT_MAGIC = 0xD596
+FORMAT_MAGIC = 0x2175
+FILE_MAGIC_PADDING = 48
+FILE_MAGIC_SIZE = 2 + 2 + 4 + 5 * 4 + FILE_MAGIC_PADDING
+UTSNAME_LEN = 65
+MAX_COMMENT_LEN = 64
+
+# (nr of unsigned long long, unsigned long, unsigned int) of the structures
+FILE_HEADER_TYPES = {(1, 1, 11), (1, 1, 12)}
+FILE_ACTIVITY_TYPES = (0, 0, 9)
+RECORD_HEADER_TYPES = (2, 0, 1)
+
+R_STATS = 1
+R_RESTART = 2
+R_LAST_STATS = 3
+R_COMMENT = 4
+
+A_CPU = 1
+A_PCSW = 2
+A_SWAP = 4
+A_PAGE = 5
+A_IO = 6
+A_MEMORY = 7
+A_KTABLES = 8
+A_QUEUE = 9
+A_SERIAL = 10
+A_DISK = 11
+A_NET_DEV = 12
+A_NET_EDEV = 13
+A_NET_NFS = 14
+A_NET_NFSD = 15
+A_NET_SOCK = 16
+A_NET_IP = 17
+A_NET_EIP = 18
+A_NET_ICMP = 19
+A_NET_EICMP = 20
+A_NET_TCP = 21
+A_NET_ETCP = 22
+A_NET_UDP = 23
+A_NET_SOCK6 = 24
+A_NET_IP6 = 25
+A_NET_EIP6 = 26
+A_NET_ICMP6 = 27
+A_NET_EICMP6 = 28
+A_NET_UDP6 = 29
+A_HUGE = 34
+A_FCHOST = 38
+A_SOFTNET = 39
+A_PSI_CPU = 40
+A_PSI_IO = 41
+A_PSI_MEM = 42
+
+ACTIVITY_NAMES = {
+    1: "CPU", 2: "pcsw", 3: "interrupts", 4: "swap", 5: "paging", 6: "io",
+    7: "memory", 8: "ktables", 9: "queue", 10: "serial", 11: "disk",
+    12: "net-dev", 13: "net-edev", 14: "net-nfs", 15: "net-nfsd",
+    16: "net-sock", 17: "net-ip", 18: "net-eip", 19: "net-icmp",
+    20: "net-eicmp", 21: "net-tcp", 22: "net-etcp", 23: "net-udp",
+    24: "net-sock6", 25: "net-ip6", 26: "net-eip6", 27: "net-icmp6",
+    28: "net-eicmp6", 29: "net-udp6", 30: "power-cpu", 31: "power-fan",
+    32: "power-temp", 33: "power-in", 34: "hugepages", 35: "power-freq",
+    36: "power-usb", 37: "filesystems", 38: "fchost", 39: "softnet",
+    40: "psi-cpu", 41: "psi-io", 42: "psi-mem",
+}
+
+# the text parser drops these sections anyway (see sar_ingest._SKIPPED_SECTIONS)
+IGNORED_ACTIVITIES = {3, 30, 35}
+
+MAX_IFACE_LEN = 16
+MAX_FCH_LEN = 16
+C_DUPLEX_FULL = 2
+
+
+def is_sa_file(head: bytes) -> bool:
+    """True for data files written by sadc (either byte order)."""
+    return len(head) >= 2 and SYSSTAT_MAGIC in (
+        struct.unpack("<H", head[:2])[0], struct.unpack(">H", head[:2])[0]
+    )
+
+
+def _c_string(raw: bytes) -> str:
+    return raw.split(b"\0", 1)[0].decode("utf-8", "replace")
+
+
+class _Activity:
+    __slots__ = ("id", "magic", "nr", "nr2", "has_nr", "size", "types", "item")
+
+    def __init__(self, fields: tuple, endian: str, sizeof_long: int):
+        self.id, self.magic, self.nr, self.nr2, self.has_nr, self.size = fields[:6]
+        self.types = tuple(fields[6:9])
+        ulong = "Q" if sizeof_long == 8 else "I"
+        n_ull, n_ul, n_u = self.types
+        # sadc lays the counters out by type: all unsigned long long first,
+        # then unsigned long, then unsigned int (sa_common.c swap_struct)
+        self.item = struct.Struct(f"{endian}{'Q' * n_ull}{ulong * n_ul}{'I' * n_u}")
+        if self.item.size > self.size or self.nr < 0 or self.nr2 < 0:
+            raise ValueError(f"inconsistent activity {self.id} in sa file")
+
+    @property
+    def name(self) -> str:
+        return ACTIVITY_NAMES.get(self.id, f"activity {self.id}")
+
+
+class SaFile:
+    """Sequential reader over one sa file (see the module docstring)."""
+
+    def __init__(self, source):
+        self.source = source
+        magic = self._read_exact(FILE_MAGIC_SIZE, "file magic")
+        if struct.unpack("<H", magic[:2])[0] == SYSSTAT_MAGIC:
+            self.endian = "<"
+        elif struct.unpack(">H", magic[:2])[0] == SYSSTAT_MAGIC:
+            self.endian = ">"
+        else:
+            raise ValueError("not a sysstat data file")
+        e = self.endian
+        format_magic = struct.unpack(f"{e}H", magic[2:4])[0]
+        self.version = ".".join(str(part) for part in magic[4:7])
+        if format_magic != FORMAT_MAGIC:
+            raise ValueError(
+                f"unsupported sa file format 0x{format_magic:04x} "
+                f"(sysstat {self.version})"
+            )
+        header_size, _upgraded, *hdr_types = struct.unpack(f"{e}5I", magic[8:28])
+        if tuple(hdr_types) not in FILE_HEADER_TYPES:
+            raise ValueError(f"unsupported sa file header (sysstat {self.version})")
+        self._read_header(self._read_exact(header_size, "file header"), hdr_types[2])
+        self.activities = [
+            _Activity(
+                struct.unpack(f"{e}6i3I", self._read_exact(self.act_size, "activity")[:36]),
+                e,
+                self.sizeof_long,
+            )
+            for _ in range(self.act_nr)
+        ]
+        self.record_header = struct.Struct(f"{e}QQIBBBB")
+
+    def _read_exact(self, size: int, what: str) -> bytes:
+        data = self.source.read(size)
+        if len(data) != size:
+            raise ValueError(f"sa file truncated in {what}")
+        return data
+
+    def _read_header(self, header: bytes, n_u: int) -> None:
+        e = self.endian
+        ints = struct.unpack_from(f"{e}{n_u}i", header, 16)
+        self.cpu_nr, self.act_nr, year = ints[0], ints[1], ints[2]
+        act_types, rec_types = tuple(ints[3:6]), tuple(ints[6:9])
+        self.act_size, self.rec_size = ints[9], ints[10]
+        extra_next = ints[11] if n_u > 11 else 0
+        if act_types != FILE_ACTIVITY_TYPES or rec_types != RECORD_HEADER_TYPES:
+            raise ValueError(f"unsupported sa file layout (sysstat {self.version})")
+        if self.act_size < 36 or self.rec_size < 24 or extra_next:
+            raise ValueError(f"unsupported sa file layout (sysstat {self.version})")
+        offset = 16 + 4 * n_u
+        day, month, self.sizeof_long = struct.unpack_from("BBb", header, offset)
+        if self.sizeof_long not in (4, 8):
+            raise ValueError("sa file header is corrupt")
+        offset += 3
+        sysname, nodename, release, machine = (
+            _c_string(header[offset + i * UTSNAME_LEN:offset + (i + 1) * UTSNAME_LEN])
+            for i in range(4)
+        )
+        self.host = {
+            "nodename": nodename,
+            "sysname": sysname,
+            "release": release,
+            "machine": machine,
+            "number-of-cpus": max(self.cpu_nr - 1, 1),
+            "file-date": f"{year + 1900:04d}-{month + 1:02d}-{day:02d}",
+        }
+
+    def records(self):
+        """(record_type, uptime_cs, 'HH:MM:SS', payload) in file order.
+
+        payload is the new CPU count for R_RESTART, a list of raw items per
+        activity for statistics records and None otherwise. A record cut
+        short at the end of the file (sadc still writing) ends the walk.
+        """
+        e = self.endian
+        while True:
+            raw = self.source.read(self.rec_size)
+            if len(raw) < self.rec_size:
+                return
+            uptime_cs, _ust, extra_next, rtype, hour, minute, second = (
+                self.record_header.unpack_from(raw)
+            )
+            if rtype not in (R_STATS, R_RESTART, R_LAST_STATS, R_COMMENT) or (
+                hour > 23 or minute > 59 or second > 60 or extra_next
+            ):
+                raise ValueError("sa file records are out of sync")
+            time = f"{hour:02d}:{minute:02d}:{second:02d}"
+            try:
+                if rtype == R_RESTART:
+                    payload = struct.unpack(f"{e}i", self._read_exact(4, "restart"))[0]
+                    self._restart(payload)
+                elif rtype == R_COMMENT:
+                    self._read_exact(MAX_COMMENT_LEN, "comment")
+                    payload = None
+                else:
+                    payload = self._read_stats()
+            except ValueError:
+                if self.source.read(1):
+                    raise
+                return  # last record incomplete
+            yield rtype, uptime_cs, time, payload
+
+    def _restart(self, cpu_nr: int) -> None:
+        # per-CPU activities without an item count follow the new CPU count
+        for act in self.activities:
+            if not act.has_nr and act.nr == self.cpu_nr:
+                act.nr = cpu_nr
+        self.cpu_nr = cpu_nr
+        self.host["number-of-cpus"] = max(cpu_nr - 1, 1)
+
+    def _read_stats(self) -> dict:
+        stats = {}
+        for act in self.activities:
+            nr = act.nr
+            if act.has_nr:
+                nr = struct.unpack(f"{self.endian}i", self._read_exact(4, act.name))[0]
+                if nr < 0:
+                    raise ValueError("sa file records are out of sync")
+            data = self._read_exact(nr * act.nr2 * act.size, act.name)
+            if act.id in _DECODERS:
+                stats[act.id] = [
+                    (act.item.unpack_from(data, offset), data[offset:offset + act.size])
+                    for offset in range(0, len(data), act.size)
+                ]
+        return stats
+
+
+def _rate(prev, curr, itv: int) -> float:
+    """S_VALUE: per-second rate of a counter over itv hundredths of a second."""
+    return (curr - prev) / itv * 100
+
+
+def _percent(prev, curr, total) -> float:
+    return 0.0 if curr < prev or not total else (curr - prev) / total * 100
+
+
+def _cpu(prev, curr, itv):
+    rows = []
+    for index, ((p, _), (c, _)) in enumerate(zip(prev, curr)):
+        # user/nice include guest/guest_nice, so both are left out of the total
+        total = sum(c[:8]) - sum(p[:8])
+        row = {"cpu": "all" if index == 0 else str(index - 1)}
+        if total <= 0:
+            # tickless or offline CPU, shown idle like sar does
+            row.update(
+                usr=0.0, nice=0.0, sys=0.0, iowait=0.0, steal=0.0, irq=0.0,
+                soft=0.0, guest=0.0, gnice=0.0, idle=100.0,
+            )
+        else:
+            row.update(
+                usr=_percent(p[0] - p[8], c[0] - c[8], total),
+                nice=_percent(p[1] - p[9], c[1] - c[9], total),
+                sys=_percent(p[2], c[2], total),
+                iowait=_percent(p[4], c[4], total),
+                steal=_percent(p[5], c[5], total),
+                irq=_percent(p[6], c[6], total),
+                soft=_percent(p[7], c[7], total),
+                guest=_percent(p[8], c[8], total),
+                gnice=_percent(p[9], c[9], total),
+                idle=_percent(p[3], c[3], total),
+            )
+        rows.append(row)
+    return "cpu-load", rows
+
+
+def _pcsw(prev, curr, itv):
+    (p, _), (c, _) = prev[0], curr[0]
+    return "process-and-context-switch", {
+        "proc": _rate(p[1], c[1], itv),
+        "cswch": _rate(p[0], c[0], itv),
+    }
+
+
+def _swap(prev, curr, itv):
+    (p, _), (c, _) = prev[0], curr[0]
+    return "swap-pages", {"pswpin": _rate(p[0], c[0], itv), "pswpout": _rate(p[1], c[1], itv)}
+
+
+def _paging(prev, curr, itv):
+    (p, _), (c, _) = prev[0], curr[0]
+    scanned = (c[5] - p[5]) + (c[6] - p[6])
+    return "paging", {
+        "pgpgin": _rate(p[0], c[0], itv),
+        "pgpgout": _rate(p[1], c[1], itv),
+        "fault": _rate(p[2], c[2], itv),
+        "majflt": _rate(p[3], c[3], itv),
+        "pgfree": _rate(p[4], c[4], itv),
+        "pgscank": _rate(p[5], c[5], itv),
+        "pgscand": _rate(p[6], c[6], itv),
+        "pgsteal": _rate(p[7], c[7], itv),
+        "vmeff-percent": (c[7] - p[7]) / scanned * 100 if scanned else 0.0,
+    }
+
+
+def _io(prev, curr, itv):
+    (p, _), (c, _) = prev[0], curr[0]
+    return "io", {
+        "tps": _rate(p[0], c[0], itv),
+        "rtps": _rate(p[1], c[1], itv),
+        "wtps": _rate(p[2], c[2], itv),
+        "bread": _rate(p[3], c[3], itv),
+        "bwrtn": _rate(p[4], c[4], itv),
+    }
+
+
+def _memory(prev, curr, itv):
+    (c, _) = curr[0]
+    (frmkb, bufkb, camkb, tlmkb, frskb, tlskb, caskb, comkb, activekb, inactkb,
+     dirtykb, anonpgkb, slabkb, kstackkb, pgtblkb, vmusedkb, availablekb) = c[:17]
+    nousedmem = frmkb + bufkb + camkb + slabkb
+    if nousedmem > tlmkb:
+        nousedmem = frmkb
+    memused = tlmkb - nousedmem
+    swpused = tlskb - frskb
+    return "memory", {
+        "memfree": frmkb,
+        "avail": availablekb,
+        "memused": memused,
+        "memused-percent": memused / tlmkb * 100 if tlmkb else 0.0,
+        "buffers": bufkb,
+        "cached": camkb,
+        "commit": comkb,
+        "commit-percent": comkb / (tlmkb + tlskb) * 100 if tlmkb + tlskb else 0.0,
+        "active": activekb,
+        "inactive": inactkb,
+        "dirty": dirtykb,
+        "anonpg": anonpgkb,
+        "slab": slabkb,
+        "kstack": kstackkb,
+        "pgtbl": pgtblkb,
+        "vmused": vmusedkb,
+        "swpfree": frskb,
+        "swpused": swpused,
+        "swpused-percent": swpused / tlskb * 100 if tlskb else 0.0,
+        "swpcad": caskb,
+        "swpcad-percent": caskb / swpused * 100 if swpused else 0.0,
+    }
+
+
+def _queue(prev, curr, itv):
+    (c, _) = curr[0]
+    nr_running, procs_blocked, load_1, load_5, load_15, nr_threads = c[:6]
+    return "queue", {
+        "runq-sz": nr_running,
+        "plist-sz": nr_threads,
+        "ldavg-1": load_1 / 100,
+        "ldavg-5": load_5 / 100,
+        "ldavg-15": load_15 / 100,
+        "blocked": procs_blocked,
+    }
+
+
+def _disk(prev, curr, itv):
+    def split(values):
+        # nr_ios, sectors and ticks for read, write (and discard since
+        # sysstat 12.1), tot_ticks, rq_ticks, major, minor
+        if len(values) == 11:
+            sectors, ticks = values[1:4], values[4:7]
+        else:
+            sectors, ticks = values[1:3], values[3:5]
+        return values[0], sum(sectors), sectors[0], sectors[1], sum(ticks), values[-4], values[-3]
+
+    previous = {values[-2:]: split(values) for values, _ in prev}
+    rows = []
+    for values, _ in curr:
+        c = split(values)
+        p = previous.get(values[-2:], (0,) * 7)
+        ios = c[0] - p[0]
+        rows.append({
+            "disk-device": f"dev{values[-2]}-{values[-1]}",
+            "tps": _rate(p[0], c[0], itv),
+            "rkB": _rate(p[2], c[2], itv) / 2,
+            "wkB": _rate(p[3], c[3], itv) / 2,
+            "areq-sz": (c[1] - p[1]) / ios / 2 if ios else 0.0,
+            "aqu-sz": _rate(p[6], c[6], itv) / 1000,
+            "await": (c[4] - p[4]) / ios if ios else 0.0,
+            "util-percent": _rate(p[5], c[5], itv) / 10,
+        })
+    return "disk", rows
+
+
+def _net_dev(prev, curr, itv):
+    offset = 7 * 8 + 4
+
+    def name(raw):
+        return _c_string(raw[offset:offset + MAX_IFACE_LEN])
+
+    previous = {name(raw): values for values, raw in prev}
+    rows = []
+    for values, raw in curr:
+        p = previous.get(name(raw), (0,) * 8)
+        c = values
+        rx, tx = _rate(p[2], c[2], itv), _rate(p[3], c[3], itv)
+        speed = c[7] * 1_000_000
+        if not speed:
+            ifutil = 0.0
+        elif raw[offset + MAX_IFACE_LEN] == C_DUPLEX_FULL:
+            ifutil = max(rx, tx) * 800 / speed
+        else:
+            ifutil = (rx + tx) * 800 / speed
+        rows.append({
+            "iface": name(raw),
+            "rxpck": _rate(p[0], c[0], itv),
+            "txpck": _rate(p[1], c[1], itv),
+            "rxkB": rx / 1024,
+            "txkB": tx / 1024,
+            "rxcmp": _rate(p[4], c[4], itv),
+            "txcmp": _rate(p[5], c[5], itv),
+            "rxmcst": _rate(p[6], c[6], itv),
+            "ifutil-percent": ifutil,
+        })
+    return "network", {"net-dev": rows}
+
+
+def _delta(prev, curr, bits: int) -> int:
+    """curr - prev of a counter of `bits` bits, wrapped like the unsigned
+    subtraction of sar."""
+    return (curr - prev) % (1 << bits)
+
+
+def _counters(section: str, fields: list[str], bits: int, network: bool = True):
+    """Decoder of an activity whose counters are, in structure order, the
+    per-second `fields` of `section` (the SNMP and NFS activities)."""
+
+    def decode(prev, curr, itv):
+        (p, _), (c, _) = prev[0], curr[0]
+        values = {
+            field: _delta(a, b, bits) / itv * 100
+            for field, a, b in zip(fields, p, c)
+        }
+        return ("network", {section: values}) if network else (section, values)
+
+    return decode
+
+
+def _ktables(prev, curr, itv):
+    (c, _) = curr[0]
+    file_used, inode_used, dentry_stat, pty_nr = c[:4]
+    return "kernel", {
+        "dentunusd": dentry_stat,
+        "file-nr": file_used,
+        "inode-nr": inode_used,
+        "pty-nr": pty_nr,
+    }
+
+
+def _serial(prev, curr, itv):
+    # rx, tx, frame, parity, brk, overrun, line + 1 (0: unused slot)
+    previous = {values[6]: values for values, _ in prev}
+    rows = []
+    for c, _ in curr:
+        if not c[6]:
+            continue
+        p = previous.get(c[6], c)
+        rows.append({
+            "line": c[6] - 1,
+            "rcvin": _delta(p[0], c[0], 32) / itv * 100,
+            "xmtin": _delta(p[1], c[1], 32) / itv * 100,
+            "framerr": _delta(p[2], c[2], 32) / itv * 100,
+            "prtyerr": _delta(p[3], c[3], 32) / itv * 100,
+            "brk": _delta(p[4], c[4], 32) / itv * 100,
+            "ovrun": _delta(p[5], c[5], 32) / itv * 100,
+        })
+    return "serial", rows
+
+
+def _net_edev(prev, curr, itv):
+    offset = 9 * 8
+
+    def name(raw):
+        return _c_string(raw[offset:offset + MAX_IFACE_LEN])
+
+    previous = {name(raw): values for values, raw in prev}
+    rows = []
+    for c, raw in curr:
+        p = previous.get(name(raw), (0,) * 9)
+        # collisions, rx/tx errors, rx/tx dropped, rx/tx fifo, rx frame,
+        # tx carrier
+        rows.append({
+            "iface": name(raw),
+            "rxerr": _rate(p[1], c[1], itv),
+            "txerr": _rate(p[2], c[2], itv),
+            "coll": _rate(p[0], c[0], itv),
+            "rxdrop": _rate(p[3], c[3], itv),
+            "txdrop": _rate(p[4], c[4], itv),
+            "txcarr": _rate(p[8], c[8], itv),
+            "rxfram": _rate(p[7], c[7], itv),
+            "rxfifo": _rate(p[5], c[5], itv),
+            "txfifo": _rate(p[6], c[6], itv),
+        })
+    return "network", {"net-edev": rows}
+
+
+def _net_sock(prev, curr, itv):
+    (c, _) = curr[0]
+    sock_inuse, tcp_inuse, tcp_tw, udp_inuse, raw_inuse, frag_inuse = c[:6]
+    return "network", {"net-sock": {
+        "totsck": sock_inuse,
+        "tcpsck": tcp_inuse,
+        "udpsck": udp_inuse,
+        "rawsck": raw_inuse,
+        "ip-frag": frag_inuse,
+        "tcp-tw": tcp_tw,
+    }}
+
+
+def _net_sock6(prev, curr, itv):
+    (c, _) = curr[0]
+    return "network", {"net-sock6": dict(
+        zip(("tcp6sck", "udp6sck", "raw6sck", "ip6-frag"), c[:4])
+    )}
+
+
+def _hugepages(prev, curr, itv):
+    # free and total kB, since sysstat 12.1 also reserved and surplus kB
+    (c, _) = curr[0]
+    used = c[1] - c[0]
+    row = {
+        "hugfree": c[0],
+        "hugused": used,
+        "hugused-percent": used / c[1] * 100 if c[1] else 0.0,
+    }
+    if len(c) >= 4:
+        row.update(hugrsvd=c[2], hugsurp=c[3])
+    return "hugepages", row
+
+
+def _fchost(prev, curr, itv):
+    def name(raw):
+        # the name follows the four counters (unsigned long)
+        return _c_string(raw[-MAX_FCH_LEN:])
+
+    previous = {name(raw): values for values, raw in prev}
+    rows = []
+    for c, raw in curr:
+        p = previous.get(name(raw), (0,) * 4)
+        rows.append({
+            "fchost": name(raw),
+            "fch_rxf": _rate(p[0], c[0], itv),
+            "fch_txf": _rate(p[1], c[1], itv),
+            "fch_rxw": _rate(p[2], c[2], itv),
+            "fch_txw": _rate(p[3], c[3], itv),
+        })
+    return "fchost", rows
+
+
+def _softnet(prev, curr, itv):
+    # item 0 is CPU 'all'; sar sums it from the CPUs, so this does too.
+    # processed, dropped, time_squeeze, received_rps, flow_limit
+    # (+ backlog_len since sysstat 12.5.5)
+    def total(items):
+        return [sum(column) for column in zip(*(values for values, _ in items[1:]))]
+
+    def row(cpu, p, c):
+        values = {
+            "cpu": cpu,
+            "total": _delta(p[0], c[0], 32) / itv * 100,
+            "dropd": _delta(p[1], c[1], 32) / itv * 100,
+            "squeezd": _delta(p[2], c[2], 32) / itv * 100,
+            "rx_rps": _delta(p[3], c[3], 32) / itv * 100,
+            "flw_lim": _delta(p[4], c[4], 32) / itv * 100,
+        }
+        if len(c) >= 6:
+            values["blg_len"] = c[5]
+        return values
+
+    rows = [row("all", total(prev), total(curr))] if len(curr) > 1 else []
+    for index, ((p, _), (c, _)) in enumerate(zip(prev[1:], curr[1:])):
+        if any(c):  # an offline CPU has no line in /proc/net/softnet_stat
+            rows.append(row(str(index), p, c))
+    return "network", {"softnet": rows}
+
+
+def _psi(resource: str):
+    """Pressure stall decoder: total stall time (us) per kind, then the
+    kernel's 10/60/300 s averages (x100) per kind; 'some' and for io and
+    memory 'full'."""
+
+    def decode(prev, curr, itv):
+        (p, _), (c, _) = prev[0], curr[0]
+        kinds = ("some", "full")[: len(c) // 4]
+        totals, averages = c[: len(kinds)], c[len(kinds):]
+        values = {}
+        for index, kind in enumerate(kinds):
+            for window, average in zip((10, 60, 300), averages[3 * index:3 * index + 3]):
+                values[f"{kind}_avg{window}"] = average / 100
+            values[f"{kind}_avg"] = _delta(p[index], totals[index], 64) / (100 * itv)
+        return f"psi-{resource}", values
+
+    return decode
+
+
+# activity id -> (types of the structure versions understood, decoder)
+_DECODERS = {
+    A_CPU: ({(10, 0, 0)}, _cpu),
+    A_PCSW: ({(1, 1, 0)}, _pcsw),
+    A_SWAP: ({(0, 2, 0)}, _swap),
+    A_PAGE: ({(0, 8, 0)}, _paging),
+    A_IO: ({(5, 0, 0), (7, 0, 0)}, _io),
+    A_MEMORY: ({(17, 0, 0)}, _memory),
+    A_KTABLES: ({(4, 0, 0), (0, 0, 4)}, _ktables),
+    A_QUEUE: ({(2, 0, 4)}, _queue),
+    A_SERIAL: ({(0, 0, 7)}, _serial),
+    A_DISK: ({(1, 2, 6), (1, 3, 7)}, _disk),
+    A_NET_DEV: ({(7, 0, 1)}, _net_dev),
+    A_NET_EDEV: ({(9, 0, 0)}, _net_edev),
+    A_NET_NFS: ({(0, 0, 6)}, _counters(
+        "net-nfs", ["call", "retrans", "read", "write", "access", "getatt"], 32
+    )),
+    A_NET_NFSD: ({(0, 0, 11)}, _counters(
+        "net-nfsd",
+        ["scall", "badcall", "packet", "udp", "tcp", "hit", "miss", "sread",
+         "swrite", "saccess", "sgetatt"],
+        32,
+    )),
+    A_NET_SOCK: ({(0, 0, 6)}, _net_sock),
+    A_NET_IP: ({(8, 0, 0)}, _counters(
+        "net-ip",
+        ["irec", "fwddgm", "idel", "orq", "asmrq", "asmok", "fragok", "fragcrt"],
+        64,
+    )),
+    A_NET_EIP: ({(8, 0, 0)}, _counters(
+        "net-eip",
+        ["ihdrerr", "iadrerr", "iukwnpr", "idisc", "odisc", "onort", "asmf",
+         "fragf"],
+        64,
+    )),
+    A_NET_ICMP: ({(0, 14, 0)}, _counters(
+        "net-icmp",
+        ["imsg", "omsg", "iech", "iechr", "oech", "oechr", "itm", "itmr", "otm",
+         "otmr", "iadrmk", "iadrmkr", "oadrmk", "oadrmkr"],
+        64,
+    )),
+    A_NET_EICMP: ({(0, 12, 0)}, _counters(
+        "net-eicmp",
+        ["ierr", "oerr", "idstunr", "odstunr", "itmex", "otmex", "iparmpb",
+         "oparmpb", "isrcq", "osrcq", "iredir", "oredir"],
+        64,
+    )),
+    A_NET_TCP: ({(0, 4, 0)}, _counters(
+        "net-tcp", ["active", "passive", "iseg", "oseg"], 64
+    )),
+    A_NET_ETCP: ({(0, 5, 0)}, _counters(
+        "net-etcp", ["atmptf", "estres", "retrans", "isegerr", "orsts"], 64
+    )),
+    A_NET_UDP: ({(0, 4, 0)}, _counters(
+        "net-udp", ["idgm", "odgm", "noport", "idgmerr"], 64
+    )),
+    A_NET_SOCK6: ({(0, 0, 4)}, _net_sock6),
+    A_NET_IP6: ({(10, 0, 0)}, _counters(
+        "net-ip6",
+        ["irec6", "fwddgm6", "idel6", "orq6", "asmrq6", "asmok6", "imcpck6",
+         "omcpck6", "fragok6", "fragcr6"],
+        64,
+    )),
+    A_NET_EIP6: ({(11, 0, 0)}, _counters(
+        "net-eip6",
+        ["ihdrer6", "iadrer6", "iukwnp6", "i2big6", "idisc6", "odisc6",
+         "inort6", "onort6", "asmf6", "fragf6", "itrpck6"],
+        64,
+    )),
+    A_NET_ICMP6: ({(0, 17, 0)}, _counters(
+        "net-icmp6",
+        ["imsg6", "omsg6", "iech6", "iechr6", "oechr6", "igmbq6", "igmbr6",
+         "ogmbr6", "igmbrd6", "ogmbrd6", "irtsol6", "ortsol6", "irtad6",
+         "inbsol6", "onbsol6", "inbad6", "onbad6"],
+        64,
+    )),
+    A_NET_EICMP6: ({(0, 11, 0)}, _counters(
+        "net-eicmp6",
+        ["ierr6", "idtunr6", "odtunr6", "itmex6", "otmex6", "iprmpb6",
+         "oprmpb6", "iredir6", "oredir6", "ipck2b6", "opck2b6"],
+        64,
+    )),
+    A_NET_UDP6: ({(0, 4, 0)}, _counters(
+        "net-udp6", ["idgm6", "odgm6", "noport6", "idgmer6"], 64
+    )),
+    A_HUGE: ({(2, 0, 0), (4, 0, 0)}, _hugepages),
+    A_FCHOST: ({(0, 4, 0)}, _fchost),
+    A_SOFTNET: ({(0, 0, 5), (0, 0, 6)}, _softnet),
+    A_PSI_CPU: ({(1, 3, 0)}, _psi("cpu")),
+    A_PSI_IO: ({(2, 6, 0)}, _psi("io")),
+    A_PSI_MEM: ({(2, 6, 0)}, _psi("mem")),
+}
+
+
+def sar_available() -> bool:
+    return shutil.which("sar") is not None
+
+
+def iter_sa_records(sa_file, warnings: set, complete: bool | None = None):
+    """Statistics of a binary sa file as sadf -j shaped entries.
+
+    Yields ("host", host) first, then in file order
+        ("entry", entry)          one statistics entry per record interval
+        ("restart", time, cpus)   LINUX RESTART, with the new CPU count
+    `sa_file` is a path or a binary file object. Raises ValueError if the
+    file cannot be decoded, or, with `complete` (default: whenever the sar
+    binary is installed), if it holds activities that cannot be.
+    """
+    if complete is None:
+        complete = sar_available()
+    with _open_binary(sa_file) as source:
+        sa = SaFile(source)
+        decoders = {}
+        skipped = []
+        for act in sa.activities:
+            known = _DECODERS.get(act.id)
+            if known and act.types in known[0]:
+                decoders[act.id] = known[1]
+            elif known:
+                skipped.append(f"{act.name} (structure {act.types})")
+            elif act.id not in IGNORED_ACTIVITIES:
+                skipped.append(act.name)
+        if skipped and complete:
+            raise ValueError(f"activities not decoded natively: {', '.join(skipped)}")
+        for name in skipped:
+            warnings.add(f"activity skipped (no sar binary for sar -A): {name}")
+        yield ("host", sa.host)
+
+        previous = None
+        for rtype, uptime_cs, time, payload in sa.records():
+            if rtype == R_RESTART:
+                yield ("restart", time, max(payload - 1, 1))
+                previous = None
+                continue
+            if rtype == R_COMMENT:
+                continue
+            if previous is not None and uptime_cs > previous[0]:
+                itv = uptime_cs - previous[0]
+                entry = {"timestamp": {"time": time}}
+                for act_id, decode in decoders.items():
+                    if act_id in payload and act_id in previous[1]:
+                        section, values = decode(previous[1][act_id], payload[act_id], itv)
+                        if section == "network":
+                            entry.setdefault("network", {}).update(values)
+                        else:
+                            entry[section] = values
+                yield ("entry", entry)
+            previous = (uptime_cs, payload)
+
+
+def _open_binary(source):
+    if hasattr(source, "read"):
+        return contextlib.nullcontext(source)
+    return open(source, "rb")
+
+
+def read_sa_host(sa_file: str) -> dict:
+    with open(sa_file, "rb") as source:
+        return SaFile(source).host
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python sa_binary.py <sa file>")
+        sys.exit(2)
+    found: set[str] = set()
+    for item in iter_sa_records(sys.argv[1], found, complete=False):
+        print(item)
+    for warning in sorted(found):
+        print(warning, file=sys.stderr)
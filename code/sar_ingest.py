@@ -1,9 +1,16 @@
-"""Shared upload preprocessing: xz decompression and sadf-JSON conversion.
+"""Shared upload preprocessing: spooling, xz decompression, sadf JSON.
 
 Used by both the REST API (api/services.py) and the Streamlit UI (mng_sar.py).
-The sadf JSON is rendered back into the classic ``sar -A`` text layout so that
-parse_into_polars.parse_sar_file stays the single parsing authority - headers,
-metrics and devices come out identical to a text upload by construction.
+Uploads are copied to disk in chunks (spool_upload), xz archives are
+unpacked on the way, and every later step reads the spooled file.
+The sadf JSON can be rendered back into the classic ``sar -A`` text layout
+(sadf_json_to_sar_text) so that parse_into_polars.parse_sar_file parses it
+like a text upload. Uploads skip that round-trip: iter_sadf_json walks the
+JSON incrementally and parse_into_polars.stream_sadf_json builds the parquet
+from the same header blocks (code/parse_parity.py checks both agree).
+Binary sa files take the same route: sa_binary decodes them into sadf -j
+shaped entries (iter_sa_binary); files it cannot read completely still go
+through the sar binary where it is installed.
 
 Recommended export on the source host::
 
@@ -22,14 +29,20 @@ Sections the text parser ignores anyway (interrupts, CPU MHz) are skipped.
 Unknown sections/fields are skipped with a warning instead of failing.
 """
 
+import codecs
+import contextlib
 import json
 import lzma
 import os
+import re
+import tempfile
+from pathlib import Path
 
 XZ_MAGIC = b"\xfd7zXZ\x00"
 MAX_DECOMPRESSED_BYTES = int(
     os.getenv("SAR_MAX_DECOMPRESSED_BYTES", 512 * 1024 * 1024)
 )
+SPOOL_CHUNK_BYTES = 1024 * 1024
 
 # Sections that parse_into_polars drops anyway (reg_ignore / df_clean_data)
 _SKIPPED_SECTIONS = {"interrupts", "power-management"}
@@ -37,8 +50,8 @@ _SKIPPED_SECTIONS = {"interrupts", "power-management"}
 # Ordered (json_field, sar_column) pairs per section. Only fields present in
 # the JSON are emitted (in this order), so short formats (plain ``sadf -j``)
 # and full ones (``sadf -j -- -A``) both work.
-# 'device': (json_field, sar_header_column); FILESYSTEM is special-cased
-# because sar prints the device column LAST for it.
+# 'device': (json_field, sar_header_column); FILESYSTEM and FCHOST are
+# special-cased because sar prints the device column LAST for them.
 _SECTIONS = {
     "cpu-load": {
         "device": ("cpu", "CPU"),
@@ -95,7 +108,8 @@ _SECTIONS = {
     "hugepages": {
         "fields": [
             ("hugfree", "kbhugfree"), ("hugused", "kbhugused"),
-            ("hugused-percent", "%hugused"),
+            ("hugused-percent", "%hugused"), ("hugrsvd", "kbhugrsvd"),
+            ("hugsurp", "kbhugsurp"),
         ],
     },
     "kernel": {
@@ -128,6 +142,35 @@ _SECTIONS = {
             ("brk", "brk/s"), ("ovrun", "ovrun/s"),
         ],
     },
+    "fchost": {
+        "device_last": ("fchost", "FCHOST"),
+        "fields": [
+            ("fch_rxf", "fch_rxf/s"), ("fch_txf", "fch_txf/s"),
+            ("fch_rxw", "fch_rxw/s"), ("fch_txw", "fch_txw/s"),
+        ],
+    },
+    "psi-cpu": {
+        "fields": [
+            ("some_avg10", "%scpu-10"), ("some_avg60", "%scpu-60"),
+            ("some_avg300", "%scpu-300"), ("some_avg", "%scpu"),
+        ],
+    },
+    "psi-io": {
+        "fields": [
+            ("some_avg10", "%sio-10"), ("some_avg60", "%sio-60"),
+            ("some_avg300", "%sio-300"), ("some_avg", "%sio"),
+            ("full_avg10", "%fio-10"), ("full_avg60", "%fio-60"),
+            ("full_avg300", "%fio-300"), ("full_avg", "%fio"),
+        ],
+    },
+    "psi-mem": {
+        "fields": [
+            ("some_avg10", "%smem-10"), ("some_avg60", "%smem-60"),
+            ("some_avg300", "%smem-300"), ("some_avg", "%smem"),
+            ("full_avg10", "%fmem-10"), ("full_avg60", "%fmem-60"),
+            ("full_avg300", "%fmem-300"), ("full_avg", "%fmem"),
+        ],
+    },
     "filesystems": {
         "device_last": ("filesystem", "FILESYSTEM"),
         "fields": [
@@ -291,7 +334,7 @@ _NETWORK_SECTIONS = {
         "fields": [
             ("total", "total/s"), ("dropd", "dropd/s"),
             ("squeezd", "squeezd/s"), ("rx_rps", "rx_rps/s"),
-            ("flw_lim", "flw_lim/s"),
+            ("flw_lim", "flw_lim/s"), ("blg_len", "blg_len"),
         ],
     },
 }
@@ -330,23 +373,81 @@ def _build_known_map() -> dict[str, set[str]]:
 _KNOWN_FIELDS = _build_known_map()
 
 
-def maybe_decompress_xz(content: bytes, filename: str) -> tuple[bytes, str]:
-    """Transparently decompress single-file .xz uploads (with a size cap)."""
-    if not content.startswith(XZ_MAGIC):
-        return content, filename
-    decompressor = lzma.LZMADecompressor()
+def _unxz_chunk(decompressor, chunk: bytes, target, written: int, filename: str) -> int:
+    """Decompress one input chunk into `target`, at most one chunk at a time."""
     try:
-        data = decompressor.decompress(content, max_length=MAX_DECOMPRESSED_BYTES)
+        data = decompressor.decompress(chunk, max_length=SPOOL_CHUNK_BYTES)
+        while True:
+            written += len(data)
+            if written > MAX_DECOMPRESSED_BYTES:
+                raise ValueError(
+                    f"{filename}: decompressed size exceeds the "
+                    f"{MAX_DECOMPRESSED_BYTES // (1024 * 1024)} MB limit"
+                )
+            target.write(data)
+            if decompressor.eof or decompressor.needs_input:
+                return written
+            data = decompressor.decompress(b"", max_length=SPOOL_CHUNK_BYTES)
     except lzma.LZMAError as exc:
         raise ValueError(f"{filename}: broken xz archive ({exc})")
-    if not decompressor.eof:
-        raise ValueError(
-            f"{filename}: decompressed size exceeds the "
-            f"{MAX_DECOMPRESSED_BYTES // (1024 * 1024)} MB limit"
-        )
-    if filename.endswith(".xz"):
+
+
+class _HashingWriter:
+    """File wrapper feeding everything written to a hashlib object."""
+
+    def __init__(self, target, digest):
+        self.target = target
+        self.digest = digest
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        return self.target.write(data)
+
+
+def spool_upload(
+    source, directory: str | Path, filename: str, digest=None
+) -> tuple[Path, str]:
+    """Copy an upload to a new `<directory>/.tmp_<random>_<filename>` chunk
+    by chunk (uploads of the same name are spooled side by side).
+
+    `source` is a binary file object. Single-file .xz archives are
+    decompressed on the way (with the MAX_DECOMPRESSED_BYTES cap), so
+    neither copy is ever held in memory. The spooled bytes are fed to the
+    hashlib object `digest` if given (dedup_store). Returns the spooled path
+    and the file name without .xz; raises ValueError with a user-facing
+    message on broken input.
+    """
+    chunk = source.read(SPOOL_CHUNK_BYTES)
+    decompressor = lzma.LZMADecompressor() if chunk.startswith(XZ_MAGIC) else None
+    if decompressor is not None and filename.endswith(".xz"):
         filename = filename[: -len(".xz")]
-    return data, filename
+    fd, spool_name = tempfile.mkstemp(
+        prefix=".tmp_", suffix=f"_{filename}", dir=directory
+    )
+    spool_path = Path(spool_name)
+    written = 0
+    try:
+        with open(fd, "wb") as spooled:
+            target = spooled if digest is None else _HashingWriter(spooled, digest)
+            while chunk:
+                if decompressor is None:
+                    target.write(chunk)
+                elif not decompressor.eof:
+                    # data after the end of the xz stream is ignored
+                    written = _unxz_chunk(decompressor, chunk, target, written, filename)
+                chunk = source.read(SPOOL_CHUNK_BYTES)
+        if decompressor is not None and not decompressor.eof:
+            raise ValueError(f"{filename}: broken xz archive (truncated)")
+    except BaseException:
+        spool_path.unlink(missing_ok=True)
+        raise
+    return spool_path, filename
+
+
+def read_head(path: str | Path, size: int = 4096) -> bytes:
+    """First bytes of a spooled upload, enough for the file type checks."""
+    with open(path, "rb") as source:
+        return source.read(size)
 
 
 def is_sadf_json(content: bytes) -> bool:
@@ -364,23 +465,32 @@ def _fmt(value) -> str:
     return str(value)
 
 
-def _render_rows(
-    spec: dict, payload, time: str, out: list, warnings: set, section: str
-):
-    """Emit one header block (header line + data lines) for a section."""
-    rows = payload if isinstance(payload, list) else [payload]
-    if not rows:
-        return
-    first = rows[0]
+# format spec per value type, matching _fmt
+_FORMATS = {bool: "{:d}", int: "{:d}", float: "{:.2f}"}
+
+
+def _flatten(spec: dict, row: dict) -> dict:
     if spec.get("flatten"):
-        first = dict(first)
+        row = dict(row)
         for key in spec["flatten"]:
-            if isinstance(first.get(key), dict):
-                first.update(first.pop(key))
+            if isinstance(row.get(key), dict):
+                row.update(row.pop(key))
+    return row
+
+
+def _section_block(spec: dict, payload, warnings: set, section: str):
+    """One header block of a section: (header, [data values]) or None.
+
+    Header and values come without the leading time column.
+    """
+    rows = payload if isinstance(payload, list) else [payload]
+    if not rows:
+        return None
+    first = _flatten(spec, rows[0])
     known = [(j, c) for j, c in spec["fields"] if j in first]
     if not known:
         warnings.add(f"section with unknown fields skipped: {list(first)[:4]}")
-        return
+        return None
     handled = _KNOWN_FIELDS.get(section, set())
     for field in first:
         if field not in handled and field not in _IGNORED_FIELDS:
@@ -394,20 +504,82 @@ def _render_rows(
     else:
         header = " ".join(columns)
 
-    out.append("")
-    out.append(f"{time} {header}")
+    keys = [j for j, _ in known]
+    if "device" in spec:
+        keys.insert(0, spec["device"][0])
+    elif "device_last" in spec:
+        keys.append(spec["device_last"][0])
+    device_index = (
+        0 if "device" in spec else len(keys) - 1 if "device_last" in spec else None
+    )
+    # one format string per combination of value types, same output as _fmt
+    templates: dict[tuple, str] = {}
+    lines = []
     for row in rows:
-        if spec.get("flatten"):
-            row = dict(row)
-            for key in spec["flatten"]:
-                if isinstance(row.get(key), dict):
-                    row.update(row.pop(key))
-        values = [_fmt(row.get(j, 0)) for j, _ in known]
-        if "device" in spec:
-            values.insert(0, str(row.get(spec["device"][0], "?")))
-        elif "device_last" in spec:
-            values.append(str(row.get(spec["device_last"][0], "?")))
-        out.append(f"{time} {' '.join(values)}")
+        row = _flatten(spec, row)
+        values = [row.get(key, 0) for key in keys]
+        if device_index is not None:
+            values[device_index] = row.get(keys[device_index], "?")
+        types = tuple(map(type, values))
+        template = templates.get(types)
+        if template is None:
+            fields = [_FORMATS.get(t, "{!s}") for t in types]
+            if device_index is not None:
+                fields[device_index] = "{!s}"
+            template = templates[types] = " ".join(fields)
+        lines.append(template.format(*values))
+    return header, lines
+
+
+def _entry_blocks(entry: dict, warnings: set):
+    """Header blocks of one statistics entry: (time, header, [values])."""
+    time = entry.get("timestamp", {}).get("time")
+    if not time:
+        return
+    for section, payload in entry.items():
+        if section in ("timestamp",) or section in _SKIPPED_SECTIONS:
+            continue
+        if section == "network":
+            for sub, sub_payload in payload.items():
+                spec = _NETWORK_SECTIONS.get(sub)
+                if spec is None:
+                    warnings.add(f"unknown network section skipped: {sub}")
+                    continue
+                block = _section_block(spec, sub_payload, warnings, f"network.{sub}")
+                if block:
+                    yield (time, *block)
+            continue
+        spec = _SECTIONS.get(section)
+        if spec is None:
+            warnings.add(f"unknown section skipped: {section}")
+            continue
+        block = _section_block(spec, payload, warnings, section)
+        if block:
+            yield (time, *block)
+        # memory feeds a second text section (swap utilization)
+        if section == "memory":
+            block = _section_block(_SECTIONS["memory-swap"], payload, warnings, section)
+            if block:
+                yield (time, *block)
+
+
+def _restart_time(restart) -> str | None:
+    boot = restart.get("boot", restart) if isinstance(restart, dict) else {}
+    return boot.get("time")
+
+
+def sadf_os_details(host: dict) -> str:
+    """The 'Linux ...' banner line sar prints for the host."""
+    ncpu = host.get("number-of-cpus", 1)
+    return (
+        f"Linux {host.get('release', 'unknown')} ({host.get('nodename', 'unknown')}) "
+        f"\t{host.get('file-date', '2000-01-01')} \t_{host.get('machine', 'unknown')}_"
+        f"\t({ncpu} CPU)"
+    )
+
+
+def sadf_restart_line(host: dict, boot_time: str) -> str:
+    return f"{boot_time} LINUX RESTART\t({host.get('number-of-cpus', 1)} CPU)"
 
 
 def sadf_json_to_sar_text(content: bytes) -> tuple[str, list[str]]:
@@ -418,49 +590,20 @@ def sadf_json_to_sar_text(content: bytes) -> tuple[str, list[str]]:
     except (json.JSONDecodeError, KeyError, IndexError, TypeError) as exc:
         raise ValueError(f"not a valid sadf JSON file ({exc})")
 
-    ncpu = host.get("number-of-cpus", 1)
-    os_details = (
-        f"Linux {host.get('release', 'unknown')} ({host.get('nodename', 'unknown')}) "
-        f"\t{host.get('file-date', '2000-01-01')} \t_{host.get('machine', 'unknown')}_"
-        f"\t({ncpu} CPU)"
-    )
-    out = [os_details]
+    out = [sadf_os_details(host)]
     warnings: set[str] = set()
 
     for entry in host.get("statistics", []):
-        time = entry.get("timestamp", {}).get("time")
-        if not time:
-            continue
-        for section, payload in entry.items():
-            if section in ("timestamp",) or section in _SKIPPED_SECTIONS:
-                continue
-            if section == "network":
-                for sub, sub_payload in payload.items():
-                    spec = _NETWORK_SECTIONS.get(sub)
-                    if spec is None:
-                        warnings.add(f"unknown network section skipped: {sub}")
-                        continue
-                    _render_rows(
-                        spec, sub_payload, time, out, warnings, f"network.{sub}"
-                    )
-                continue
-            spec = _SECTIONS.get(section)
-            if spec is None:
-                warnings.add(f"unknown section skipped: {section}")
-                continue
-            _render_rows(spec, payload, time, out, warnings, section)
-            # memory feeds a second text section (swap utilization)
-            if section == "memory":
-                _render_rows(
-                    _SECTIONS["memory-swap"], payload, time, out, warnings, section
-                )
+        for time, header, lines in _entry_blocks(entry, warnings):
+            out.append("")
+            out.append(f"{time} {header}")
+            out.extend(f"{time} {values}" for values in lines)
 
     for restart in host.get("restarts", []):
-        boot = restart.get("boot", restart) if isinstance(restart, dict) else {}
-        boot_time = boot.get("time")
+        boot_time = _restart_time(restart)
         if boot_time:
             out.append("")
-            out.append(f"{boot_time} LINUX RESTART\t({ncpu} CPU)")
+            out.append(sadf_restart_line(host, boot_time))
 
     if len(out) <= 1:
         raise ValueError("sadf JSON contains no usable statistics sections")
@@ -468,18 +611,232 @@ def sadf_json_to_sar_text(content: bytes) -> tuple[str, list[str]]:
     return "\n".join(out) + "\n", sorted(warnings)
 
 
-def preprocess_upload(content: bytes, filename: str) -> tuple[bytes, str, list[str]]:
-    """xz decompression + sadf-JSON conversion; returns (content, name, warnings).
+_JSON_CHUNK_BYTES = 1024 * 1024
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _JsonReader:
+    """Pull reader over a JSON document in a binary file.
+
+    Values are decoded with json.JSONDecoder.raw_decode from a sliding text
+    buffer, so the structure around them can be walked one value at a time
+    (objects key by key, arrays element by element) without the document
+    ever being in memory as a whole.
+    """
+
+    def __init__(self, source, chunk_bytes: int = _JSON_CHUNK_BYTES):
+        self.source = source
+        self.chunk_bytes = chunk_bytes
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    @staticmethod
+    def error(reason) -> ValueError:
+        return ValueError(f"not a valid sadf JSON file ({reason})")
+
+    def _fill(self, size: int) -> bool:
+        """Read `size` more bytes into the buffer; False at end of file."""
+        if self.eof:
+            return False
+        chunk = self.source.read(size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.text_decoder.decode(chunk, self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self) -> str:
+        """Next non-whitespace character, '' at the end of the document."""
+        while True:
+            self.pos = _JSON_WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(self.chunk_bytes):
+                return ""
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise self.error(f"expected {char!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as exc:
+                # incomplete value: grow the buffer geometrically and retry
+                if not self._fill(max(self.chunk_bytes, len(self.buf))):
+                    raise self.error(exc)
+                continue
+            # a number ending the buffer may continue in the next chunk
+            if end == len(self.buf) and self._fill(self.chunk_bytes):
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """Keys of the next object; read each value before resuming."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise self.error("object key is not a string")
+            self.expect(":")
+            yield key
+            separator = self.peek()
+            self.pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise self.error("expected ',' or '}'")
+
+    def elements(self):
+        """Once per element of the next array; read it before resuming."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise self.error("expected ',' or ']'")
+
+
+def _first_host_members(reader: _JsonReader):
+    """Keys of sysstat.hosts[0]; the caller reads every value.
+
+    The document after the first host is not read.
+    """
+    for key in reader.members():
+        if key != "sysstat":
+            reader.value()
+            continue
+        for key in reader.members():
+            if key != "hosts":
+                reader.value()
+                continue
+            for _ in reader.elements():
+                yield from reader.members()
+                return
+    raise reader.error("no sysstat host found")
+
+
+def _open_binary(source):
+    """Context manager for a path or an already open binary file object
+    (which is left open)."""
+    if hasattr(source, "read"):
+        return contextlib.nullcontext(source)
+    return open(source, "rb")
+
+
+def iter_sadf_json(json_file, warnings: set):
+    """Incremental walk over a sadf -j document.
+
+    Same traversal as sadf_json_to_sar_text, but the statistics are decoded
+    one entry at a time (_JsonReader), so the document never sits in memory
+    as a whole. Yields
+        ("block", time, header, [values])  per header block, in file order
+        ("host", host)                     host metadata, after the blocks
+        ("restart", line)                  LINUX RESTART lines, last
+    Only the first host is read. `json_file` is a path or a binary file
+    object. Raises ValueError on broken input.
+    """
+    host = {}
+    blocks = 0
+    with _open_binary(json_file) as source:
+        reader = _JsonReader(source)
+        for key in _first_host_members(reader):
+            if key != "statistics" or reader.peek() != "[":
+                host[key] = reader.value()
+                continue
+            for _ in reader.elements():
+                for block in _entry_blocks(reader.value(), warnings):
+                    blocks += 1
+                    yield ("block", *block)
+
+    yield ("host", host)
+    restart_lines = [
+        sadf_restart_line(host, boot_time)
+        for boot_time in map(_restart_time, host.get("restarts", []))
+        if boot_time
+    ]
+    if not blocks and not restart_lines:
+        raise ValueError("sadf JSON contains no usable statistics sections")
+    for line in restart_lines:
+        yield ("restart", line)
+
+
+def read_sadf_host(source) -> dict:
+    """Host metadata of the first host; stops reading at its statistics."""
+    host = {}
+    reader = _JsonReader(source)
+    for key in _first_host_members(reader):
+        if key in ("statistics", "restarts"):
+            break
+        host[key] = reader.value()
+    return host
+
+
+def _host_file_name(host: dict) -> str:
+    import helpers_pl
+    import pl_helpers2
+
+    os_details = pl_helpers2.clean_os_details(sadf_os_details(host))
+    return helpers_pl.sar_file_name(os_details.split())
+
+
+def sadf_json_name(json_file: str) -> str:
+    """Name a sadf JSON upload like helpers_pl.rename_sar_file names the
+    text it would have been converted to."""
+    with open(json_file, "rb") as source:
+        return _host_file_name(read_sadf_host(source))
+
+
+def iter_sa_binary(sa_file, warnings: set, complete: bool | None = None):
+    """iter_sadf_json for a binary sa file, decoded by sa_binary.
 
-    Raises ValueError with a user-facing message on broken input.
+    Same items; the host comes first and restarts in file order. Raises
+    ValueError if the file cannot be decoded (`complete`: see
+    sa_binary.iter_sa_records).
     """
-    warnings: list[str] = []
-    content, filename = maybe_decompress_xz(content, filename)
-    if is_sadf_json(content):
-        text, conv_warnings = sadf_json_to_sar_text(content)
-        content = text.encode()
-        if filename.endswith(".json"):
-            filename = filename[: -len(".json")]
-        warnings.append(f"{filename}: converted from sadf JSON")
-        warnings.extend(f"{filename}: {w}" for w in conv_warnings)
-    return content, filename, warnings
+    import sa_binary
+
+    blocks = 0
+    restarts = 0
+    for kind, *payload in sa_binary.iter_sa_records(sa_file, warnings, complete):
+        if kind == "entry":
+            for block in _entry_blocks(payload[0], warnings):
+                blocks += 1
+                yield ("block", *block)
+        elif kind == "restart":
+            time, cpus = payload
+            restarts += 1
+            yield ("restart", sadf_restart_line({"number-of-cpus": cpus}, time))
+        else:
+            yield (kind, *payload)
+    if not blocks and not restarts:
+        raise ValueError("sa file contains no usable statistics")
+
+
+def sa_binary_name(sa_file: str) -> str:
+    """Name a binary sa upload like the sar -A text it replaces."""
+    import sa_binary
+
+    return _host_file_name(sa_binary.read_sa_host(sa_file))
+
+
+def strip_json_suffix(filename: str) -> str:
+    if filename.endswith(".json"):
+        filename = filename[: -len(".json")]
+    return filename
@@ -0,0 +1,117 @@
+"""On-disk format of the parsed sar data (Config.file_type).
+
+FILE_TYPE=parquet (default) stores `<name>.parquet`: zstd, sorted by header
+with row-group statistics, so per-header scans read little (see write).
+FILE_TYPE=arrow stores `<name>.arrow`, an Arrow IPC file (uncompressed or
+lz4, Config.arrow_compression). It is read through a memory map: the UI,
+the API and the MCP backend share the same page-cache pages, and an
+uncompressed file is used without decoding or copying it.
+
+New files are written in the configured format. Readers accept both, so
+files stored before FILE_TYPE was changed stay usable; they are converted
+when they are parsed again. Writers never rewrite a stored file in place
+(parse_into_polars unlinks or renames first), which also keeps the memory
+maps of other processes valid.
+"""
+
+from pathlib import Path
+
+import polars as pl
+import pyarrow as pa
+
+from config import Config
+
+SUFFIXES = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def suffix() -> str:
+    """Suffix of newly written files."""
+    try:
+        return SUFFIXES[Config.file_type]
+    except KeyError:
+        raise ValueError(
+            f"unknown FILE_TYPE {Config.file_type!r}; use one of {sorted(SUFFIXES)}"
+        )
+
+
+def is_stored(name: str | Path) -> bool:
+    """True for the parsed file of an upload (either format)."""
+    return str(name).endswith(tuple(SUFFIXES.values()))
+
+
+def base_path(file_name: str | Path) -> str:
+    """'<dir>/<name>' for '<dir>/<name>' and its stored files."""
+    file_name = str(file_name)
+    for stored_suffix in SUFFIXES.values():
+        if file_name.endswith(stored_suffix):
+            return file_name.removesuffix(stored_suffix)
+    return file_name
+
+
+def candidates(file_name: str | Path) -> list[Path]:
+    """Every path a stored file of `file_name` may have, configured format first."""
+    base = base_path(file_name)
+    suffixes = [suffix()] + [s for s in SUFFIXES.values() if s != suffix()]
+    return [Path(f"{base}{s}") for s in suffixes]
+
+
+def stored_file(file_name: str | Path) -> Path:
+    """The existing stored file of `file_name`, else where a new one goes."""
+    for path in candidates(file_name):
+        if path.exists():
+            return path
+    return new_file(file_name)
+
+
+def new_file(file_name: str | Path) -> Path:
+    return Path(f"{base_path(file_name)}{suffix()}")
+
+
+def _map_arrow(path: Path) -> pl.DataFrame:
+    # uncompressed buffers stay in the mapping (zero-copy), lz4 is decoded
+    with pa.memory_map(str(path)) as source:
+        return pl.from_arrow(pa.ipc.open_file(source).read_all())
+
+
+def read(path: str | Path) -> pl.DataFrame:
+    path = Path(path)
+    if path.suffix == SUFFIXES["arrow"]:
+        return _map_arrow(path)
+    return pl.read_parquet(path)
+
+
+def scan(path: str | Path) -> pl.LazyFrame:
+    """Lazy read; a parquet scan pushes filters down to the row groups, an
+    Arrow file is mapped and filtered in place."""
+    path = Path(path)
+    if path.suffix == SUFFIXES["arrow"]:
+        return _map_arrow(path).lazy()
+    return pl.scan_parquet(path)
+
+
+def write(frame: pl.DataFrame | pl.LazyFrame, path: str | Path) -> None:
+    """Write the stored layout in the format of `path`'s suffix.
+
+    Parquet: Config.parquet_compression, row groups of
+    Config.parquet_row_group_size rows and min/max statistics on every
+    column; polars dictionary-encodes `header` on its own (few distinct
+    values). Arrow: Config.arrow_compression.
+    """
+    path = Path(path)
+    lazy = isinstance(frame, pl.LazyFrame)
+    if path.suffix == SUFFIXES["arrow"]:
+        options = {"compression": Config.arrow_compression}
+        if lazy:
+            frame.sink_ipc(path, **options)
+        else:
+            frame.write_ipc(path, **options)
+        return
+    options = {
+        "compression": Config.parquet_compression,
+        "statistics": True,
+        "row_group_size": Config.parquet_row_group_size,
+    }
+    if lazy:
+        frame.sink_parquet(path, **options)
+    else:
+        frame.write_parquet(path, **options)
@@ -7,6 +7,7 @@ import streamlit_bokeh_component as st_bokeh
 import re
 import pl_helpers2 as pl_h2
 import dia_compute_pl as dia_compute
+import header_store
 from config import Config
 
 file_chosen = ""
@@ -23,6 +24,7 @@ def single_f(config_obj, username, selection, df, os_details):
     col2.write('')
     st.sidebar.markdown('---')
     sar_file = selection
+    sar_path = f"{config_obj['upload_dir']}/{selection}"
     if sar_file != file_chosen:
         lh.delete_large_obj()
         file_chosen = sar_file
@@ -69,7 +71,7 @@ def single_f(config_obj, username, selection, df, os_details):
         large_df_key = f"large_df_{file_name}_{header}_obj"
         if device_list_state:
             if not device_list_state[1] == sar_file:
-                large_df = pl_h2.get_metrics_from_df(df, selected, aitem[selected])
+                large_df = header_store.get_metrics_df(sar_path, selected, df, aitem[selected])
                 device_list = pl_h2.get_sub_devices_from_df(large_df, 'sub_device')
                 device_list.sort()
                 if 'all' in device_list:
@@ -83,10 +85,10 @@ def single_f(config_obj, username, selection, df, os_details):
                 if st.session_state.get(large_df_key, []):
                     large_df = st.session_state.get(large_df_key)[0]
                 else:
-                    large_df = pl_h2.get_metrics_from_df(df, selected, aitem[selected])
+                    large_df = header_store.get_metrics_df(sar_path, selected, df, aitem[selected])
                     helpers_pl.set_state_key(large_df_key, value=large_df, change_key=sar_file)
         else:
-            large_df = pl_h2.get_metrics_from_df(df, selected, aitem[selected])
+            large_df = header_store.get_metrics_df(sar_path, selected, df, aitem[selected])
             device_list = pl_h2.get_sub_devices_from_df(large_df, 'sub_device')
             device_list.sort()
             if 'all' in device_list:
@@ -78,13 +78,14 @@ def preselect_sar_file(username: str, file_name: str) -> None:
     done when the file really exists for that user, otherwise Streamlit would
     raise on a value that is not in the option list.
     """
+    import sar_store
     from config import Config
 
     base = f"{Config.upload_dir}/{username}"
-    candidates = {file_name, f"{file_name}.parquet"}
+    candidates = {file_name} | {x.name for x in sar_store.candidates(file_name)}
     try:
         available = set(os.listdir(base))
     except OSError:
         return
     if candidates & available:
-        st.session_state["get_sarfiles"] = file_name.removesuffix(".parquet")
+        st.session_state["get_sarfiles"] = sar_store.base_path(file_name)
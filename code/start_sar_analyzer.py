@@ -5,6 +5,7 @@ from streamlit_option_menu import option_menu
 import os
 import time
 import datetime
+import file_catalog
 import sql_stuff
 import sqlite2_polars
 from config import Config
@@ -125,11 +126,12 @@ def main_body(username: str, config_c: helpers.configuration) :
     import db_mng
     import todo
     import self_service
+    import warmup
     from sqlite2_polars import get_table_df
     
     upload_dir = f'{Config.upload_dir}/{username}'
     os.system(f'mkdir -p {upload_dir}')
-    sar_files = os.listdir(upload_dir)
+    sar_files = file_catalog.names(username)
     st.sidebar.success(f"Logged in as {username}")
     
     # Handle programmatic navigation override via signal
@@ -177,29 +179,31 @@ def main_body(username: str, config_c: helpers.configuration) :
         st.session_state['top_choice'] = top_choice
         st.rerun()
     
-    if top_choice == "Manage Sar Files":
-        mng_sar.file_mng(upload_dir, username)
-    elif top_choice == "Analyze Data":
-        analyze_pl.analyze(config_c, username)
-    elif top_choice == "DB Management":
-        headings_df = get_table_df('headingstable')
-        metrics_df = get_table_df('metric')
-        db_mng.db_mgmt(headings_df, metrics_df)
-    elif top_choice == "TODO":
-        todo.todo()
-    elif top_choice == "Redis Management":
-        try:
-            redis_mng.redis_tasks(col2)
-        except Exception as e:
-            st.warning(f"Exception: {e} recieved")
-    elif top_choice == "Info":
-        info.info()
-        info.usage()
-        info.code()
-    elif top_choice == 'Self Service':
-        self_service.self_service(username)
-    elif top_choice == 'User Management':
-        self_service.admin_service() 
+    # the background cache warm-up (warmup) waits while a page is built
+    with warmup.interactive():
+        if top_choice == "Manage Sar Files":
+            mng_sar.file_mng(upload_dir, username)
+        elif top_choice == "Analyze Data":
+            analyze_pl.analyze(config_c, username)
+        elif top_choice == "DB Management":
+            headings_df = get_table_df('headingstable')
+            metrics_df = get_table_df('metric')
+            db_mng.db_mgmt(headings_df, metrics_df)
+        elif top_choice == "TODO":
+            todo.todo()
+        elif top_choice == "Redis Management":
+            try:
+                redis_mng.redis_tasks(col2)
+            except Exception as e:
+                st.warning(f"Exception: {e} recieved")
+        elif top_choice == "Info":
+            info.info()
+            info.usage()
+            info.code()
+        elif top_choice == 'Self Service':
+            self_service.self_service(username)
+        elif top_choice == 'User Management':
+            self_service.admin_service() 
 
 if __name__ == "__main__":
     start()
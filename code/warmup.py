@@ -0,0 +1,269 @@
+"""Background warm-up of the chart caches after uploads and on start.
+
+The first "Show Diagrams" (or /charts/overview) after an upload paid for
+everything at once: loading the frame (frame_cache, Redis), splitting the
+metrics, describe() and the pandas conversion of every default header. One
+daemon thread per process now does this ahead of time for the files handed
+to `schedule`, limited to the default overview headers
+(dia_compute_pl.DEFAULT_OVERVIEW_ALIASES):
+
+- the frame is loaded through parse_into_polars.get_data_frame, which
+  fills frame_cache and Redis;
+- the per-header frames of the UI overview over the full time range go to
+  derived_cache, and so do those of the warmers registered with `register`
+  (the API's /charts views). Its disk tier serves the other processes.
+
+Bokeh figures are not built: they depend on the width, height and font
+size of the session and belong to one Bokeh document.
+
+The worker never competes with interactive work: each step waits until no
+request is inside `interactive()` and none ended in the last
+Config.warmup_idle_seconds, and after a step of t seconds it sleeps
+t * (100 / Config.warmup_cpu_percent - 1). Its thread runs at the lowest
+priority (Linux). `schedule_recent` queues the most recently used files
+on start (Config.warmup_recent_files).
+"""
+
+import contextlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import polars as pl
+
+import derived_cache
+import dia_compute_pl as dia_compute
+import file_catalog
+import header_store
+import helpers_pl
+import parse_into_polars as parse_polars
+import pl_helpers2 as pl_helpers
+import sar_store
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+_cond = threading.Condition()
+# base path -> user, in the order of scheduling
+_queue: OrderedDict[str, str] = OrderedDict()
+_recent = 0
+_busy = 0
+_last_request = 0.0
+_thread: threading.Thread | None = None
+_warmers = []
+_counters = {"scheduled": 0, "files": 0, "headers": 0, "errors": 0}
+_seconds = {"working": 0.0, "throttled": 0.0, "yielded": 0.0}
+
+
+def register(warmer) -> None:
+    """Add `warmer(file_name, username, df, header)`; it is called for every
+    default header of a warmed file after the UI overview frames."""
+    _warmers.append(warmer)
+
+
+def schedule(file_name: str | Path, username: str) -> None:
+    """Queue a file (base path, see sar_store) for warm-up. Files without a
+    parsed file are skipped when their turn comes."""
+    if not Config.warmup_enabled:
+        return
+    with _cond:
+        _queue.setdefault(str(file_name), username)
+        _counters["scheduled"] += 1
+        _start()
+        _cond.notify_all()
+
+
+def schedule_recent(count: int | None = None) -> None:
+    """Queue the `count` most recently used parsed files of all users; the
+    user directories are looked at by the worker, not the caller."""
+    global _recent
+    count = Config.warmup_recent_files if count is None else count
+    if not Config.warmup_enabled or count <= 0:
+        return
+    with _cond:
+        _recent = max(_recent, count)
+        _start()
+        _cond.notify_all()
+
+
+@contextlib.contextmanager
+def interactive():
+    """Hold the worker back while a user request runs (and shortly after)."""
+    global _busy, _last_request
+    with _cond:
+        _busy += 1
+    try:
+        yield
+    finally:
+        with _cond:
+            _busy -= 1
+            _last_request = time.monotonic()
+            _cond.notify_all()
+
+
+def stats() -> dict:
+    with _cond:
+        return {
+            "enabled": Config.warmup_enabled,
+            "queued": len(_queue),
+            "requests_in_flight": _busy,
+            "cpu_percent": _cpu_percent(),
+            **_counters,
+            **{f"{k}_seconds": round(v, 3) for k, v in _seconds.items()},
+        }
+
+
+def _cpu_percent() -> float:
+    return min(max(Config.warmup_cpu_percent, 1), 100)
+
+
+def _start() -> None:
+    # with _cond held
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_run, name="cache-warmup", daemon=True)
+        _thread.start()
+
+
+def _lower_priority() -> None:
+    try:
+        # Linux: the nice value of a thread id applies to that thread only
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+def _run() -> None:
+    global _recent
+    _lower_priority()
+    while True:
+        with _cond:
+            while not _queue and not _recent:
+                _cond.wait()
+            count, _recent = _recent, 0
+        if count:
+            try:
+                for file_name, username in _recent_files(count):
+                    with _cond:
+                        _queue.setdefault(file_name, username)
+            except Exception as e:
+                logger.warning("warm-up: recent files not listed: %s", e)
+            continue
+        with _cond:
+            file_name, username = _queue.popitem(last=False)
+        try:
+            _warm(file_name, username)
+            with _cond:
+                _counters["files"] += 1
+        except Exception as e:
+            logger.warning("warm-up: %s not warmed: %s", file_name, e)
+            with _cond:
+                _counters["errors"] += 1
+
+
+def _wait_idle() -> None:
+    start = time.monotonic()
+    with _cond:
+        while True:
+            if _busy:
+                _cond.wait()
+                continue
+            quiet = _last_request + Config.warmup_idle_seconds - time.monotonic()
+            if quiet <= 0:
+                break
+            _cond.wait(quiet)
+        _seconds["yielded"] += time.monotonic() - start
+
+
+def _step(func, *args, **kwargs):
+    """Run one unit of warm-up work within the idle and CPU limits."""
+    _wait_idle()
+    start = time.monotonic()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        elapsed = time.monotonic() - start
+        pause = elapsed * (100 / _cpu_percent() - 1)
+        with _cond:
+            _seconds["working"] += elapsed
+            _seconds["throttled"] += pause
+        time.sleep(pause)
+
+
+def _warm(file_name: str, username: str) -> None:
+    if not sar_store.stored_file(file_name).exists():
+        # ASCII uploads of the UI are parsed when they are first opened
+        return
+    df = _step(parse_polars.get_data_frame, file_name, username)
+    headers = df["header"].drop_nulls().unique(maintain_order=True).to_list()
+    if not headers:
+        return
+    aliases = helpers_pl.translate_headers(headers)
+    default = [
+        h for h in headers if aliases.get(h) in dia_compute.DEFAULT_OVERVIEW_ALIASES
+    ]
+    # the time range dia_overview_pl preselects: first to last sample
+    start, end = (
+        df.filter(pl.col("header") == headers[0])
+        .select(
+            pl.col("date").min().alias("start"), pl.col("date").max().alias("end")
+        )
+        .row(0)
+    )
+    for header in default:
+        params = derived_cache.overview_params(header, start, end, aliases[header])
+        if derived_cache.get(file_name, params) is None:
+            frames = _step(
+                _overview_frames, df, file_name, header, start, end, aliases[header]
+            )
+            derived_cache.put(file_name, params, frames)
+        for warmer in _warmers:
+            _step(warmer, file_name, username, df, header)
+        with _cond:
+            _counters["headers"] += 1
+
+
+def _overview_frames(df, file_name, header, start, end, alias) -> list[dict]:
+    """The frames dia_overview_pl computes for one header."""
+    df_h = pl_helpers.get_data_frames_from__headers([header], df, "header")[0]
+    try:
+        metrics_df = header_store.load_metrics_df(file_name, header)
+    except Exception:
+        metrics_df = None
+    return dia_compute.prepare_df_for_pandas(
+        df_h,
+        start,
+        end,
+        alias=alias,
+        sub_device_key=pl_helpers.get_sub_device_from_header(header),
+        metrics_df=metrics_df,
+    )
+
+
+def _last_used(file_name: Path) -> float:
+    """mtime of the parsed file or of its latest derived_cache entry (reads
+    touch them), whichever is later."""
+    times = [sar_store.stored_file(file_name).stat().st_mtime]
+    for entry in derived_cache.derived_dir(file_name).glob("*/*"):
+        with contextlib.suppress(OSError):
+            times.append(entry.stat().st_mtime)
+    return max(times)
+
+
+def _recent_files(count: int) -> list[tuple[str, str]]:
+    base = Path(Config.upload_dir)
+    recent = []
+    for directory in base.iterdir() if base.is_dir() else []:
+        if not directory.is_dir() or directory.name in file_catalog.EXCLUDED_DIRS:
+            continue
+        for entry in file_catalog.files(directory.name):
+            if not entry["parsed"]:
+                continue
+            file_name = directory / entry["name"]
+            with contextlib.suppress(OSError):
+                recent.append((_last_used(file_name), str(file_name), directory.name))
+    recent.sort(reverse=True)
+    return [(file_name, username) for _, file_name, username in recent[:count]]
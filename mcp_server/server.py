@@ -264,7 +264,8 @@ def cleanup_old_files(
 
 @mcp.tool()
 def list_sar_files(ctx: Context) -> dict:
-    """List the SAR files (parquet) available for analysis."""
+    """List the SAR files available for analysis: size, host, sar date,
+    first/last sample, restarts and number of headers of each."""
     return _request("GET", "/files", session_key=_session_key(ctx))
 
 
@@ -274,10 +275,14 @@ def upload_sar_file(
     file_path: str | None = None,
     content_base64: str | None = None,
     filename: str | None = None,
+    background: bool = False,
 ) -> dict:
     """Upload a SAR file (ASCII or binary 'saXXXXXXXX') and convert it to
     parquet.
 
+    background=True returns an ingest job id right away instead of waiting
+    for the parse; poll it with get_ingest_job. Use it for large files.
+
     Prefer file_path: it is read where THIS MCP server runs and streamed to
     the API without base64. When the server runs locally (stdio), a normal
     local path just works. Only use content_base64 (+ filename) as a
@@ -297,10 +302,22 @@ def upload_sar_file(
     else:
         raise RuntimeError("Provide file_path or (content_base64 and filename)")
     return _request(
-        "POST", "/files", session_key=_session_key(ctx), files={"files": (name, content)}
+        "POST",
+        "/files",
+        session_key=_session_key(ctx),
+        params={"background": "true"} if background else None,
+        files={"files": (name, content)},
     )
 
 
+@mcp.tool()
+def get_ingest_job(job_id: int, ctx: Context) -> dict:
+    """State of a background upload (upload_sar_file with background=True):
+    queued/running/done/failed, bytes parsed, sections found, and the upload
+    summary or error once finished."""
+    return _request("GET", f"/jobs/{job_id}", session_key=_session_key(ctx))
+
+
 @mcp.tool()
 def delete_sar_file(name: str, ctx: Context) -> dict:
     """Delete an uploaded SAR file (parquet) from the server."""
@@ -362,8 +379,10 @@ def get_data(
     end: str | None = None,
     max_rows: int = 200,
 ) -> dict:
-    """Raw time-series data for a header/metric as records. Large results are
-    truncated to max_rows (increase deliberately if needed)."""
+    """Raw time-series data for a header/metric as records. Longer series
+    come downsampled to about max_rows rows over the whole range: bucket
+    means plus <metric>_min/<metric>_max, "level" rows per bucket. Whatever
+    still exceeds max_rows is truncated (increase deliberately if needed)."""
     params = {
         k: v
         for k, v in {
@@ -372,6 +391,7 @@ def get_data(
             "device": device,
             "start": start,
             "end": end,
+            "max_points": max_rows,
         }.items()
         if v is not None
     }
@@ -384,6 +404,39 @@ def get_data(
     return data
 
 
+@mcp.tool()
+def get_fleet_data(
+    header: str,
+    ctx: Context,
+    metric: str | None = None,
+    device: str | None = None,
+    hosts: list[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    max_rows: int = 200,
+) -> dict:
+    """One header across all uploaded days and hosts in one query (needs
+    FLEET_DATASET on the server). start/end are ISO dates or timestamps;
+    rows beyond max_rows are truncated, so narrow hosts/metric/time first."""
+    params = {
+        k: v
+        for k, v in {
+            "header": header,
+            "metric": metric,
+            "device": device,
+            "host": hosts,
+            "start": start,
+            "end": end,
+        }.items()
+        if v is not None
+    }
+    data = _request("GET", "/fleet/data", session_key=_session_key(ctx), params=params)
+    if data["rows"] > max_rows:
+        data["data"] = data["data"][:max_rows]
+        data["truncated_to"] = max_rows
+    return data
+
+
 @mcp.tool()
 def generate_chart(
     file: str,